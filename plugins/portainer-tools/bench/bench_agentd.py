@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Benchmark: end-to-end skill latency, direct vs through portainer-agentd.
+
+Runs a skill command repeatedly as a fresh process, first with
+PORTAINER_AGENTD=0 (direct) and then with a daemon started for the run, and
+reports the median and p90 wall time of each. Needs a reachable Portainer
+(PORTAINER_URL / PORTAINER_TOKEN); the command's output is discarded.
+
+Usage: python3 bench/bench_agentd.py [--runs 20] [-- status args...]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SKILLS = Path(__file__).resolve().parent.parent / "skills"
+sys.path.insert(0, str(SKILLS))
+from portainer_common import agentd
+
+AGENTD = SKILLS / "portainer-agentd" / "portainer_agentd.py"
+
+
+def timed_runs(cmd, runs, env):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def report(label, times):
+    p90 = statistics.quantiles(times, n=10)[-1] if len(times) > 1 else times[0]
+    print(f"{label:<8}  {statistics.median(times) * 1000:>9.1f}  {p90 * 1000:>9.1f}")
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark skill latency with and without portainer-agentd")
+    parser.add_argument("--runs", type=int, default=20, help="Invocations per mode (default: 20)")
+    parser.add_argument("--skill", default="status", help="Skill to run (default: status)")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Arguments passed to the skill after --")
+    args = parser.parse_args()
+
+    skill_args = args.args[1:] if args.args[:1] == ["--"] else args.args
+    cmd = [sys.executable, str(SKILLS / f"portainer-{args.skill}" / f"portainer_{args.skill}.py"), *skill_args]
+    if agentd.ping():
+        print("Error: stop the running portainer-agentd before benchmarking.", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"{'MODE':<8}  {'MEDIAN ms':>9}  {'P90 ms':>9}")
+    direct = report("direct", timed_runs(cmd, args.runs, {**os.environ, "PORTAINER_AGENTD": "0"}))
+    subprocess.run([sys.executable, str(AGENTD), "start"], stdout=subprocess.DEVNULL, check=True)
+    try:
+        # One untimed run loads the skill and warms the daemon's session and cache.
+        timed_runs(cmd, 1, os.environ)
+        daemon = report("agentd", timed_runs(cmd, args.runs, os.environ))
+    finally:
+        subprocess.run([sys.executable, str(AGENTD), "stop"], stdout=subprocess.DEVNULL, check=False)
+    print(f"\nSpeedup: {direct / daemon:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
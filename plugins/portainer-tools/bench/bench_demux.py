@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: Docker log demultiplexing, old vs memoryview implementation.
+
+Builds synthetic multiplexed log bodies (stdout/stderr frames of realistic
+line lengths) and times the original slice-per-frame strip_docker_headers
+against portainer_common.logstream.
+
+Usage: python3 bench/bench_demux.py [--sizes 1,50,500] [--repeat 3]
+"""
+
+import argparse
+import gc
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "skills"))
+from portainer_common.logstream import demux_docker_logs, strip_docker_headers
+
+MB = 1024 * 1024
+
+
+def legacy_strip_docker_headers(raw):
+    """The pre-memoryview implementation, kept verbatim for comparison."""
+    output = []
+    i = 0
+    while i + 8 <= len(raw):
+        size = int.from_bytes(raw[i + 4 : i + 8], "big")
+        if i + 8 + size > len(raw):
+            output.append(raw[i + 8 :].decode("utf-8", errors="replace"))
+            break
+        output.append(raw[i + 8 : i + 8 + size].decode("utf-8", errors="replace"))
+        i += 8 + size
+    return "".join(output)
+
+
+def synthetic_log(size):
+    """Return roughly ``size`` bytes of multiplexed frames, 1 in 5 on stderr."""
+    frames = []
+    for i in range(500):
+        stream = 2 if i % 5 == 0 else 1
+        line = f"2026-01-01T12:00:{i % 60:02d}.{i:09d}Z level=info msg=\"request handled\" path=/api/v1/items/{i} status=200 dur={i % 97}ms\n"
+        payload = line.encode()
+        frames.append(bytes([stream, 0, 0, 0]) + len(payload).to_bytes(4, "big") + payload)
+    block = b"".join(frames)
+    return block * max(1, size // len(block))
+
+
+def timed(func, raw, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func(raw)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Docker log demultiplexing")
+    parser.add_argument("--sizes", default="1,50,500", help="Comma-separated body sizes in MB (default: 1,50,500)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; best is reported")
+    args = parser.parse_args()
+
+    print(f"{'SIZE':>8}  {'LEGACY':>9}  {'STRIP':>9}  {'DEMUX':>9}  SPEEDUP")
+    for size_mb in (int(s) for s in args.sizes.split(",")):
+        raw = synthetic_log(size_mb * MB)
+        if legacy_strip_docker_headers(raw) != strip_docker_headers(raw):
+            print(f"Error: outputs differ at {size_mb} MB", file=sys.stderr)
+            sys.exit(1)
+        legacy = timed(legacy_strip_docker_headers, raw, args.repeat)
+        strip = timed(strip_docker_headers, raw, args.repeat)
+        split = timed(demux_docker_logs, raw, args.repeat)
+        print(f"{size_mb:>6}MB  {legacy:>8.3f}s  {strip:>8.3f}s  {split:>8.3f}s  {legacy / strip:.1f}x")
+        del raw
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Benchmark: cold start of every skill on paths that never reach the network.
+
+Times ``--help`` for each skill and the missing-token error for
+portainer-status as fresh processes, and fails (exit 1) if any median exceeds
+the budget. Neither path should import requests or, for ``--help``,
+python-dotenv. A bare ``python3 -c pass`` is timed as the floor that no
+skill can beat. No Portainer instance is needed.
+
+Usage: python3 bench/bench_startup.py [--runs 15] [--budget-ms 150]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SKILLS = Path(__file__).resolve().parent.parent / "skills"
+
+
+def median_ms(cmd, runs, env):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check skill cold-start time against a budget")
+    parser.add_argument("--runs", type=int, default=15, help="Invocations per case; the median is reported")
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="Maximum median per case (default: 150)")
+    args = parser.parse_args()
+
+    # Never forward to a running daemon, and make sure no token is picked up from .env files.
+    env = {**os.environ, "PORTAINER_AGENTD": "0", "PORTAINER_TOKEN": ""}
+    cases = [("python3 -c pass", [sys.executable, "-c", "pass"], False)]
+    for script in sorted(SKILLS.glob("portainer-*/portainer_*.py")):
+        cases.append((f"{script.stem} --help", [sys.executable, str(script), "--help"], True))
+    status = SKILLS / "portainer-status" / "portainer_status.py"
+    cases.append(("portainer_status (no token)", [sys.executable, str(status)], True))
+
+    width = max(len(label) for label, _, _ in cases)
+    print(f"{'CASE':<{width}}  {'MEDIAN ms':>9}  BUDGET")
+    over = 0
+    for label, cmd, budgeted in cases:
+        ms = median_ms(cmd, args.runs, env)
+        verdict = ""
+        if budgeted:
+            verdict = "ok" if ms <= args.budget_ms else "OVER"
+            over += ms > args.budget_ms
+        print(f"{label:<{width}}  {ms:>9.1f}  {verdict}")
+
+    print(f"\nSummary: {over} case(s) over the {args.budget_ms:.0f} ms budget")
+    if over:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""Benchmark: every skill against a mock Portainer at several fleet sizes.
+
+For each combination of endpoint and container counts, starts
+bench/mock_portainer.py and runs status, ports, logs (direct, through the
+log archive, and a search), networks and their topology, volumes, control
+and deploy against every endpoint. Each command is run ``--runs`` times as
+a fresh process (no daemon, no cache) and reported with its median wall
+time, the requests and bytes the mock served on the last run, and the peak
+RSS of the skill process. No Portainer instance is needed.
+
+``--json PATH`` saves the results; ``--baseline PATH`` compares against a
+saved run and exits 1 if any median wall time grew by more than
+``--tolerance``.
+
+Usage: python3 bench/bench_suite.py [--endpoints 3,30,300] [--containers 10,500,5000] [--runs 3]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+BENCH = Path(__file__).resolve().parent
+SKILLS = BENCH.parent / "skills"
+sys.path.insert(0, str(SKILLS))
+from portainer_common.output import format_bytes
+
+COMPOSE = "services:\n  bench:\n    image: example/bench:latest\n"
+
+
+def commands(first_container):
+    """(label, script, args) for each skill, all aimed at every endpoint."""
+    return [
+        ("status", "portainer-status/portainer_status.py", ["all", "--no-cache"]),
+        ("ports", "portainer-ports/portainer_ports.py", ["all", "--no-cache"]),
+        ("logs", "portainer-logs/portainer_logs.py", [first_container, "--tail", "1000"]),
+        ("logarchive", "portainer-logs/portainer_logs.py", [first_container, "--archive", "--tail", "1000"]),
+        ("logsearch", "portainer-logs/portainer_logs.py", ["search", "in 9[0-6] ms", "--project", "proj000", "--tail", "1000"]),
+        ("networks", "portainer-networks/portainer_networks.py", ["list", "--no-cache"]),
+        ("topology", "portainer-networks/portainer_networks.py", ["topology", "--no-cache"]),
+        ("volumes", "portainer-volumes/portainer_volumes.py", ["list", "--no-cache"]),
+        ("usage", "portainer-volumes/portainer_volumes.py", ["usage", "--top", "20"]),
+        ("control", "portainer-control/portainer_control.py", ["restart", "--project", "proj000"]),
+        ("deploy", "portainer-deploy/portainer_deploy.py", ["all", "--force", "--pull", "never"]),
+    ]
+
+
+class Mock:
+    """A mock_portainer.py subprocess for one fleet size."""
+
+    def __init__(self, endpoints, containers, extra):
+        cmd = [sys.executable, str(BENCH / "mock_portainer.py"), "--port", "0"]
+        cmd += ["--endpoints", str(endpoints), "--containers", str(containers), *extra]
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+        line = self.proc.stdout.readline()
+        if not line.startswith("Listening on "):
+            self.proc.kill()
+            raise RuntimeError(f"mock server did not start: {line!r}")
+        self.url = line.split()[-1]
+
+    def call(self, path, method="GET"):
+        with urllib.request.urlopen(urllib.request.Request(self.url + path, method=method)) as resp:
+            body = resp.read()
+        return json.loads(body) if body else None
+
+    def endpoints(self):
+        return {e["Name"]: e["Id"] for e in self.call("/api/endpoints")}
+
+    def close(self):
+        self.proc.terminate()
+        self.proc.wait()
+
+
+def run(cmd, env):
+    """Run ``cmd``; return (seconds, peak RSS in KiB, exit status)."""
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return elapsed, usage.ru_maxrss, proc.returncode
+
+
+def bench_fleet(mock, endpoints, runs, workdir):
+    """Run every command against ``mock``; return one result dict per command."""
+    hosts = mock.endpoints()
+    # One stack per host for the batch deploy.
+    for host in hosts:
+        service = workdir / "docker" / host / "bench"
+        service.mkdir(parents=True, exist_ok=True)
+        (service / "bench.yml").write_text(COMPOSE)
+    env = {
+        **os.environ,
+        "PORTAINER_URL": mock.url,
+        "PORTAINER_TOKEN": "bench",
+        "PORTAINER_CACHE_DIR": str(workdir / "cache"),
+        "PORTAINER_AGENTD": "0",
+        "COMPOSE_ROOT": str(workdir),
+    }
+    for name in ("PORTAINER_TRACE", "PORTAINER_ENDPOINTS"):
+        env.pop(name, None)
+    results = []
+    for label, script, args in commands("app0000"):
+        cmd = [sys.executable, str(SKILLS / script), *args]
+        times, rss, failures = [], [], 0
+        for _ in range(runs):
+            mock.call("/__reset", "POST")
+            elapsed, peak, code = run(cmd, env)
+            times.append(elapsed)
+            rss.append(peak)
+            failures += code != 0
+        served = mock.call("/__stats")
+        results.append({
+            "command": label,
+            "wall_s": round(statistics.median(times), 4),
+            "requests": served["requests"],
+            "bytes": served["bytes"],
+            "peak_rss_kib": max(rss),
+            "failures": failures,
+        })
+    return results
+
+
+def print_results(results):
+    headers = ("ENDPOINTS", "CONTAINERS", "COMMAND", "WALL", "REQUESTS", "BYTES", "PEAK RSS", "FAILED")
+    rows = [
+        (str(r["endpoints"]), str(r["containers"]), r["command"], f"{r['wall_s'] * 1000:.0f}ms",
+         str(r["requests"]), format_bytes(r["bytes"]), format_bytes(r["peak_rss_kib"] * 1024), str(r["failures"]))
+        for r in results
+    ]
+    widths = [max(len(h), *(len(row[i]) for row in rows)) for i, h in enumerate(headers)]
+    for row in (headers, *rows):
+        print("  ".join(f"{cell:<{w}}" for cell, w in zip(row, widths)).rstrip())
+
+
+def regressions(results, baseline, tolerance):
+    """Results whose median wall time exceeds the baseline's by more than ``tolerance``."""
+    key = lambda r: (r["endpoints"], r["containers"], r["command"])
+    before = {key(r): r for r in baseline}
+    slower = []
+    for r in results:
+        old = before.get(key(r))
+        if old and r["wall_s"] > old["wall_s"] * (1 + tolerance):
+            slower.append((r, old))
+    return slower
+
+
+def int_list(text):
+    return [int(part) for part in text.split(",") if part]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every skill against a mock Portainer")
+    parser.add_argument("--endpoints", type=int_list, default=[3, 30, 300], help="Endpoint counts (default: 3,30,300)")
+    parser.add_argument("--containers", type=int_list, default=[10, 500, 5000], help="Container counts (default: 10,500,5000)")
+    parser.add_argument("--runs", type=int, default=3, help="Invocations per command; the median is reported (default: 3)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mock latency per request, in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Mock jitter per request, in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock requests answered with a 502")
+    parser.add_argument("--json", metavar="PATH", help="Write the results to PATH")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare against results saved with --json")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against --baseline (default: 0.25)")
+    args = parser.parse_args()
+
+    extra = ["--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate)]
+    results = []
+    for endpoints in args.endpoints:
+        for containers in args.containers:
+            print(f"Running {endpoints} endpoint(s), {containers} container(s)...", file=sys.stderr)
+            mock = Mock(endpoints, containers, extra)
+            try:
+                with tempfile.TemporaryDirectory(prefix="portainer-bench-") as workdir:
+                    for r in bench_fleet(mock, endpoints, args.runs, Path(workdir)):
+                        results.append({"endpoints": endpoints, "containers": containers, **r})
+            finally:
+                mock.close()
+
+    print_results(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nResults written to {args.json}")
+    failed = sum(r["failures"] for r in results)
+    if failed:
+        print(f"\nWarning: {failed} invocation(s) exited with an error")
+    if args.baseline:
+        slower = regressions(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for r, old in slower:
+            print(
+                f"Regression: {r['command']} at {r['endpoints']}x{r['containers']}: "
+                f"{old['wall_s'] * 1000:.0f}ms -> {r['wall_s'] * 1000:.0f}ms"
+            )
+        print(f"\nSummary: {len(slower)} regression(s) over {args.tolerance:.0%} against {args.baseline}")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""Mock Portainer server with synthetic endpoints, for offline benchmarks.
+
+Serves the subset of the Portainer and Docker APIs the skills use: the
+endpoint, tag, group and stack lists, stack files and updates, and per
+endpoint the container, network and volume listings (with Docker's name and
+label filters), inspects, create/remove, start/stop/restart, one-shot
+stats, ``/system/df`` (honouring ``type``), events (always empty) and
+multiplexed log streams. Any token is accepted.
+
+Every request can be delayed (``--latency`` plus up to ``--jitter`` ms) and
+failed with a 502 at ``--error-rate``, as Portainer's Docker proxy does for
+a flaky host. The first ``--down`` endpoints are reported as down and answer
+every Docker call with a 502. Containers, networks and volumes are spread
+evenly over the endpoints. Everything is generated from ``--seed``, so two
+servers with the same options serve the same data.
+
+``GET /__stats`` returns the request count and bytes sent so far, and
+``POST /__reset`` zeroes them; benchmarks read these around each command.
+
+Usage: python3 bench/mock_portainer.py [--port 9555] [--endpoints 3] [--containers 30]
+"""
+
+import argparse
+import json
+import random
+import re
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIRST_ENDPOINT_ID = 1
+STDOUT, STDERR = 1, 2
+# 2024-01-01T00:00:00Z, when every container's first log line is written.
+LOG_EPOCH = 1704067200
+
+
+def build_fleet(args):
+    """Generate {endpoint_id: {"name", "containers", "networks", "volumes"}} and the stack list."""
+    rng = random.Random(args.seed)
+    fleet = {}
+    for i in range(args.endpoints):
+        eid = FIRST_ENDPOINT_ID + i
+        fleet[eid] = {"name": f"host{i + 1:03d}", "up": i >= args.down, "containers": [], "networks": [], "volumes": []}
+    eids = list(fleet)
+    # Each project gets a <project>_default network per host, numbered from 172.18.0.0/16 on every host as
+    # Docker's default address pool does, so networks on different hosts overlap.
+    subnets = {eid: {} for eid in eids}
+    for i in range(args.containers):
+        ep = fleet[eids[i % len(eids)]]
+        project = f"proj{i // 5:03d}"
+        name = f"app{i:04d}"
+        running = rng.random() < 0.85
+        pool = subnets[eids[i % len(eids)]]
+        block = pool.setdefault(project, 18 + len(pool))
+        member = sum(1 for c in ep["containers"] if c["Labels"]["com.docker.compose.project"] == project)
+        project_net = {
+            "NetworkID": f"{project}{eids[i % len(eids)]:04d}".ljust(64, "0"),
+            "IPAddress": f"172.{block % 256}.{block // 256}.{member + 2}" if running else "",
+            "IPPrefixLen": 16 if running else 0,
+            "Gateway": f"172.{block % 256}.{block // 256}.1" if running else "",
+        }
+        ports = []
+        if rng.random() < 0.4:
+            port = 10000 + i
+            ports = [{"IP": "0.0.0.0", "PublicPort": port, "PrivatePort": 8080, "Type": "tcp"}]
+        ep["containers"].append({
+            "Id": f"{i:08x}" * 8,
+            "Names": [f"/{name}"],
+            "Image": f"example/{project}:latest",
+            "State": "running" if running else "exited",
+            "Status": "Up 3 hours (healthy)" if running else "Exited (1) 2 hours ago",
+            "Created": 1700000000 + i,
+            "Ports": ports,
+            "Labels": {"com.docker.compose.project": project, "com.docker.compose.service": name},
+            "HostConfig": {"NetworkMode": "bridge"},
+            "NetworkSettings": {"Networks": {
+                "bridge": {"NetworkID": "bridge".ljust(64, "0"), "IPAddress": f"172.17.{i // 250 % 256}.{i % 250 + 2}",
+                           "IPPrefixLen": 16, "Gateway": "172.17.0.1"},
+                f"{project}_default": project_net,
+            }},
+            "Mounts": [{"Type": "volume", "Name": f"{name}-data", "Destination": "/data"}],
+        })
+    for eid, ep in fleet.items():
+        ep["networks"] = [{"Name": n, "Id": f"{eid:04x}{n}".ljust(64, "0"), "Driver": d, "Scope": "local"}
+                          for n, d in (("bridge", "bridge"), ("host", "host"), ("none", "null"))]
+        ep["networks"] += [{"Name": f"net{j:03d}", "Id": f"{eid:04x}n{j:03d}".ljust(64, "0"), "Driver": "bridge",
+                            "Scope": "local", "Containers": {}} for j in range(args.networks)]
+        ep["networks"] += [{"Name": f"{project}_default", "Id": f"{project}{eid:04d}".ljust(64, "0"), "Driver": "bridge",
+                            "Scope": "local", "Containers": {},
+                            "IPAM": {"Config": [{"Subnet": f"172.{block % 256}.{block // 256}.0/16",
+                                                 "Gateway": f"172.{block % 256}.{block // 256}.1"}]}}
+                           for project, block in subnets[eid].items()]
+        names = [c["Names"][0][1:] for c in ep["containers"]]
+        ep["volumes"] = [{"Name": f"{n}-data", "Driver": "local", "Mountpoint": f"/var/lib/docker/volumes/{n}-data/_data",
+                          "Scope": "local", "Labels": {}, "Options": {}, "CreatedAt": "2024-01-01T00:00:00Z"}
+                         for n in names[: args.volumes]]
+    stacks = [{"Id": i + 1, "Name": f"proj{i:03d}", "EndpointId": eids[i % len(eids)]}
+              for i in range((args.containers + 4) // 5)]
+    return fleet, stacks
+
+
+def log_body(lines, timestamps, offset=0, since=None, tail=None):
+    """A multiplexed logs body of ``lines`` alternating stdout/stderr frames.
+
+    Line i is logged at LOG_EPOCH + i seconds, plus ``offset`` nanoseconds to
+    stagger containers so their lines interleave. ``since`` (a Docker
+    "seconds.nanoseconds" value, inclusive) and ``tail`` select lines as
+    Docker does.
+    """
+    offset %= 10**9
+    first = 0
+    if since:
+        whole, _, fraction = since.partition(".")
+        since_ns = int(whole) * 10**9 + int(fraction[:9].ljust(9, "0"))
+        first = max(0, -((offset - since_ns) // 10**9) - LOG_EPOCH)
+    if tail is not None:
+        first = max(first, lines - tail)
+    out = bytearray()
+    for i in range(first, lines):
+        clock = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(LOG_EPOCH + i))
+        stamp = f"{clock}.{offset:09d}Z " if timestamps else ""
+        payload = f"{stamp}request {i} handled in {i % 97} ms\n".encode()
+        out += struct.pack(">BxxxI", STDERR if i % 10 == 9 else STDOUT, len(payload)) + payload
+    return bytes(out)
+
+
+class MockPortainer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, args):
+        super().__init__(address, Handler)
+        self.args = args
+        self.fleet, self.stacks = build_fleet(args)
+        self.stack_files = {s["Id"]: f"services:\n  {s['Name']}:\n    image: example/{s['Name']}:latest\n" for s in self.stacks}
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes = 0
+        self.by_id = {}
+        for eid, ep in self.fleet.items():
+            for c in ep["containers"]:
+                self.by_id[(eid, c["Id"])] = c
+        # Listings are the bulk of the traffic; encode them once.
+        self.encoded = {(eid, kind): json.dumps(ep[kind] if kind != "volumes" else {"Volumes": ep[kind], "Warnings": None}).encode()
+                        for eid, ep in self.fleet.items() for kind in ("containers", "networks", "volumes")}
+
+    def count(self, sent):
+        with self.lock:
+            self.requests += 1
+            self.bytes += sent
+
+    def delay(self):
+        with self.lock:
+            jitter = self.rng.uniform(0, self.args.jitter)
+            fail = self.rng.random() < self.args.error_rate
+        seconds = (self.args.latency + jitter) / 1000
+        if seconds > 0:
+            time.sleep(seconds)
+        return fail
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        if self.server.args.verbose:
+            sys.stderr.write(f"{self.command} {self.path}\n")
+
+    def send(self, code, body=b"", ctype="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+        if not self.path.startswith("/__"):
+            self.server.count(len(body))
+
+    def body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def route(self):
+        u = urlparse(self.path)
+        q = {k: v[0] for k, v in parse_qs(u.query).items()}
+        if u.path == "/__stats":
+            return self.send(200, json.dumps({"requests": self.server.requests, "bytes": self.server.bytes}).encode())
+        if u.path == "/__reset":
+            with self.server.lock:
+                self.server.requests = self.server.bytes = 0
+            return self.send(204)
+        fail = self.server.delay()
+        m = re.match(r"/api/endpoints/(\d+)/docker(/.*)", u.path)
+        if m:
+            ep = self.server.fleet.get(int(m.group(1)))
+            if ep is None:
+                return self.send(404, {"message": "endpoint not found"})
+            if fail or not ep["up"]:
+                return self.send(502, {"message": "unable to reach the Docker host"})
+            return self.docker(int(m.group(1)), ep, m.group(2), q)
+        if fail:
+            return self.send(502, {"message": "bad gateway"})
+        return self.portainer(u.path, q)
+
+    def portainer(self, path, q):
+        if path == "/api/endpoints":
+            return self.send(200, [
+                {"Id": eid, "Name": ep["name"], "Type": 1, "Status": 1 if ep["up"] else 2, "GroupId": 1,
+                 "TagIds": [1 + eid % 3]}
+                for eid, ep in self.server.fleet.items()
+            ])
+        if path == "/api/tags":
+            return self.send(200, [{"ID": i, "Name": name} for i, name in enumerate(("prod", "staging", "lab"), 1)])
+        if path == "/api/endpoint_groups":
+            return self.send(200, [{"Id": 1, "Name": "Unassigned"}])
+        if path == "/api/stacks":
+            return self.send(200, self.server.stacks)
+        m = re.match(r"/api/stacks/(\d+)(/file)?$", path)
+        if m:
+            sid = int(m.group(1))
+            stack = next((s for s in self.server.stacks if s["Id"] == sid), None)
+            if stack is None:
+                return self.send(404, {"message": "stack not found"})
+            if m.group(2):
+                return self.send(200, {"StackFileContent": self.server.stack_files[sid]})
+            if self.command == "PUT":
+                self.server.stack_files[sid] = self.body().get("stackFileContent", "")
+            return self.send(200, stack)
+        if path.startswith("/api/stacks/create") and self.command == "POST":
+            body = self.body()
+            with self.server.lock:
+                stack = {"Id": len(self.server.stacks) + 1, "Name": body.get("name"), "EndpointId": int(q.get("endpointId", 0))}
+                self.server.stacks.append(stack)
+                self.server.stack_files[stack["Id"]] = body.get("stackFileContent", "")
+            return self.send(200, stack)
+        return self.send(404, {"message": "not found"})
+
+    def docker(self, eid, ep, rest, q):
+        kinds = {"/containers/json": "containers", "/networks": "networks", "/volumes": "volumes"}
+        if rest in kinds and self.command == "GET":
+            kind = kinds[rest]
+            if "filters" not in q:
+                return self.send(200, self.server.encoded[(eid, kind)])
+            return self.send(200, self.filtered(ep, kind, json.loads(q["filters"])))
+        if rest == "/events":
+            return self.send(200, b"")
+        if rest == "/system/df":
+            return self.send(200, self.disk_usage(ep, parse_qs(urlparse(self.path).query).get("type")))
+        m = re.match(r"/containers/([0-9a-f]+)/(start|stop|restart|logs|stats|json)$", rest)
+        if m:
+            container = self.server.by_id.get((eid, m.group(1)))
+            if container is None:
+                return self.send(404, {"message": "No such container"})
+            action = m.group(2)
+            if action == "logs":
+                tail = None if q.get("tail", "all") == "all" else int(q["tail"])
+                body = log_body(self.server.args.log_lines, q.get("timestamps") in ("1", "true"), int(m.group(1)[:8], 16),
+                                q.get("since"), tail)
+                return self.send(200, body, "application/vnd.docker.raw-stream")
+            if action == "stats":
+                return self.send(200, self.stats(container))
+            if action == "json":
+                return self.send(200, {**container, "Name": container["Names"][0]})
+            return self.send(204)
+        m = re.match(r"/(networks|volumes)/([^/]+)$", rest)
+        if m:
+            kind, key = m.groups()
+            if key == "create" and self.command == "POST":
+                body = self.body()
+                return self.send(201, {"Id": "f" * 64, "Name": body.get("Name"), "Driver": body.get("Driver", "local")})
+            obj = next((o for o in ep[kind] if key in (o["Name"], o.get("Id"))), None)
+            if obj is None:
+                return self.send(404, {"message": f"no such {kind[:-1]}"})
+            if self.command == "DELETE":
+                return self.send(204)
+            return self.send(200, obj)
+        return self.send(404, {"message": "not found"})
+
+    def filtered(self, ep, kind, filters):
+        items = ep[kind]
+        for needle in filters.get("name", []):
+            if kind == "containers":
+                items = [c for c in items if re.search(needle, c["Names"][0])]
+            else:
+                items = [o for o in items if needle in o["Name"]]
+        for label in filters.get("label", []):
+            key, _, value = label.partition("=")
+            items = [o for o in items if key in (o.get("Labels") or {}) and (not value or o["Labels"][key] == value)]
+        return {"Volumes": items, "Warnings": None} if kind == "volumes" else items
+
+    def disk_usage(self, ep, types):
+        """A /system/df body; like API 1.42+, only the requested ``types`` when given."""
+        used = {m["Name"] for c in ep["containers"] for m in c["Mounts"]}
+        sections = {
+            "container": ("Containers", ep["containers"]),
+            "volume": ("Volumes", [
+                {**v, "UsageData": {"Size": 1048576 * (i + 1), "RefCount": 1 if v["Name"] in used else 0}}
+                for i, v in enumerate(ep["volumes"])
+            ]),
+            "image": ("Images", [
+                {"Id": f"sha256:{i:064x}", "RepoTags": [f"example/proj{i:03d}:latest"], "Size": 50 * 2**20 * (i % 4 + 1),
+                 "SharedSize": 20 * 2**20, "Containers": i % 3}
+                for i in range(max(len(ep["containers"]) // 5, 1))
+            ]),
+            "build-cache": ("BuildCache", [
+                {"ID": f"{i:025x}", "Type": "regular", "Description": f"RUN step {i}", "Size": 2**20 * (i + 1),
+                 "InUse": False, "Shared": i % 2 == 0, "LastUsedAt": "2024-01-01T00:00:00Z"}
+                for i in range(10)
+            ]),
+        }
+        return {key: items for t, (key, items) in sections.items() if not types or t in types}
+
+    def stats(self, container):
+        weight = int(container["Id"][:8], 16) % 7 + 1
+        now = time.time()
+        return {
+            "read": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)),
+            "cpu_stats": {"cpu_usage": {"total_usage": int(now * 1e8 * weight)}, "system_cpu_usage": int(now * 4e9), "online_cpus": 4},
+            "precpu_stats": {"cpu_usage": {"total_usage": int((now - 1) * 1e8 * weight)}, "system_cpu_usage": int((now - 1) * 4e9), "online_cpus": 4},
+            "memory_stats": {"usage": weight * 64 * 2**20, "limit": 8 * 2**30, "stats": {"inactive_file": 2**20}},
+            "networks": {"eth0": {"rx_bytes": weight * 2**20, "tx_bytes": weight * 2**19}},
+            "blkio_stats": {"io_service_bytes_recursive": [{"op": "read", "value": weight * 2**20}, {"op": "write", "value": weight * 2**18}]},
+        }
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = route
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a synthetic Portainer API for benchmarks")
+    parser.add_argument("--port", type=int, default=9555, help="Port to listen on, 0 for any (default: 9555)")
+    parser.add_argument("--endpoints", type=int, default=3, help="Number of Docker endpoints (default: 3)")
+    parser.add_argument("--containers", type=int, default=30, help="Containers across all endpoints (default: 30)")
+    parser.add_argument("--networks", type=int, default=5, help="User networks per endpoint (default: 5)")
+    parser.add_argument("--volumes", type=int, default=20, help="Maximum volumes per endpoint (default: 20)")
+    parser.add_argument("--log-lines", type=int, default=2000, help="Log lines per container (default: 2000)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay added to every request, in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra delay of up to this many ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 502")
+    parser.add_argument("--down", type=int, default=0, help="Number of endpoints reported as down")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for generated data, jitter and errors")
+    parser.add_argument("--verbose", action="store_true", help="Log every request to stderr")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    server = MockPortainer(("127.0.0.1", args.port), args)
+    # Benchmarks wait for this line to learn the port.
+    print(f"Listening on http://127.0.0.1:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""Start, stop, or check the optional portainer-agentd daemon.
+
+While the daemon runs, every portainer_*.py skill forwards its command to it
+and reuses its warm Portainer connections and listing cache.
+
+Requires: requests
+Environment: PORTAINER_TOKEN is required. PORTAINER_URL defaults to http://192.168.10.12:9000.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import signal
+import socketserver
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from portainer_common import DEFAULT_URL, agentd, cache, config, events, registry, trace
+
+SKILLS_DIR = Path(__file__).resolve().parent.parent
+
+
+class _StreamWriter:
+    """File-like object relaying writes to the client as JSON lines."""
+
+    encoding = "utf-8"
+
+    def __init__(self, wfile, fd):
+        self._wfile = wfile
+        self._fd = fd
+
+    def write(self, data):
+        if data and self._wfile:
+            try:
+                self._wfile.write(json.dumps({"fd": self._fd, "data": data}).encode() + b"\n")
+            except OSError:
+                # The client went away (e.g. piped into head); discard the rest.
+                self._wfile = None
+        return len(data)
+
+    def flush(self):
+        if self._wfile:
+            try:
+                self._wfile.flush()
+            except OSError:
+                self._wfile = None
+
+    def isatty(self):
+        return False
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.last_request = time.monotonic()
+        try:
+            request = json.loads(self.rfile.readline())
+            main = self.server.load_skill(request["skill"])
+        except (ValueError, KeyError, ImportError):
+            # Unknown or unreadable request: close without an exit message so the client runs directly.
+            return
+        code = self.server.run(main, request, self.wfile)
+        try:
+            self.wfile.write(json.dumps({"exit": code}).encode() + b"\n")
+        except OSError:
+            pass
+
+
+class _Terminate(BaseException):
+    """Raised by the SIGTERM handler; not caught by run(), unlike SystemExit."""
+
+
+def _terminate(signum, frame):
+    raise _Terminate
+
+
+class AgentServer(socketserver.UnixStreamServer):
+    """Serve skill commands one at a time on a Unix socket."""
+
+    timeout = 1.0
+
+    def __init__(self, path):
+        self.skills = {}
+        self.last_request = time.monotonic()
+        # Create the socket owner-only from the start; a chmod after bind leaves a window open.
+        umask = os.umask(0o177)
+        try:
+            super().__init__(str(path), _Handler)
+        finally:
+            os.umask(umask)
+
+    def load_skill(self, name):
+        if name not in self.skills:
+            path = SKILLS_DIR / name.replace("_", "-") / f"{name}.py"
+            if not name.startswith("portainer_") or not path.is_file():
+                raise ImportError(name)
+            spec = importlib.util.spec_from_file_location(f"_agentd_{name}", path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            self.skills[name] = module.main
+        return self.skills[name]
+
+    def run(self, main, request, wfile):
+        """Run ``main`` with the client's argv, cwd and environment; return its exit code."""
+        saved_env = dict(os.environ)
+        saved = (sys.argv, sys.stdout, sys.stderr, os.getcwd())
+        # The command sees the client's settings only: drop the daemon's own, then top up from .env as the client would.
+        for k in [k for k in os.environ if agentd.forwarded(k) and k not in request["env"]]:
+            del os.environ[k]
+        os.environ.update(request["env"])
+        config.reload()
+        sys.argv = [request["skill"], *request["argv"]]
+        sys.stdout = _StreamWriter(wfile, 1)
+        sys.stderr = _StreamWriter(wfile, 2)
+        code = 0
+        try:
+            os.chdir(request["cwd"])
+            if trace.enabled():
+                trace.start()
+            main()
+        except SystemExit as e:
+            if isinstance(e.code, str):
+                sys.stderr.write(e.code + "\n")
+            code = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except Exception as e:
+            sys.stderr.write(f"Error: {type(e).__name__}: {e}\n")
+            code = 1
+        finally:
+            # Reported here so the summary reaches the client's stderr.
+            trace.report()
+            sys.stdout.flush()
+            sys.argv, sys.stdout, sys.stderr, cwd = saved
+            os.chdir(cwd)
+            for k in [k for k in os.environ if k not in saved_env]:
+                del os.environ[k]
+            for k, v in saved_env.items():
+                if os.environ.get(k) != v:
+                    os.environ[k] = v
+        return code
+
+
+def serve(idle_timeout=None):
+    """Run the daemon in the foreground until it has been idle for ``idle_timeout`` seconds."""
+    if idle_timeout is None:
+        idle_timeout = float(os.environ.get("PORTAINER_AGENTD_IDLE", agentd.DEFAULT_IDLE_TIMEOUT))
+    cache.enable_memory()
+    # Skills import requests lazily; pay for it once here rather than in the first command.
+    importlib.import_module("requests")
+
+    path = agentd.socket_path()
+    path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+    path.unlink(missing_ok=True)
+    signal.signal(signal.SIGTERM, _terminate)
+    # Bound before the watcher starts any threads, while changing the umask affects nothing else.
+    with AgentServer(path) as server:
+        agentd.pid_path().write_text(str(os.getpid()))
+        try:
+            # Keep container state current from Docker events, so status reads it from memory.
+            # Endpoints that are down when the daemon starts are not watched.
+            token = config.env("PORTAINER_TOKEN")
+            if token and os.environ.get("PORTAINER_AGENTD_EVENTS", "1") != "0":
+                targets, _ = registry.select_all()
+                events.activate(events.Watcher(config.env("PORTAINER_URL", DEFAULT_URL), token, targets).start())
+            while time.monotonic() - server.last_request < idle_timeout:
+                server.handle_request()
+        except (KeyboardInterrupt, _Terminate):
+            pass
+        finally:
+            path.unlink(missing_ok=True)
+            agentd.pid_path().unlink(missing_ok=True)
+
+
+def cmd_start(args):
+    if agentd.ping():
+        print(f"portainer-agentd already running on {agentd.socket_path()}.")
+        return
+    cmd = [sys.executable, str(Path(__file__).resolve()), "serve"]
+    if args.idle is not None:
+        cmd += ["--idle", str(args.idle)]
+    subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        if agentd.ping():
+            print(f"portainer-agentd started on {agentd.socket_path()}.")
+            return
+        time.sleep(0.05)
+    print("Error: portainer-agentd did not start within 5s.", file=sys.stderr)
+    sys.exit(1)
+
+
+def cmd_stop(args):
+    try:
+        pid = int(agentd.pid_path().read_text())
+        os.kill(pid, signal.SIGTERM)
+    except (OSError, ValueError):
+        print("portainer-agentd is not running.")
+        return
+    print(f"portainer-agentd (pid {pid}) stopped.")
+
+
+def cmd_status(args):
+    if agentd.ping():
+        print(f"portainer-agentd running on {agentd.socket_path()}.")
+    else:
+        print("portainer-agentd is not running.")
+
+
+def cmd_serve(args):
+    serve(args.idle)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="portainer-agentd", description="Manage the warm Portainer daemon")
+    parser.add_argument("action", nargs="?", default="status", choices=["start", "stop", "status", "serve"])
+    parser.add_argument("--idle", type=float, help="Exit after this many idle seconds (default: 1800)")
+    args = parser.parse_args()
+
+    handlers = {"start": cmd_start, "stop": cmd_stop, "status": cmd_status, "serve": cmd_serve}
+    handlers[args.action](args)
+
+
+if __name__ == "__main__":
+    main()
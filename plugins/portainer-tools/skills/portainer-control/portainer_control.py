@@ -1,82 +1,289 @@
 #!/usr/bin/env python3
-"""Start, stop, or restart a Docker container via Portainer.
+"""Start, stop, or restart Docker containers via Portainer.
 
 Requires: requests
 Environment: PORTAINER_TOKEN is required. PORTAINER_URL defaults to http://192.168.10.12:9000.
 """
 
 import argparse
+import fnmatch
+import json
+import re
 import sys
+import time
 from pathlib import Path
 
-import requests
-
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from portainer_common import ENDPOINTS, get_session
+from portainer_common import (
+    add_common_args,
+    apply_common_args,
+    cache,
+    endpoints,
+    fan_out,
+    forget_endpoint,
+    get_json,
+    get_session,
+    host_choices,
+    positive_int,
+    resolve_container,
+    select_containers,
+    select_targets,
+)
+from portainer_common.agentd import run_skill
+from portainer_common.index import PROJECT_LABEL
+from portainer_common.output import Output
 
+# Stopping waits for the container's grace period before Docker kills it.
+ACTION_TIMEOUT = 60.0
 
-def find_container(session, url, name, endpoint_ids):
-    matches = []
-    host_by_id = {v: k for k, v in ENDPOINTS.items()}
-    for eid in endpoint_ids:
-        resp = session.get(f"{url}/api/endpoints/{eid}/docker/containers/json?all=1")
-        if resp.status_code != 200:
-            continue
-        for c in resp.json():
-            cname = c["Names"][0].lstrip("/")
-            if name == cname or name in cname:
-                matches.append((eid, cname, host_by_id.get(eid, f"endpoint-{eid}")))
-    return matches
 
+def find_container(session, url, name, endpoint_ids):
+    host_by_id = {v: k for k, v in endpoints().items()}
+    targets = {host_by_id.get(eid, f"endpoint-{eid}"): eid for eid in endpoint_ids}
+    return [(eid, cid, cname, host) for host, eid, cid, cname in resolve_container(session, url, name, targets)]
 
-def main():
-    parser = argparse.ArgumentParser(prog="portainer-control", description="Start/stop/restart a container")
-    parser.add_argument("action", choices=["start", "stop", "restart"])
-    parser.add_argument("container")
-    parser.add_argument("--host", choices=["docker01", "docker02", "soho-nas"])
-    args = parser.parse_args()
 
-    url, session = get_session()
+def post_action(session, url, eid, cid, action):
+    return session.post(
+        f"{url}/api/endpoints/{eid}/docker/containers/{cid}/{action}",
+        headers={"Content-Type": "application/json"},
+        timeout=ACTION_TIMEOUT,
+    )
 
-    if args.host:
-        endpoint_ids = [ENDPOINTS[args.host]]
-    else:
-        endpoint_ids = list(ENDPOINTS.values())
 
-    try:
-        matches = find_container(session, url, args.container, endpoint_ids)
+def control_one(args, session, url, endpoint_ids, out):
+    name = args.containers[0]
+    # The container index may predate a recreate; on a 404 rebuild it once and retry.
+    for attempt in range(2):
+        matches = find_container(session, url, name, endpoint_ids)
 
         if not matches:
-            print(f"Error: Container '{args.container}' not found.", file=sys.stderr)
+            print(f"Error: Container '{name}' not found.", file=sys.stderr)
             print("Run: /portainer-status to check container names", file=sys.stderr)
             sys.exit(1)
 
         if len(matches) > 1:
-            print(f"Error: Multiple containers match '{args.container}':", file=sys.stderr)
-            for eid, cname, host in matches:
+            print(f"Error: Multiple containers match '{name}':", file=sys.stderr)
+            for _, _, cname, host in matches:
                 print(f"  {cname} on {host}", file=sys.stderr)
             print("Use --host to disambiguate.", file=sys.stderr)
             sys.exit(1)
 
-        eid, cname, host = matches[0]
-        resp = session.post(
-            f"{url}/api/endpoints/{eid}/docker/containers/{cname}/{args.action}",
-            headers={"Content-Type": "application/json"},
-        )
+        eid, cid, cname, host = matches[0]
+        resp = post_action(session, url, eid, cid, args.action)
+        cache.invalidate(url, eid, ["containers"])
+        if resp.status_code != 404 or attempt:
+            break
+        forget_endpoint(url, eid)
 
-        if resp.status_code == 204:
-            print(f"{cname} {args.action} completed successfully on {host}.")
-        elif resp.status_code == 304:
-            print(f"{cname} is already in the requested state on {host}.")
+    if resp.status_code not in (204, 304):
+        print(f"Error: HTTP {resp.status_code}", file=sys.stderr)
+        if resp.text:
+            print(resp.text, file=sys.stderr)
+        sys.exit(1)
+
+    result = "ok" if resp.status_code == 204 else "unchanged"
+    out.emit({"container": cname, "host": host, "action": args.action, "result": result})
+    if not out.table:
+        return
+    if result == "ok":
+        print(f"{cname} {args.action} completed successfully on {host}.")
+    else:
+        print(f"{cname} is already in the requested state on {host}.")
+
+
+def is_pattern(name):
+    return any(ch in name for ch in "*?[")
+
+
+def select_batch(args, session, url, targets):
+    """Resolve names, globs, --regex and --label/--project to containers.
+
+    Name selectors are combined as a union; labels then narrow that set, or
+    select on their own when no name selector is given. Returns
+    (selected, errors) where errors are (selector, message) pairs.
+    """
+    errors = []
+    selected = {}
+
+    def add(rows):
+        for host, eid, cid, cname in rows:
+            selected.setdefault((eid, cid), (host, eid, cid, cname))
+
+    for name in args.containers:
+        if is_pattern(name):
+            rows = select_containers(session, url, targets, lambda e, pat=name: fnmatch.fnmatchcase(e["name"], pat))
         else:
-            print(f"Error: HTTP {resp.status_code}", file=sys.stderr)
-            if resp.text:
-                print(resp.text, file=sys.stderr)
+            rows = resolve_container(session, url, name, targets)
+            if len(rows) > 1:
+                errors.append((name, "ambiguous: " + ", ".join(f"{r[3]} on {r[0]}" for r in rows)))
+                continue
+        if not rows:
+            errors.append((name, "not found"))
+        add(rows)
+    if args.regex:
+        try:
+            rx = re.compile(args.regex)
+        except re.error as e:
+            print(f"Error: invalid --regex: {e}", file=sys.stderr)
             sys.exit(1)
+        rows = select_containers(session, url, targets, lambda e: rx.search(e["name"]))
+        if not rows:
+            errors.append((f"/{args.regex}/", "not found"))
+        add(rows)
+
+    labels = list(args.label or [])
+    if args.project:
+        labels.append(f"{PROJECT_LABEL}={args.project}")
+    if labels:
+        params = {"all": 1, "filters": json.dumps({"label": labels})}
+
+        def fetch(host, eid):
+            return get_json(session, url, f"/api/endpoints/{eid}/docker/containers/json", params=params)
+
+        labelled = {}
+        for host, eid, containers, error in fan_out(fetch, targets):
+            if error:
+                errors.append((host, error))
+                continue
+            for c in sorted(containers, key=lambda c: c["Names"][0]):
+                labelled[(eid, c["Id"])] = (host, eid, c["Id"], c["Names"][0].lstrip("/"))
+        if args.containers or args.regex:
+            selected = {k: v for k, v in selected.items() if k in labelled}
+        else:
+            selected = labelled
+        if not selected:
+            errors.append((", ".join(labels), "no matching containers"))
+
+    return list(selected.values()), errors
+
+
+def control_batch(args, session, url, targets, out):
+    selected, errors = select_batch(args, session, url, targets)
+    if not selected:
+        for selector, message in errors:
+            print(f"Error: {selector}: {message}", file=sys.stderr)
+        sys.exit(1)
+
+    def act(key, container):
+        _, eid, cid, _ = container
+        start = time.monotonic()
+        resp = post_action(session, url, eid, cid, args.action)
+        elapsed = time.monotonic() - start
+        if resp.status_code == 204:
+            return "ok", elapsed
+        if resp.status_code == 304:
+            return "unchanged", elapsed
+        return f"error: HTTP {resp.status_code}", elapsed
+
+    results = {}
+
+    def record(container, result, elapsed):
+        results[container] = (result, elapsed)
+        latency = round(elapsed * 1000) if elapsed is not None else None
+        out.emit({"container": container[3], "host": container[0], "action": args.action, "result": result, "latency_ms": latency})
+
+    def retry_stale(stale, ordered):
+        # The container index may predate a recreate: rebuild it once per endpoint and retry by name.
+        for eid in {c[1] for c in stale}:
+            forget_endpoint(url, eid)
+        batch = {}
+        for c in stale:
+            matches = find_container(session, url, c[3], [c[1]])
+            if len(matches) == 1:
+                eid, cid, cname, _ = matches[0]
+                batch[f"{c[3]}@{c[0]}"] = (c, (c[0], eid, cid, cname))
+            else:
+                record(c, "error: not found", None)
+        retry = fan_out(lambda key, pair: act(key, pair[1]), batch, ACTION_TIMEOUT, args.parallel, ordered)
+        for _, (container, _), result, error in retry:
+            record(container, *((f"error: {error}", None) if error else result))
+
+    wave_size = args.rolling or len(selected)
+    halted = False
+    for first in range(0, len(selected), wave_size):
+        wave = selected[first : first + wave_size]
+        if halted:
+            for c in wave:
+                record(c, "skipped", None)
+            continue
+        batch = {f"{c[3]}@{c[0]}": c for c in wave}
+        ordered = not out.streaming
+        stale = []
+        for _, container, result, error in fan_out(act, batch, ACTION_TIMEOUT, args.parallel, ordered):
+            if not error and result[0] == "error: HTTP 404":
+                stale.append(container)
+                continue
+            record(container, *((f"error: {error}", None) if error else result))
+        if stale:
+            retry_stale(stale, ordered)
+        # A rolling operation stops at the first wave that did not go cleanly.
+        halted = bool(args.rolling) and any(results[c][0].startswith("error") for c in wave)
+
+    for eid in {c[1] for c in selected}:
+        cache.invalidate(url, eid, ["containers"])
+
+    rows = [(c[3], c[0], *results[c]) for c in selected]
+    ok = sum(1 for r in rows if r[2] in ("ok", "unchanged"))
+    if not out.table:
+        for selector, message in errors:
+            print(f"Warning: {selector}: {message}", file=sys.stderr)
+        if ok != len(rows) or errors:
+            sys.exit(1)
+        return
+
+    max_name = max(len("CONTAINER"), *(len(r[0]) for r in rows))
+    max_host = max(len("HOST"), *(len(r[1]) for r in rows))
+    max_result = max(len("RESULT"), *(len(r[2]) for r in rows))
+    print(f"{'CONTAINER':<{max_name}}  {'HOST':<{max_host}}  {'RESULT':<{max_result}}  LATENCY")
+    for cname, host, result, elapsed in rows:
+        latency = f"{elapsed * 1000:.0f} ms" if elapsed is not None else "—"
+        print(f"{cname:<{max_name}}  {host:<{max_host}}  {result:<{max_result}}  {latency}")
+    print()
+    for selector, message in errors:
+        print(f"Warning: {selector}: {message}")
+
+    print(f"Summary: {args.action} succeeded for {ok}/{len(rows)} container(s)")
+    if ok != len(rows) or errors:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="portainer-control", description="Start/stop/restart containers")
+    parser.add_argument("action", choices=["start", "stop", "restart"])
+    parser.add_argument("containers", nargs="*", metavar="container", help="Container names or glob patterns")
+    parser.add_argument("--host", choices=host_choices(include_all=False), metavar="HOST")
+    parser.add_argument("--regex", help="Act on every container whose name matches this regex")
+    parser.add_argument("--label", action="append", help="Only containers with this label, key or key=value (repeatable)")
+    parser.add_argument("--project", help="Only containers of this compose project")
+    parser.add_argument(
+        "--parallel", type=positive_int, help="Maximum concurrent actions (default: PORTAINER_CONCURRENCY or 8)"
+    )
+    parser.add_argument("--rolling", type=positive_int, metavar="N", help="Act in waves of N containers, stopping on failure")
+    add_common_args(parser)
+    args = parser.parse_args()
+    apply_common_args(args)
+
+    batch = len(args.containers) > 1 or any(map(is_pattern, args.containers))
+    batch = batch or bool(args.regex or args.label or args.project)
+    if not args.containers and not batch:
+        parser.error("a container name, pattern, --regex, --label or --project is required")
+
+    url, session = get_session()
+    import requests
+
+    targets = select_targets(args.host)
+
+    try:
+        with Output(args.format) as out:
+            if batch:
+                control_batch(args, session, url, targets, out)
+            else:
+                control_one(args, session, url, list(targets.values()), out)
     except requests.RequestException as e:
         print(f"Connection error: {e}", file=sys.stderr)
         sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
+    run_skill(main)
@@ -1,84 +1,561 @@
 #!/usr/bin/env python3
 """Deploy or update a Docker Compose stack via Portainer.
 
-Requires: requests
+An existing stack is only updated when its compose file differs from the
+deployed one (compared after normalizing line endings and trailing
+whitespace); the difference is printed as a unified diff first. --force
+redeploys regardless, and --pull decides whether images are re-pulled.
+
+Given a host name or "all" instead of host/service, every
+docker/<host>/<service>/<service>.yml under COMPOSE_ROOT is deployed in one
+run: stacks that create a network or volume go before the stacks that use
+it as external, and independent stacks on a host deploy in parallel.
+
+With --wait, deploy then polls the stack's containers (by compose project
+label) until all are running and healthy, and shows the last log lines of
+any that crashed or did not come up in time. In batch mode a stack's
+dependents wait for it to be ready.
+
+Requires: requests (PyYAML for dependency ordering in batch mode)
 Environment: PORTAINER_TOKEN is required. PORTAINER_URL defaults to http://192.168.10.12:9000.
+COMPOSE_ROOT defaults to the current directory.
 """
 
 import argparse
+import difflib
+import hashlib
+import json
+import re
 import sys
+import threading
+import time
 from pathlib import Path
 
-import requests
-
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from portainer_common import ENDPOINTS, get_session
+from portainer_common import (
+    add_common_args,
+    apply_common_args,
+    cache,
+    concurrency,
+    config,
+    describe_error,
+    endpoints,
+    events,
+    forget_endpoint,
+    get_json,
+    get_session,
+    host_timeout,
+    positive_int,
+    select_targets,
+)
+from portainer_common.agentd import run_skill
+from portainer_common.logstream import strip_docker_headers
+from portainer_common.output import Output
+
+PULL_POLICIES = ("auto", "always", "never")
+SUCCEEDED = ("created", "updated", "unchanged")
+PROJECT_LABEL = "com.docker.compose.project"
+DEFAULT_WAIT_TIMEOUT = 180.0
+# Creating or updating a stack can pull images, far beyond the usual read timeout.
+DEPLOY_TIMEOUT = 600.0
+MAX_POLL_INTERVAL = 5.0
+WAIT_LOG_LINES = 20
+IMAGE_LINE = re.compile(r"^\s*image:\s*[\"']?([^\"'\s#]+)", re.MULTILINE)
+
+
+def normalize(content):
+    """Compose text with line endings, trailing whitespace and trailing blank lines normalized."""
+    lines = [line.rstrip() for line in content.replace("\r\n", "\n").split("\n")]
+    return "\n".join(lines).strip("\n") + "\n"
+
+
+def content_hash(content):
+    return hashlib.sha256(normalize(content).encode()).hexdigest()
+
+
+def images(content):
+    return sorted(set(IMAGE_LINE.findall(content)))
+
+
+def should_pull(policy, deployed, local, changed):
+    """Whether an update should re-pull images under ``policy``.
+
+    ``auto`` pulls when an image reference changed, or when an unchanged
+    file is redeployed with --force, which is usually done to pick up a
+    moved tag such as ``latest``.
+    """
+    if policy != "auto":
+        return policy == "always"
+    return not changed or images(deployed) != images(local)
+
+
+def unified_diff(deployed, local, stack_name, compose_path):
+    return "".join(
+        difflib.unified_diff(
+            normalize(deployed).splitlines(keepends=True),
+            normalize(local).splitlines(keepends=True),
+            fromfile=f"{stack_name} (deployed)",
+            tofile=str(compose_path),
+        )
+    )
+
+
+def succeeded(record):
+    return record["result"] in SUCCEEDED and record.get("ready", True)
+
+
+def expected_services(compose_path):
+    """Number of services in the compose file, or 1 if it cannot be parsed."""
+    try:
+        import yaml
+
+        return max(len(yaml.safe_load(compose_path.read_text()).get("services") or ()), 1)
+    except Exception:
+        return 1
+
+
+def readiness(container):
+    """"ready", "waiting" or "failed" for one listing entry.
+
+    A running container is ready once its healthcheck (if any) passes. One
+    that exited cleanly is taken as a finished one-shot job; one that exited
+    with an error and is not being restarted has failed.
+    """
+    state = container["State"]
+    if state == "running":
+        return "ready" if events.listing_health(container.get("Status", "")) in ("", "healthy") else "waiting"
+    if state == "exited":
+        code = re.search(r"Exited \((-?\d+)\)", container.get("Status", ""))
+        return "ready" if code and code.group(1) == "0" else "failed"
+    if state == "dead":
+        return "failed"
+    return "waiting"
+
+
+def wait_ready(session, url, endpoint_id, project, expected, timeout):
+    """Poll the project's containers until all are ready, one fails, or ``timeout`` passes.
+
+    Only the project's containers are listed, using Docker's label filter.
+    Polls start at 0.5s apart and back off to MAX_POLL_INTERVAL. Returns
+    (ready, containers, elapsed).
+    """
+    params = {"all": 1, "filters": json.dumps({"label": [f"{PROJECT_LABEL}={project}"]})}
+    start = time.monotonic()
+    delay = 0.5
+    while True:
+        containers = get_json(session, url, f"/api/endpoints/{endpoint_id}/docker/containers/json", params=params)
+        states = [readiness(c) for c in containers]
+        elapsed = time.monotonic() - start
+        if "failed" in states:
+            return False, containers, elapsed
+        if len(containers) >= expected and all(s == "ready" for s in states):
+            return True, containers, elapsed
+        if elapsed >= timeout:
+            return False, containers, elapsed
+        time.sleep(min(delay, timeout - elapsed))
+        delay = min(delay * 2, MAX_POLL_INTERVAL)
+
+
+def crash_logs(session, url, endpoint_id, containers):
+    """{name: last log lines} for containers that are not ready and have run."""
+    logs = {}
+    for c in containers:
+        if readiness(c) == "ready" or c["State"] == "created":
+            continue
+        resp = session.get(
+            f"{url}/api/endpoints/{endpoint_id}/docker/containers/{c['Id']}/logs",
+            params={"stdout": 1, "stderr": 1, "tail": WAIT_LOG_LINES},
+            timeout=host_timeout(),
+        )
+        if resp.status_code == 200:
+            logs[c["Names"][0].lstrip("/")] = strip_docker_headers(resp.content)
+    return logs
+
+
+def wait_for_stack(session, url, stack_name, endpoint_id, compose_path, timeout):
+    """Wait for a deployed stack; returns the fields added to its record."""
+    ready, containers, elapsed = wait_ready(
+        session, url, endpoint_id, stack_name, expected_services(compose_path), timeout
+    )
+    details = {"ready": ready, "wait_seconds": round(elapsed, 2)}
+    if not ready:
+        details["containers"] = {c["Names"][0].lstrip("/"): f"{c['State']}: {c['Status']}" for c in containers}
+        details["logs"] = crash_logs(session, url, endpoint_id, containers)
+    return details
+
+
+def print_unready(details, indent=""):
+    if not details["containers"]:
+        print(f"{indent}  (no containers found for the stack)")
+    for name, state in sorted(details["containers"].items()):
+        print(f"{indent}  {name}  {state}")
+    for name, text in sorted(details["logs"].items()):
+        print(f"{indent}--- last {WAIT_LOG_LINES} log lines of {name} ---")
+        print("".join(f"{indent}  {line}" for line in text.splitlines(keepends=True)), end="")
+        if text and not text.endswith("\n"):
+            print()
+
+
+def compose_root():
+    return Path(config.env("COMPOSE_ROOT") or Path.cwd())
+
+
+class DeployError(Exception):
+    """A stack could not be deployed; ``detail`` is the response body, if any."""
+
+    def __init__(self, message, detail=""):
+        super().__init__(message)
+        self.detail = detail
+
+
+def find_stack(stacks, name, endpoint_id):
+    """Id of the stack called ``name``, preferring one on ``endpoint_id``."""
+    named = [s for s in stacks if s.get("Name") == name]
+    for stack in named:
+        if stack.get("EndpointId") == endpoint_id:
+            return stack["Id"]
+    return named[0]["Id"] if named else None
+
+
+def deploy_stack(session, url, stack_name, endpoint_id, compose_path, existing_id, force, pull_policy, on_diff=None):
+    """Create or update one stack and return its result record.
+
+    The record has "id", "result" ("created", "updated" or "unchanged"),
+    "diff" and "pulled". ``on_diff`` is called with the diff before an
+    update is sent. Raises DeployError when Portainer refuses.
+    """
+    compose_content = compose_path.read_text()
+    details = {}
+    if existing_id is None:
+        resp = session.post(
+            f"{url}/api/stacks/create/standalone/string",
+            params={"endpointId": endpoint_id},
+            json={"name": stack_name, "stackFileContent": compose_content},
+            timeout=(host_timeout(), DEPLOY_TIMEOUT),
+        )
+    else:
+        resp = session.get(f"{url}/api/stacks/{existing_id}/file")
+        if resp.status_code != 200:
+            raise DeployError(f"Failed to fetch the deployed stack file (HTTP {resp.status_code})")
+        deployed = resp.json().get("StackFileContent", "")
+        changed = content_hash(deployed) != content_hash(compose_content)
+        if not changed and not force:
+            return {"id": existing_id, "result": "unchanged", "diff": "", "pulled": False}
+        diff = unified_diff(deployed, compose_content, stack_name, compose_path)
+        pull = should_pull(pull_policy, deployed, compose_content, changed)
+        details = {"diff": diff, "pulled": pull}
+        if on_diff is not None:
+            on_diff(diff)
+        resp = session.put(
+            f"{url}/api/stacks/{existing_id}",
+            params={"endpointId": endpoint_id},
+            json={"stackFileContent": compose_content, "pullImage": pull, "prune": False},
+            timeout=(host_timeout(), DEPLOY_TIMEOUT),
+        )
+    # A stack deploy can add or replace containers, networks and volumes.
+    cache.invalidate(url, endpoint_id)
+    forget_endpoint(url, endpoint_id)
+
+    if resp.status_code in (200, 201) and resp.json().get("Id"):
+        return {"id": resp.json()["Id"], "result": "updated" if existing_id else "created", **details}
+    raise DeployError(f"HTTP {resp.status_code}", resp.text)
+
+
+def discover(root, hosts):
+    """Return {(host, service): compose_path} for docker/<host>/<service>/<service>.yml under ``root``."""
+    found = {}
+    for host in hosts:
+        for path in sorted((root / "docker" / host).glob("*/*.yml")):
+            if path.stem == path.parent.name:
+                found[(host, path.stem)] = path
+    return found
+
+
+def compose_resources(content, project):
+    """Return the (provides, uses) sets of ("networks"|"volumes", name) for a compose file.
+
+    A stack provides the networks and volumes it creates, under their
+    explicit ``name`` or compose's default ``<project>_<key>``, and uses those
+    it declares ``external``.
+    """
+    import yaml
+
+    doc = yaml.safe_load(content) or {}
+    provides, uses = set(), set()
+    for kind in ("networks", "volumes"):
+        for key, spec in (doc.get(kind) or {}).items():
+            spec = spec or {}
+            external = spec.get("external")
+            if external:
+                # The pre-3.5 form is "external: {name: ...}".
+                legacy = external.get("name") if isinstance(external, dict) else None
+                uses.add((kind, spec.get("name") or legacy or key))
+            else:
+                provides.add((kind, spec.get("name") or f"{project}_{key}"))
+    return provides, uses
+
+
+def dependencies(plans):
+    """Map each (host, stack) in ``plans`` to the stacks on its host it must follow.
+
+    Raises ImportError without PyYAML and ValueError naming a compose file
+    that does not parse.
+    """
+    import yaml
+
+    resources = {}
+    for key, path in plans.items():
+        try:
+            resources[key] = compose_resources(path.read_text(), key[1])
+        except yaml.YAMLError as e:
+            raise ValueError(f"{path}: {e}") from None
+    providers = {}
+    for (host, stack), (provides, _) in resources.items():
+        for resource in provides:
+            providers[(host, resource)] = (host, stack)
+    deps = {}
+    for (host, stack), (_, uses) in resources.items():
+        found = {providers.get((host, resource)) for resource in uses}
+        deps[(host, stack)] = found - {None, (host, stack)}
+    return deps
+
+
+def deploy_batch(args, session, url, out):
+    targets = select_targets(args.target)
+    root = compose_root()
+    plans = discover(root, list(targets))
+    if not plans:
+        print(f"Error: No docker/<host>/<service>/<service>.yml files found under {root}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        deps = dependencies(plans)
+    except ImportError:
+        print("Warning: PyYAML is not installed; deploying without dependency ordering.", file=sys.stderr)
+        deps = {key: set() for key in plans}
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # One stack listing serves every lookup.
+    resp = session.get(f"{url}/api/stacks")
+    if resp.status_code != 200:
+        print(f"Error: Failed to list stacks (HTTP {resp.status_code})", file=sys.stderr)
+        sys.exit(1)
+    stacks = resp.json()
+
+    lock = threading.Lock()
+    results = {}
+
+    def deploy(key):
+        host, stack = key
+        start = time.monotonic()
+        existing_id = find_stack(stacks, stack, targets[host])
+        try:
+            record = deploy_stack(session, url, stack, targets[host], plans[key], existing_id, args.force, args.pull)
+            if args.wait:
+                record.update(wait_for_stack(session, url, stack, targets[host], plans[key], args.timeout))
+        except DeployError as e:
+            record = {"id": existing_id, "result": f"error: {e}", "diff": "", "pulled": False}
+        except Exception as e:
+            record = {"id": existing_id, "result": f"error: {describe_error(e)}", "diff": "", "pulled": False}
+        finish(key, record, time.monotonic() - start)
+
+    def finish(key, record, elapsed):
+        with lock:
+            results[key] = (record, elapsed)
+            host, stack = key
+            out.emit({"stack": stack, "host": host, **record, "seconds": round(elapsed, 2) if elapsed is not None else None})
+            if out.table:
+                took = f" ({elapsed:.1f}s)" if elapsed is not None else ""
+                print(f"{host}/{stack}: {describe_result(record)}{took}", flush=True)
+                if record.get("diff"):
+                    print("".join(f"    {line}" for line in record["diff"].splitlines(keepends=True)), end="", flush=True)
+                if record.get("ready") is False:
+                    print_unready(record, "    ")
+                sys.stdout.flush()
+
+    start = time.monotonic()
+    schedule(plans, deps, args.parallel or concurrency(), deploy, finish, results)
+    elapsed = time.monotonic() - start
+
+    order = sorted(results, key=lambda k: (k[0], k[1]))
+    failed = sum(1 for k in order if not succeeded(results[k][0]))
+    if out.table:
+        max_stack = max(len("STACK"), *(len(k[1]) for k in order))
+        max_host = max(len("HOST"), *(len(k[0]) for k in order))
+        max_result = max(len("RESULT"), *(len(describe_result(results[k][0])) for k in order))
+        print()
+        print(f"{'STACK':<{max_stack}}  {'HOST':<{max_host}}  {'RESULT':<{max_result}}  TIME")
+        for key in order:
+            record, took = results[key]
+            took = f"{took:.1f}s" if took is not None else "—"
+            print(f"{key[1]:<{max_stack}}  {key[0]:<{max_host}}  {describe_result(record):<{max_result}}  {took}")
+        print()
+        counts = {r: sum(1 for k in order if results[k][0]["result"] == r and succeeded(results[k][0])) for r in SUCCEEDED}
+        print(
+            f"Summary: {counts['created']} created, {counts['updated']} updated, {counts['unchanged']} unchanged, "
+            f"{failed} failed or skipped of {len(order)} stack(s) in {elapsed:.1f}s"
+        )
+    if failed:
+        sys.exit(1)
+
+
+def describe_result(record):
+    if record.get("ready") is False:
+        return f"{record['result']}, not ready"
+    if record.get("ready"):
+        return f"{record['result']}, ready in {record['wait_seconds']:.1f}s"
+    return record["result"]
+
+
+def schedule(plans, deps, per_host, deploy, finish, results):
+    """Run ``deploy(key)`` for every plan once its dependencies have succeeded.
+
+    At most ``per_host`` deploys run at once on each host, and at most
+    PORTAINER_CONCURRENCY in total. A stack whose dependency failed (or, with
+    --wait, never became ready), or that is part of a dependency cycle, is
+    finished as skipped without being deployed.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    pending = dict.fromkeys(sorted(plans))
+    running = {}
+    busy = dict.fromkeys({host for host, _ in plans}, 0)
+    workers = min(per_host * len(busy), concurrency())
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            progress = True
+            while progress:
+                progress = False
+                for key in list(pending):
+                    if any(dep not in results for dep in deps[key]):
+                        continue
+                    failed = sorted(dep[1] for dep in deps[key] if not succeeded(results[dep][0]))
+                    if failed:
+                        del pending[key]
+                        finish(key, {"id": None, "result": f"skipped: {', '.join(failed)} failed"}, None)
+                        progress = True
+                    elif busy[key[0]] < per_host and len(running) < workers:
+                        del pending[key]
+                        busy[key[0]] += 1
+                        running[pool.submit(deploy, key)] = key
+            if not running:
+                for key in pending:
+                    finish(key, {"id": None, "result": "skipped: dependency cycle"}, None)
+                return
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                busy[running.pop(future)[0]] -= 1
+                future.result()
 
 
 def main():
     parser = argparse.ArgumentParser(prog="portainer-deploy", description="Deploy/update a Portainer stack")
-    parser.add_argument("target", help="host/service (e.g. docker01/grafana)")
+    parser.add_argument(
+        "target", help="host/service (e.g. docker01/grafana), or a host or 'all' to deploy every stack found"
+    )
     parser.add_argument("--file", help="Path to compose file (default: docker/<host>/<service>/<service>.yml)")
     parser.add_argument("--stack-name", help="Override stack name (default: service name)")
+    parser.add_argument("--force", action="store_true", help="Redeploy even if the compose file is unchanged")
+    parser.add_argument(
+        "--pull",
+        choices=PULL_POLICIES,
+        default="auto",
+        help="Re-pull images on update: always, never, or auto (when an image changed or with --force)",
+    )
+    parser.add_argument("--wait", action="store_true", help="Wait until the stack's containers are running and healthy")
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_WAIT_TIMEOUT,
+        help=f"Seconds to wait with --wait (default: {DEFAULT_WAIT_TIMEOUT:.0f})",
+    )
+    parser.add_argument(
+        "--parallel",
+        type=positive_int,
+        help="Batch mode: maximum concurrent deploys per host (default: PORTAINER_CONCURRENCY or 8); "
+        "PORTAINER_CONCURRENCY also caps the total across hosts",
+    )
+    add_common_args(parser)
     args = parser.parse_args()
+    apply_common_args(args)
 
-    parts = args.target.split("/", 1)
-    if len(parts) != 2:
-        print("Error: Target must be <host>/<service> (e.g. docker01/grafana)", file=sys.stderr)
-        sys.exit(1)
-
-    host, service = parts
-    if host not in ENDPOINTS:
-        print(f"Error: Unknown host '{host}'. Use: {', '.join(ENDPOINTS.keys())}", file=sys.stderr)
-        sys.exit(1)
-
-    if args.file:
-        compose_path = Path(args.file).resolve()
+    batch = "/" not in args.target
+    if batch:
+        if args.target != "all" and args.target not in endpoints():
+            print(f"Error: Unknown host '{args.target}'. Use: all, {', '.join(endpoints())}", file=sys.stderr)
+            sys.exit(1)
+        if args.file or args.stack_name:
+            parser.error("--file and --stack-name need a single <host>/<service> target")
     else:
-        compose_path = Path.cwd() / "docker" / host / service / f"{service}.yml"
-    if not compose_path.exists():
-        print(f"Error: Compose file not found at {compose_path}", file=sys.stderr)
-        sys.exit(1)
+        host, service = args.target.split("/", 1)
+        if host not in endpoints():
+            print(f"Error: Unknown host '{host}'. Use: {', '.join(endpoints())}", file=sys.stderr)
+            sys.exit(1)
 
-    stack_name = args.stack_name or service
-    endpoint_id = ENDPOINTS[host]
-    compose_content = compose_path.read_text()
+        if args.file:
+            compose_path = Path(args.file).resolve()
+        else:
+            compose_path = compose_root() / "docker" / host / service / f"{service}.yml"
+        if not compose_path.exists():
+            print(f"Error: Compose file not found at {compose_path}", file=sys.stderr)
+            sys.exit(1)
+
+        stack_name = args.stack_name or service
+        endpoint_id = endpoints()[host]
 
     url, session = get_session()
+    import requests
 
     try:
+        if batch:
+            with Output(args.format) as out:
+                deploy_batch(args, session, url, out)
+            return
+
         # Check if stack already exists
         resp = session.get(f"{url}/api/stacks")
         if resp.status_code != 200:
             print(f"Error: Failed to list stacks (HTTP {resp.status_code})", file=sys.stderr)
             sys.exit(1)
+        existing_id = find_stack(resp.json(), stack_name, endpoint_id)
 
-        existing_id = None
-        for stack in resp.json():
-            if stack.get("Name") == stack_name:
-                existing_id = stack["Id"]
-                break
-
-        if existing_id is None:
-            resp = session.post(
-                f"{url}/api/stacks/create/standalone/string",
-                params={"endpointId": endpoint_id},
-                json={"name": stack_name, "stackFileContent": compose_content},
-            )
-        else:
-            resp = session.put(
-                f"{url}/api/stacks/{existing_id}",
-                params={"endpointId": endpoint_id},
-                json={"stackFileContent": compose_content, "pullImage": True, "prune": False},
+        out = Output(args.format)
+
+        def show_diff(diff):
+            if out.table:
+                print(diff or "(no changes to the compose file; redeploying because of --force)\n", end="")
+
+        try:
+            record = deploy_stack(
+                session, url, stack_name, endpoint_id, compose_path, existing_id, args.force, args.pull, show_diff
             )
+        except DeployError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            if e.detail:
+                print(e.detail, file=sys.stderr)
+            sys.exit(1)
 
-        if resp.status_code in (200, 201) and resp.json().get("Id"):
-            action = "updated" if existing_id else "created"
-            print(f"Stack '{stack_name}' {action} successfully on {host}.")
-        else:
-            print(f"Error: HTTP {resp.status_code}", file=sys.stderr)
-            if resp.text:
-                print(resp.text, file=sys.stderr)
+        if out.table:
+            if record["result"] == "unchanged":
+                print(f"Stack '{stack_name}' on {host} is unchanged; nothing to deploy (use --force to redeploy).")
+            else:
+                pulled = " (images pulled)" if record.get("pulled") else ""
+                print(f"Stack '{stack_name}' {record['result']} successfully on {host}{pulled}.")
+            if args.wait:
+                print(f"Waiting up to {args.timeout:.0f}s for its containers...", flush=True)
+        if args.wait:
+            record.update(wait_for_stack(session, url, stack_name, endpoint_id, compose_path, args.timeout))
+
+        with out:
+            out.emit({"stack": stack_name, "host": host, **record})
+        if out.table and args.wait:
+            if record["ready"]:
+                print(f"All containers of '{stack_name}' are running and healthy ({record['wait_seconds']:.1f}s).")
+            else:
+                print(f"Error: Stack '{stack_name}' is not ready after {record['wait_seconds']:.0f}s:")
+                print_unready(record)
+        if not record.get("ready", True):
             sys.exit(1)
     except requests.RequestException as e:
         print(f"Connection error: {e}", file=sys.stderr)
@@ -86,4 +563,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    run_skill(main)
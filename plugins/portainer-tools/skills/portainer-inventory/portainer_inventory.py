@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Take a one-pass inventory snapshot of every Portainer-managed Docker host.
+
+Fetches containers, networks, volumes and stacks for all endpoints concurrently
+and stores them as a single snapshot file that status, ports, networks and
+volumes can render from with --snapshot or --snapshot-age.
+
+Requires: requests
+Environment: PORTAINER_TOKEN is required. PORTAINER_URL defaults to http://192.168.10.12:9000.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from portainer_common import (
+    add_common_args,
+    apply_common_args,
+    get_session,
+    host_choices,
+    listing_items,
+    select_targets,
+    snapshot,
+)
+from portainer_common.agentd import run_skill
+from portainer_common.output import Output
+
+
+def summarize(snap, targets):
+    """Yield one (host, counts, errors) row per target found in ``snap``."""
+    stacks = {}
+    for s in snap.get("stacks") or []:
+        stacks[s.get("EndpointId")] = stacks.get(s.get("EndpointId"), 0) + 1
+    for host, eid in targets.items():
+        ep = snap["endpoints"].get(str(eid))
+        if ep is None:
+            continue
+        containers = ep.get("containers")
+        counts = {
+            "containers": len(containers) if containers is not None else None,
+            "running": sum(1 for c in containers if c["State"] == "running") if containers is not None else None,
+            "networks": len(ep["networks"]) if "networks" in ep else None,
+            "volumes": len(listing_items("volumes", ep["volumes"])) if "volumes" in ep else None,
+            "stacks": stacks.get(eid, 0) if snap.get("stacks") is not None else None,
+        }
+        yield host, counts, ep.get("errors") or {}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="portainer-inventory", description="Snapshot containers, networks, volumes and stacks")
+    parser.add_argument("host", nargs="?", default="all", choices=host_choices(), metavar="HOST")
+    parser.add_argument("--output", metavar="PATH", help="Write the snapshot here instead of the snapshot cache")
+    add_common_args(parser)
+    args = parser.parse_args()
+    apply_common_args(args)
+
+    targets = select_targets(args.host)
+    reused = snapshot.active()
+    if reused is not None:
+        snap, path, elapsed = reused, args.snapshot, None
+    else:
+        url, session = get_session()
+        import requests
+
+        start = time.monotonic()
+        try:
+            snap = snapshot.take(session, url, targets)
+        except requests.RequestException as e:
+            print(f"Connection error: {e}", file=sys.stderr)
+            sys.exit(1)
+        elapsed = time.monotonic() - start
+        try:
+            path = snapshot.save(snap, args.output)
+        except OSError as e:
+            print(f"Error: Cannot write snapshot: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    rows = list(summarize(snap, targets))
+    with Output(args.format) as out:
+        for host, counts, errors in rows:
+            out.emit({"host": host, **counts, "errors": errors, "snapshot": str(path) if path else None})
+        if snap.get("stacks_error"):
+            print(f"Warning: stacks: {snap['stacks_error']}", file=sys.stderr)
+        if not out.table:
+            return
+
+        def cell(value):
+            return "—" if value is None else str(value)
+
+        columns = ("CONTAINERS", "RUNNING", "NETWORKS", "VOLUMES", "STACKS")
+        max_host = max(len("HOST"), *(len(r[0]) for r in rows)) if rows else len("HOST")
+        print(f"{'HOST':<{max_host}}  " + "  ".join(columns))
+        for host, counts, _ in rows:
+            cells = "  ".join(f"{cell(v):<{len(h)}}" for v, h in zip(counts.values(), columns))
+            print(f"{host:<{max_host}}  {cells}".rstrip())
+        print()
+        for host, _, errors in rows:
+            for kind, error in errors.items():
+                print(f"Warning: {host}: {kind}: {error}")
+
+        total = {k: sum(c[k] or 0 for _, c, _ in rows) for k in ("containers", "networks", "volumes")}
+        stacks = len(snap.get("stacks") or [])
+        taken = f"taken in {elapsed:.2f}s" if elapsed is not None else f"taken {time.time() - snap['taken_at']:.0f}s ago"
+        print(f"Snapshot: {path or 'newest cached'} ({taken})")
+        print(
+            f"Summary: {total['containers']} containers, {total['networks']} networks, "
+            f"{total['volumes']} volumes, {stacks} stacks across {len(rows)} host(s)"
+        )
+
+
+if __name__ == "__main__":
+    run_skill(main)
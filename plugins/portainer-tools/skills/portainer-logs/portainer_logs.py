@@ -1,80 +1,454 @@
 #!/usr/bin/env python3
 """View container logs from a Portainer-managed Docker host.
 
+``search PATTERN`` greps the logs of every container matching a name or
+compose project, on one host or all of them, and prints the matching lines
+of all containers as one stream ordered by Docker timestamp.
+
+``--archive`` keeps a local copy of each container's logs (see
+portainer_common.logarchive): a run fetches only the lines logged since the
+previous one and answers from the archive; ``--offline`` answers from it
+without contacting Portainer.
+
 Requires: requests
 Environment: PORTAINER_TOKEN is required. PORTAINER_URL defaults to http://192.168.10.12:9000.
 """
 
 import argparse
+import codecs
+import fnmatch
+import heapq
+import queue
+import re
 import sys
+import threading
 from pathlib import Path
 
-import requests
-
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from portainer_common import ENDPOINTS, get_session
+from portainer_common import (
+    DEFAULT_URL,
+    add_common_args,
+    apply_common_args,
+    config,
+    describe_error,
+    endpoints,
+    forget_endpoint,
+    get_session,
+    host_choices,
+    host_timeout,
+    logarchive,
+    resolve_container,
+    select_containers,
+    select_targets,
+)
+from portainer_common.agentd import run_skill
+from portainer_common.logstream import (
+    ALL_STREAMS,
+    STDERR,
+    STDOUT,
+    FrameDecoder,
+    LineSplitter,
+    parse_log_time,
+    split_timestamp,
+)
+from portainer_common.output import Output
+
+CHUNK_SIZE = 64 * 1024
+STREAM_NAMES = {STDOUT: "stdout", STDERR: "stderr"}
+# search: chunks of matching lines buffered per container, and containers searched at once.
+SEARCH_BUFFER_CHUNKS = 8
+MAX_SEARCH_CONTAINERS = 64
 
 
 def find_container(session, url, name, endpoint_ids):
-    matches = []
-    host_by_id = {v: k for k, v in ENDPOINTS.items()}
-    for eid in endpoint_ids:
-        resp = session.get(f"{url}/api/endpoints/{eid}/docker/containers/json?all=1")
-        if resp.status_code != 200:
+    host_by_id = {v: k for k, v in endpoints().items()}
+    targets = {host_by_id.get(eid, f"endpoint-{eid}"): eid for eid in endpoint_ids}
+    return [(eid, cid, cname, host) for host, eid, cid, cname in resolve_container(session, url, name, targets)]
+
+
+def stream_logs(resp, header, streams=ALL_STREAMS):
+    """Write a streamed logs response to stdout as it arrives.
+
+    Memory stays bounded by one HTTP chunk plus one unfinished frame, however
+    much log volume the container produces. Each chunk's kept payloads are
+    joined and decoded once. ``header`` (if any) is printed before the first
+    line; returns False if the response carried no log data.
+    """
+    decoder = FrameDecoder(streams)
+    text = codecs.getincrementaldecoder("utf-8")("replace")
+    out = sys.stdout
+    started = False
+    for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+        if not chunk:
             continue
-        for c in resp.json():
-            cname = c["Names"][0].lstrip("/")
-            if name == cname or name in cname:
-                matches.append((eid, cname, host_by_id.get(eid, f"endpoint-{eid}")))
+        if not started:
+            if header:
+                print(header, flush=True)
+            started = True
+        frames = decoder.feed(chunk)
+        if frames:
+            out.write(text.decode(b"".join(payload for _, payload in frames)))
+            out.flush()
+    frames = decoder.flush()
+    out.write(text.decode(b"".join(payload for _, payload in frames), final=True))
+    out.flush()
+    return started
+
+
+def log_record(host, cname, stream, stamp, message):
+    return {
+        "host": host,
+        "container": cname,
+        "stream": STREAM_NAMES[stream],
+        "time": stamp.decode("ascii", "replace"),
+        "message": message.decode("utf-8", "replace"),
+    }
+
+
+def emit_lines(out, host, cname, lines):
+    for stream, line in lines:
+        # Logs are requested with timestamps, which Docker puts before a single space.
+        out.emit(log_record(host, cname, stream, *split_timestamp(line)))
+
+
+def stream_records(resp, out, host, cname, streams=ALL_STREAMS):
+    """Emit one record per log line of a streamed logs response, as lines complete."""
+    decoder = FrameDecoder(streams)
+    lines = LineSplitter()
+    for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+        if chunk:
+            emit_lines(out, host, cname, lines.feed(decoder.feed(chunk)))
+    emit_lines(out, host, cname, lines.feed(decoder.flush()) + lines.flush())
+
+
+def add_log_args(parser, tail_help):
+    parser.add_argument("--tail", type=int, help=tail_help)
+    parser.add_argument("--since", help="Only logs after this time (UNIX timestamp, ISO 8601, or relative like 10m)")
+    parser.add_argument("--until", help="Only logs before this time (same formats as --since)")
+    channel = parser.add_mutually_exclusive_group()
+    channel.add_argument("--stdout-only", action="store_true", help="Show only the container's stdout")
+    channel.add_argument("--stderr-only", action="store_true", help="Show only the container's stderr")
+
+
+def log_params(args, default_tail):
+    """Return (streams, logs query parameters) for the parsed log arguments."""
+    if args.stdout_only:
+        streams = (STDOUT,)
+    elif args.stderr_only:
+        streams = (STDERR,)
+    else:
+        streams = ALL_STREAMS
+    params = {"stdout": int(STDOUT in streams), "stderr": int(STDERR in streams), "timestamps": 1}
+    try:
+        if args.since:
+            params["since"] = parse_log_time(args.since)
+        if args.until:
+            params["until"] = parse_log_time(args.until)
+    except ValueError as e:
+        print(f"Error: Invalid time: {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.tail is not None:
+        params["tail"] = args.tail
+    elif not args.since:
+        params["tail"] = default_tail
+    else:
+        params["tail"] = "all"
+    return streams, params
+
+
+class LogSearch:
+    """Grep the logs of several containers at once, merged by timestamp.
+
+    Each container's logs are read on a thread of its own, over a session
+    whose pool is sized to match, and decoded chunk by chunk; the lines
+    whose message matches ``regex`` go into that container's queue, at most
+    SEARCH_BUFFER_CHUNKS chunks deep. Docker returns each container's lines
+    in time order, so merging the queues (heapq.merge keeps one head line
+    per container) gives one ordered stream. A full queue stalls its reader
+    and so the HTTP stream behind it: memory is bounded by the buffers, not
+    by how much the containers logged.
+    """
+
+    def __init__(self, session, url, containers, params, regex, streams):
+        from portainer_common import transport
+
+        self.url = url
+        self.containers = containers
+        self.params = params
+        self.regex = regex
+        self.streams = streams
+        self.errors = []
+        self._queues = [queue.Queue(SEARCH_BUFFER_CHUNKS) for _ in containers]
+        self._stop = threading.Event()
+        self._session = transport.new_session(session.headers["X-API-Key"], pool_maxsize=max(len(containers), 1))
+
+    def start(self):
+        for i, (_, _, cid, _) in enumerate(self.containers):
+            threading.Thread(target=self._read, args=(i,), name=f"logs-{cid[:12]}", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._session.close()
+
+    def _put(self, q, item):
+        # Give up once the consumer has stopped, rather than block on a queue nobody drains.
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _matching(self, stream_lines):
+        # Each message is searched on its own, without its timestamp, so ^ and $ anchor to the message.
+        search = self.regex.search
+        found = []
+        for stream, line in stream_lines:
+            stamp, message = split_timestamp(line)
+            if search(message):
+                found.append((stamp, stream, message))
+        return found
+
+    def _read(self, i):
+        host, eid, cid, cname = self.containers[i]
+        q = self._queues[i]
+        try:
+            resp = self._session.get(
+                f"{self.url}/api/endpoints/{eid}/docker/containers/{cid}/logs",
+                params=self.params,
+                stream=True,
+                timeout=host_timeout(),
+            )
+            with resp:
+                resp.raise_for_status()
+                decoder = FrameDecoder(self.streams)
+                lines = LineSplitter()
+                for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                    if self._stop.is_set():
+                        return
+                    found = self._matching(lines.feed(decoder.feed(chunk)))
+                    if found:
+                        self._put(q, found)
+                found = self._matching(lines.feed(decoder.flush()) + lines.flush())
+                if found:
+                    self._put(q, found)
+        except Exception as e:
+            if not self._stop.is_set():
+                self.errors.append((host, cname, describe_error(e)))
+        finally:
+            self._put(q, None)
+
+    def _drain(self, i):
+        q = self._queues[i]
+        while True:
+            found = q.get()
+            if found is None:
+                return
+            for stamp, stream, message in found:
+                yield stamp, i, stream, message
+
+    def __iter__(self):
+        """Yield (stamp, container index, stream, message) for every match, oldest first."""
+        return heapq.merge(*(self._drain(i) for i in range(len(self.containers))))
+
+
+def print_archive(out, archive, params, streams, scope):
+    """Print the lines of ``archive`` selected by the logs query ``params``."""
+    tail = None if params["tail"] == "all" else params["tail"]
+    lines = archive.read(params.get("since"), params.get("until"), streams, tail)
+    if not out.table:
+        with out:
+            for stamp, stream, message in lines:
+                out.emit(log_record(archive.host, archive.name, stream, stamp, message))
+        return
+    header = f"=== Logs: {archive.name} ({archive.host}) — {scope} ==="
+    write = sys.stdout.write
+    for stamp, _, message in lines:
+        if header:
+            print(header)
+            header = None
+        write(f"{stamp.decode('ascii', 'replace')} {message.decode('utf-8', 'replace')}\n")
+    if header:
+        print(f"=== Logs: {archive.name} ({archive.host}) — empty ===")
+
+
+def find_archive(url, name, host):
+    """The archive of container ``name``, for --offline. Exits when there is none or several."""
+    found = logarchive.find(url, name, {host} if host else None)
+    if not found:
+        print(f"Error: No archived logs for container '{name}'.", file=sys.stderr)
+        sys.exit(1)
+    if len({a.host for a in found}) > 1:
+        print(f"Error: Multiple archived containers match '{name}':", file=sys.stderr)
+        for a in found:
+            print(f"  {a.name} on {a.host}", file=sys.stderr)
+        print("Use --host to disambiguate.", file=sys.stderr)
+        sys.exit(1)
+    # A recreated container leaves an archive per container ID; answer from the newest.
+    return max(found, key=lambda a: a.meta["cursor"] or "")
+
+
+def search_predicate(name, project):
+    def matches(entry):
+        if project and entry["project"] != project:
+            return False
+        if not name:
+            return True
+        if any(ch in name for ch in "*?["):
+            return fnmatch.fnmatchcase(entry["name"], name)
+        return name in entry["name"]
+
     return matches
 
 
-def strip_docker_headers(raw):
-    output = []
-    i = 0
-    while i + 8 <= len(raw):
-        size = int.from_bytes(raw[i + 4 : i + 8], "big")
-        if i + 8 + size > len(raw):
-            output.append(raw[i + 8 :].decode("utf-8", errors="replace"))
-            break
-        output.append(raw[i + 8 : i + 8 + size].decode("utf-8", errors="replace"))
-        i += 8 + size
-    return "".join(output)
+def search_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="portainer-logs search", description="Search the logs of several containers, merged by time"
+    )
+    parser.add_argument("pattern", help="Regular expression matched against each log message")
+    parser.add_argument("container", nargs="?", help="Containers whose name contains this text (or matches this glob)")
+    parser.add_argument("--project", help="Only containers of this compose project")
+    parser.add_argument("--host", default="all", choices=host_choices(), metavar="HOST")
+    parser.add_argument("--ignore-case", "-i", action="store_true", help="Match the pattern case-insensitively")
+    add_log_args(parser, "Lines searched from the end of each log (default: 1000, or all with --since)")
+    add_common_args(parser)
+    args = parser.parse_args(argv)
+    apply_common_args(args)
+    if not args.container and not args.project:
+        parser.error("a container name or --project is required")
+    try:
+        # Matching raw bytes spares decoding every line that does not match.
+        regex = re.compile(args.pattern.encode(), re.IGNORECASE if args.ignore_case else 0)
+    except re.error as e:
+        print(f"Error: Invalid pattern: {e}", file=sys.stderr)
+        sys.exit(1)
+    streams, params = log_params(args, 1000)
+
+    url, session = get_session()
+    import requests
+
+    out = Output(args.format)
+    targets = select_targets(args.host)
+    what = f"'{args.container}'" if args.container else f"project '{args.project}'"
+
+    try:
+        containers = select_containers(session, url, targets, search_predicate(args.container, args.project))
+    except requests.RequestException as e:
+        print(f"Connection error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not containers:
+        print(f"Error: No containers match {what}.", file=sys.stderr)
+        sys.exit(1)
+    if len(containers) > MAX_SEARCH_CONTAINERS:
+        print(
+            f"Error: {len(containers)} containers match {what}; search at most {MAX_SEARCH_CONTAINERS} at once "
+            "(narrow it with --host, --project or a longer name).",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    labels = [f"{host}/{cname}" for host, _, _, cname in containers]
+    width = max(map(len, labels))
+    scope = f"since {args.since}" if args.since else f"last {params['tail']} lines each"
+    search = LogSearch(session, url, containers, params, regex, streams).start()
+    matched = 0
+    try:
+        with out:
+            if out.table:
+                hosts = len({c[0] for c in containers})
+                print(f"=== Search: /{args.pattern}/ in {len(containers)} container(s) on {hosts} host(s) — {scope} ===")
+            write = sys.stdout.write
+            for stamp, i, stream, message in search:
+                matched += 1
+                if out.table:
+                    text = message.decode("utf-8", "replace")
+                    write(f"{stamp.decode('ascii', 'replace')}  {labels[i]:<{width}}  {text}\n")
+                else:
+                    out.emit(log_record(containers[i][0], containers[i][3], stream, stamp, message))
+            for host, cname, error in search.errors:
+                out.emit({"host": host, "container": cname, "error": error})
+    except KeyboardInterrupt:
+        pass
+    finally:
+        search.stop()
+    if out.table:
+        for host, cname, error in search.errors:
+            print(f"Warning: {cname} on {host}: {error}")
+        print(f"Summary: {matched} matching line(s) in {len(containers)} container(s)")
+    if search.errors:
+        sys.exit(1)
 
 
 def main():
+    # "search" selects the multi-container mode; "-- search" still means a container named search.
+    if sys.argv[1:2] == ["search"]:
+        return search_main(sys.argv[2:])
     parser = argparse.ArgumentParser(prog="portainer-logs", description="View container logs")
     parser.add_argument("container")
-    parser.add_argument("--host", choices=["docker01", "docker02", "soho-nas"])
-    parser.add_argument("--tail", type=int, default=100)
+    parser.add_argument("--host", choices=host_choices(include_all=False), metavar="HOST")
+    parser.add_argument("--follow", "-f", action="store_true", help="Keep streaming new log lines until interrupted")
+    add_log_args(parser, "Number of lines from the end (default: 100, or all with --since)")
+    archive_mode = parser.add_mutually_exclusive_group()
+    archive_mode.add_argument(
+        "--archive", action="store_true", help="Fetch only lines newer than the local log archive, then answer from it"
+    )
+    archive_mode.add_argument("--offline", action="store_true", help="Answer from the local log archive only")
+    add_common_args(parser)
     args = parser.parse_args()
+    apply_common_args(args)
+    if args.follow and (args.archive or args.offline):
+        parser.error("--follow cannot be combined with --archive or --offline")
+    archiving = args.archive or (logarchive.enabled() and not args.follow)
+
+    streams, params = log_params(args, 100)
+    if args.follow:
+        params["follow"] = 1
+    if params["tail"] == "all":
+        scope = f"since {args.since}"
+    else:
+        scope = f"last {params['tail']} lines"
+
+    out = Output(args.format)
+    if args.offline:
+        archive = find_archive(config.env("PORTAINER_URL", DEFAULT_URL), args.container, args.host)
+        print_archive(out, archive, params, streams, f"{scope}, archived")
+        return
 
     url, session = get_session()
+    import requests
 
-    if args.host:
-        endpoint_ids = [ENDPOINTS[args.host]]
-    else:
-        endpoint_ids = list(ENDPOINTS.values())
+    endpoint_ids = list(select_targets(args.host).values())
 
     try:
-        matches = find_container(session, url, args.container, endpoint_ids)
+        # The container index may predate a recreate; on a 404 rebuild it once and retry.
+        for attempt in range(2):
+            matches = find_container(session, url, args.container, endpoint_ids)
 
-        if not matches:
-            print(f"Error: Container '{args.container}' not found.", file=sys.stderr)
-            sys.exit(1)
+            if not matches:
+                print(f"Error: Container '{args.container}' not found.", file=sys.stderr)
+                sys.exit(1)
 
-        if len(matches) > 1:
-            print(f"Error: Multiple containers match '{args.container}':", file=sys.stderr)
-            for eid, cname, host in matches:
-                print(f"  {cname} on {host}", file=sys.stderr)
-            print("Use --host to disambiguate.", file=sys.stderr)
-            sys.exit(1)
+            if len(matches) > 1:
+                print(f"Error: Multiple containers match '{args.container}':", file=sys.stderr)
+                for _, _, cname, host in matches:
+                    print(f"  {cname} on {host}", file=sys.stderr)
+                print("Use --host to disambiguate.", file=sys.stderr)
+                sys.exit(1)
 
-        eid, cname, host = matches[0]
-        resp = session.get(
-            f"{url}/api/endpoints/{eid}/docker/containers/{cname}/logs",
-            params={"stdout": 1, "stderr": 1, "timestamps": 1, "tail": args.tail},
-        )
+            eid, cid, cname, host = matches[0]
+            archive = logarchive.LogArchive(url, eid, cid) if archiving else None
+            resp = session.get(
+                f"{url}/api/endpoints/{eid}/docker/containers/{cid}/logs",
+                params=archive.request_params() if archive else params,
+                stream=True,
+                # Followed streams may stay quiet indefinitely; only bound the connect.
+                timeout=(host_timeout(), None if args.follow else host_timeout()),
+            )
+            if resp.status_code != 404 or attempt:
+                break
+            resp.close()
+            forget_endpoint(url, eid)
 
         if resp.status_code == 404:
             print(f"Error: Container '{cname}' not found on {host}.", file=sys.stderr)
@@ -83,16 +457,37 @@ def main():
             print(f"Error: HTTP {resp.status_code}", file=sys.stderr)
             sys.exit(1)
 
-        if not resp.content:
-            print(f"=== Logs: {cname} ({host}) — empty ===")
-        else:
-            cleaned = strip_docker_headers(resp.content)
-            print(f"=== Logs: {cname} ({host}) — last {args.tail} lines ===")
-            print(cleaned, end="")
+        if archive is not None:
+            try:
+                with resp:
+                    added = archive.sync(resp, cname, host)
+            except OSError as e:
+                print(f"Error: Cannot write the log archive: {e}", file=sys.stderr)
+                sys.exit(1)
+            print_archive(out, archive, params, streams, f"{scope}, {added} new archived")
+            return
+
+        if not out.table:
+            with resp, out:
+                stream_records(resp, out, host, cname, streams)
+            return
+
+        if args.follow:
+            scope = "following"
+        header = f"=== Logs: {cname} ({host}) — {scope} ==="
+        if args.follow:
+            # A followed container may be silent for a while; show it is attached.
+            print(header, flush=True)
+            header = None
+        with resp:
+            if not stream_logs(resp, header, streams) and header:
+                print(f"=== Logs: {cname} ({host}) — empty ===")
+    except KeyboardInterrupt:
+        pass
     except requests.RequestException as e:
         print(f"Connection error: {e}", file=sys.stderr)
         sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
+    run_skill(main)
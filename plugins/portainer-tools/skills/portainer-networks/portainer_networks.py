@@ -1,91 +1,113 @@
 #!/usr/bin/env python3
 """Manage Docker networks across Portainer-managed hosts.
 
+``topology`` maps which containers share which networks on every selected
+host from the container listings alone (each container's
+NetworkSettings.Networks carries its network, IP and prefix length), one
+listing per host fetched concurrently, rather than an inspect per network.
+It prints text, records (--format json/ndjson) or a Graphviz/Mermaid graph
+(--graph), and flags user-created networks on different hosts whose
+subnets overlap.
+
 Requires: requests
 Environment: PORTAINER_TOKEN is required. PORTAINER_URL defaults to http://192.168.10.12:9000.
 """
 
 import argparse
+import ipaddress
 import sys
 from pathlib import Path
 
-import requests
-
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from portainer_common import ENDPOINTS, get_session
+from portainer_common import (
+    add_common_args,
+    apply_common_args,
+    cache,
+    endpoints,
+    fan_out,
+    fetch_listing,
+    find_by_name,
+    get_session,
+    host_choices,
+    select_targets,
+)
+from portainer_common.agentd import run_skill
+from portainer_common.output import Output
 
 DEFAULT_NETWORKS = {"bridge", "host", "none"}
+GRAPH_FORMATS = ("dot", "mermaid")
 
 
 def find_network(session, url, name, endpoint_ids):
-    matches = []
-    host_by_id = {v: k for k, v in ENDPOINTS.items()}
-    for eid in endpoint_ids:
-        resp = session.get(f"{url}/api/endpoints/{eid}/docker/networks")
-        if resp.status_code != 200:
-            continue
-        for n in resp.json():
-            nname = n["Name"]
-            if name == nname or name in nname:
-                matches.append((eid, n["Id"], nname, host_by_id.get(eid, f"endpoint-{eid}")))
-    return matches
+    host_by_id = {v: k for k, v in endpoints().items()}
+    targets = {host_by_id.get(eid, f"endpoint-{eid}"): eid for eid in endpoint_ids}
+    return [(eid, n["Id"], nname, host) for host, eid, nname, n in find_by_name(session, url, "networks", name, targets)]
 
 
-def cmd_list(args, session, url):
-    if args.host == "all":
-        targets = ENDPOINTS
-    else:
-        targets = {args.host: ENDPOINTS[args.host]}
+def cmd_list(args, session, url, out):
+    targets = select_targets(args.host)
+
+    def fetch(host, eid):
+        return fetch_listing(session, url, eid, "networks")
 
     total_default = 0
     total_user = 0
 
-    for host, eid in targets.items():
-        resp = session.get(f"{url}/api/endpoints/{eid}/docker/networks")
-        if resp.status_code != 200:
-            print(f"=== {host} === (error: HTTP {resp.status_code})")
+    for host, _, networks, error in fan_out(fetch, targets, ordered=not out.streaming):
+        if error:
+            if out.table:
+                print(f"=== {host} === (error: {error})")
+            out.emit({"host": host, "error": error})
+            continue
+
+        rows = []
+        for n in sorted(networks, key=lambda x: x["Name"]):
+            name = n["Name"]
+            driver = n.get("Driver", "—")
+            scope = n.get("Scope", "—")
+            containers = len(n.get("Containers", {}) or {})
+            is_default = name in DEFAULT_NETWORKS
+            rows.append((name, driver, scope, containers, is_default))
+            out.emit({
+                "host": host,
+                "name": name,
+                "id": n.get("Id"),
+                "driver": driver,
+                "scope": scope,
+                "containers": containers,
+                "default": is_default,
+            })
+            if is_default:
+                total_default += 1
+            else:
+                total_user += 1
+        if not out.table:
             continue
 
-        networks = resp.json()
         print(f"=== {host} ===")
-        if not networks:
+        if not rows:
             print("  (no networks)")
         else:
-            rows = []
-            for n in sorted(networks, key=lambda x: x["Name"]):
-                name = n["Name"]
-                driver = n.get("Driver", "—")
-                scope = n.get("Scope", "—")
-                containers = len(n.get("Containers", {}) or {})
-                is_default = name in DEFAULT_NETWORKS
-                tag = "  [default]" if is_default else ""
-                rows.append((name, driver, scope, containers, tag))
-                if is_default:
-                    total_default += 1
-                else:
-                    total_user += 1
-
             max_name = max(len(r[0]) for r in rows)
             max_driver = max(len(r[1]) for r in rows)
             max_scope = max(len(r[2]) for r in rows)
             print(f"  {'NAME':<{max_name}}  {'DRIVER':<{max_driver}}  {'SCOPE':<{max_scope}}  CONTAINERS")
-            for name, driver, scope, containers, tag in rows:
+            for name, driver, scope, containers, is_default in rows:
+                tag = "  [default]" if is_default else ""
                 print(f"  {name:<{max_name}}  {driver:<{max_driver}}  {scope:<{max_scope}}  {containers}{tag}")
         print()
 
-    total = total_default + total_user
-    print(f"Summary: {total} networks across {len(targets)} host(s) ({total_default} default, {total_user} user-created)")
+    if out.table:
+        total = total_default + total_user
+        print(f"Summary: {total} networks across {len(targets)} host(s) ({total_default} default, {total_user} user-created)")
 
 
-def cmd_inspect(args, session, url):
+def cmd_inspect(args, session, url, out):
     if not args.name:
         print("Error: Network name is required for inspect.", file=sys.stderr)
         sys.exit(1)
 
-    if args.host:
-        endpoint_ids = [ENDPOINTS[args.host]]
-    else:
-        endpoint_ids = list(ENDPOINTS.values())
+    endpoint_ids = list(select_targets(args.host).values())
 
     matches = find_network(session, url, args.name, endpoint_ids)
 
@@ -110,17 +132,34 @@ def cmd_inspect(args, session, url):
         sys.exit(1)
 
     net = resp.json()
+    ipam_configs = (net.get("IPAM") or {}).get("Config") or []
+    containers = net.get("Containers") or {}
+    if not out.table:
+        cfg = ipam_configs[0] if ipam_configs else {}
+        out.emit({
+            "host": host,
+            "name": net["Name"],
+            "id": net.get("Id"),
+            "driver": net.get("Driver"),
+            "scope": net.get("Scope"),
+            "subnet": cfg.get("Subnet"),
+            "gateway": cfg.get("Gateway"),
+            "containers": [
+                {"name": c.get("Name", cid[:12]), "id": cid, "ipv4": c.get("IPv4Address")}
+                for cid, c in sorted(containers.items(), key=lambda x: x[1].get("Name", ""))
+            ],
+        })
+        return
+
     print(f"=== Network: {net['Name']} ({host}) ===")
     print(f"Driver:   {net.get('Driver', '—')}")
     print(f"Scope:    {net.get('Scope', '—')}")
 
-    ipam_configs = (net.get("IPAM") or {}).get("Config") or []
     if ipam_configs:
         cfg = ipam_configs[0]
         print(f"Subnet:   {cfg.get('Subnet', '—')}")
         print(f"Gateway:  {cfg.get('Gateway', '—')}")
 
-    containers = net.get("Containers") or {}
     if containers:
         print()
         print("Connected containers:")
@@ -133,7 +172,7 @@ def cmd_inspect(args, session, url):
         print("\nNo connected containers.")
 
 
-def cmd_create(args, session, url):
+def cmd_create(args, session, url, out):
     if not args.name:
         print("Error: Network name is required for create.", file=sys.stderr)
         sys.exit(1)
@@ -141,7 +180,7 @@ def cmd_create(args, session, url):
         print("Error: --host is required for create.", file=sys.stderr)
         sys.exit(1)
 
-    eid = ENDPOINTS[args.host]
+    eid = endpoints()[args.host]
     body = {"Name": args.name, "Driver": args.driver or "bridge", "CheckDuplicate": True}
     if args.subnet or args.gateway:
         ipam_config = {}
@@ -152,8 +191,11 @@ def cmd_create(args, session, url):
         body["IPAM"] = {"Config": [ipam_config]}
 
     resp = session.post(f"{url}/api/endpoints/{eid}/docker/networks/create", json=body)
+    cache.invalidate(url, eid, ["networks"])
     if resp.status_code == 201 or (resp.status_code == 200 and resp.json().get("Id")):
-        print(f"Network '{args.name}' created on {args.host}.")
+        out.emit({"host": args.host, "name": args.name, "result": "created"})
+        if out.table:
+            print(f"Network '{args.name}' created on {args.host}.")
     else:
         print(f"Error: HTTP {resp.status_code}", file=sys.stderr)
         if resp.text:
@@ -161,7 +203,7 @@ def cmd_create(args, session, url):
         sys.exit(1)
 
 
-def cmd_remove(args, session, url):
+def cmd_remove(args, session, url, out):
     if not args.name:
         print("Error: Network name is required for remove.", file=sys.stderr)
         sys.exit(1)
@@ -172,7 +214,7 @@ def cmd_remove(args, session, url):
         print(f"Error: Cannot remove default network '{args.name}'.", file=sys.stderr)
         sys.exit(1)
 
-    eid = ENDPOINTS[args.host]
+    eid = endpoints()[args.host]
     matches = find_network(session, url, args.name, [eid])
 
     if not matches:
@@ -190,8 +232,11 @@ def cmd_remove(args, session, url):
 
     _, nid, nname, host = matches[0]
     resp = session.delete(f"{url}/api/endpoints/{eid}/docker/networks/{nid}")
+    cache.invalidate(url, eid, ["networks"])
     if resp.status_code == 204:
-        print(f"Network '{nname}' removed from {host}.")
+        out.emit({"host": host, "name": nname, "result": "removed"})
+        if out.table:
+            print(f"Network '{nname}' removed from {host}.")
     else:
         print(f"Error: HTTP {resp.status_code}", file=sys.stderr)
         if resp.text:
@@ -199,26 +244,262 @@ def cmd_remove(args, session, url):
         sys.exit(1)
 
 
+def network_subnets(attachment):
+    """Subnets implied by a container's address on a network (IPv4 and IPv6)."""
+    subnets = []
+    for addr, prefix in (("IPAddress", "IPPrefixLen"), ("GlobalIPv6Address", "GlobalIPv6PrefixLen")):
+        if attachment.get(addr) and attachment.get(prefix):
+            try:
+                subnets.append(ipaddress.ip_interface(f"{attachment[addr]}/{attachment[prefix]}").network)
+            except ValueError:
+                pass
+    return subnets
+
+
+def build_topology(containers):
+    """{network name: {"id", "subnets", "default", "containers": [{"name", "ip", "state"}]}} for one host."""
+    networks = {}
+    for c in sorted(containers, key=lambda c: c["Names"][0]):
+        cname = c["Names"][0].lstrip("/")
+        for nname, attachment in ((c.get("NetworkSettings") or {}).get("Networks") or {}).items():
+            if nname == "none":
+                continue
+            attachment = attachment or {}
+            net = networks.setdefault(nname, {
+                "id": attachment.get("NetworkID", ""),
+                "subnets": [],
+                "default": nname in DEFAULT_NETWORKS,
+                "containers": [],
+            })
+            for subnet in network_subnets(attachment):
+                if subnet not in net["subnets"]:
+                    net["subnets"].append(subnet)
+            ip = attachment.get("IPAddress") or ""
+            net["containers"].append({"name": cname, "ip": ip, "state": c.get("State", "")})
+    return networks
+
+
+def find_overlaps(topology):
+    """Groups of user-created networks, on two or more hosts, whose subnets overlap.
+
+    Each group is a list of (host, network, subnet) sorted by address; every
+    subnet in it overlaps at least one other. Subnets are swept in address
+    order, so a fleet that reuses Docker's default pool on every host gives
+    one group per subnet rather than a pair per two hosts.
+    """
+    spans = sorted(
+        (subnet.version, int(subnet.network_address), int(subnet.broadcast_address), host, nname, subnet)
+        for host, networks in topology.items()
+        for nname, net in networks.items()
+        if not net["default"]
+        for subnet in net["subnets"]
+    )
+    groups = []
+    group, group_end = [], None
+    for version, start, end, host, nname, subnet in spans:
+        if group and (version, start) > group_end:
+            groups.append(group)
+            group = []
+        group_end = max(group_end, (version, end)) if group else (version, end)
+        group.append((host, nname, subnet))
+    groups.append(group)
+    return [g for g in groups if len({host for host, _, _ in g}) > 1]
+
+
+def describe_overlap(group):
+    subnets = sorted({str(subnet) for _, _, subnet in group})
+    users = ", ".join(f"{nname} on {host}" for host, nname, _ in group)
+    return f"{' / '.join(subnets)} used by {users}"
+
+
+def describe_subnets(net):
+    return ", ".join(map(str, net["subnets"])) or "—"
+
+
+def print_topology(topology, errors, overlaps):
+    memberships = {}
+    for host, networks in topology.items():
+        for nname, net in networks.items():
+            for c in net["containers"]:
+                memberships.setdefault((host, c["name"]), []).append(nname)
+
+    for host, networks in topology.items():
+        print(f"=== {host} ===")
+        if not networks:
+            print("  (no containers on any network)")
+        for nname in sorted(networks, key=lambda n: (networks[n]["default"], n)):
+            net = networks[nname]
+            tag = " [default]" if net["default"] else ""
+            print(f"  {nname}{tag}  {describe_subnets(net)}  ({len(net['containers'])} container(s))")
+            width = max(len(c["name"]) for c in net["containers"])
+            state_width = max(len(c["state"]) for c in net["containers"])
+            for c in net["containers"]:
+                others = [n for n in memberships[(host, c["name"])] if n != nname]
+                also = f"  also on: {', '.join(others)}" if others else ""
+                print(f"    {c['name']:<{width}}  {c['ip'] or '—':<15}  {c['state']:<{state_width}}{also}".rstrip())
+        print()
+
+    for host, error in errors:
+        print(f"Warning: {host}: {error}")
+    for group in overlaps:
+        print(f"Overlap: {describe_overlap(group)}")
+    networks = sum(len(n) for n in topology.values())
+    print(
+        f"Summary: {networks} network(s), {len(memberships)} container(s) across {len(topology)} host(s); "
+        f"{len(overlaps)} overlapping subnet(s) between user-created networks"
+    )
+
+
+def emit_topology(topology, errors, overlaps, out):
+    for host, networks in topology.items():
+        for nname, net in sorted(networks.items()):
+            out.emit({
+                "kind": "network",
+                "host": host,
+                "name": nname,
+                "id": net["id"],
+                "subnets": [str(s) for s in net["subnets"]],
+                "default": net["default"],
+                "containers": net["containers"],
+            })
+    for group in overlaps:
+        out.emit({
+            "kind": "overlap",
+            "networks": [{"host": host, "name": nname, "subnet": str(subnet)} for host, nname, subnet in group],
+        })
+    for host, error in errors:
+        out.emit({"host": host, "error": error})
+
+
+def graph_ids(topology):
+    """Short node ids: {(host, network): "nN"} and {(host, container): "cN"}."""
+    net_ids, container_ids = {}, {}
+    for host, networks in topology.items():
+        for nname, net in sorted(networks.items()):
+            net_ids[(host, nname)] = f"n{len(net_ids)}"
+            for c in net["containers"]:
+                container_ids.setdefault((host, c["name"]), f"c{len(container_ids)}")
+    return net_ids, container_ids
+
+
+def overlap_links(overlaps):
+    """Edges chaining the networks of each overlap group, one fewer than its size."""
+    return [pair for group in overlaps for pair in zip(group, group[1:])]
+
+
+def quote_dot(text):
+    # Backslashes are left alone, so a "\n" in the label stays a Graphviz line break.
+    return '"' + text.replace('"', '\\"') + '"'
+
+
+def render_dot(topology, overlaps):
+    net_ids, container_ids = graph_ids(topology)
+    lines = ["graph topology {", "  rankdir=LR;", "  node [fontname=Helvetica];"]
+    for i, (host, networks) in enumerate(topology.items()):
+        lines.append(f"  subgraph cluster_{i} {{")
+        lines.append(f"    label={quote_dot(host)};")
+        for nname, net in sorted(networks.items()):
+            label = f"{nname}\\n{describe_subnets(net)}"
+            style = "ellipse, style=dashed" if net["default"] else "ellipse"
+            lines.append(f"    {net_ids[(host, nname)]} [shape={style}, label={quote_dot(label)}];")
+        for (chost, cname), cid in container_ids.items():
+            if chost == host:
+                lines.append(f"    {cid} [shape=box, label={quote_dot(cname)}];")
+        for nname, net in sorted(networks.items()):
+            for c in net["containers"]:
+                edge = f"    {container_ids[(host, c['name'])]} -- {net_ids[(host, nname)]}"
+                lines.append(f"{edge} [label={quote_dot(c['ip'])}];" if c["ip"] else f"{edge};")
+        lines.append("  }")
+    for (host_a, net_a, subnet), (host_b, net_b, _) in overlap_links(overlaps):
+        lines.append(
+            f"  {net_ids[(host_a, net_a)]} -- {net_ids[(host_b, net_b)]} "
+            f"[style=dashed, color=red, constraint=false, label={quote_dot(f'overlap {subnet}')}];"
+        )
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def quote_mermaid(text):
+    return '"' + text.replace('"', "#quot;") + '"'
+
+
+def render_mermaid(topology, overlaps):
+    net_ids, container_ids = graph_ids(topology)
+    lines = ["graph LR"]
+    for i, (host, networks) in enumerate(topology.items()):
+        lines.append(f"  subgraph h{i} [{quote_mermaid(host)}]")
+        for nname, net in sorted(networks.items()):
+            lines.append(f"    {net_ids[(host, nname)]}([{quote_mermaid(f'{nname}<br/>{describe_subnets(net)}')}])")
+        for (chost, cname), cid in container_ids.items():
+            if chost == host:
+                lines.append(f"    {cid}[{quote_mermaid(cname)}]")
+        for nname, net in sorted(networks.items()):
+            for c in net["containers"]:
+                link = f"---|{quote_mermaid(c['ip'])}|" if c["ip"] else "---"
+                lines.append(f"    {container_ids[(host, c['name'])]} {link} {net_ids[(host, nname)]}")
+        lines.append("  end")
+    for (host_a, net_a, subnet), (host_b, net_b, _) in overlap_links(overlaps):
+        label = quote_mermaid(f"overlap {subnet}")
+        lines.append(f"  {net_ids[(host_a, net_a)]} -.-|{label}| {net_ids[(host_b, net_b)]}")
+    return "\n".join(lines)
+
+
+def cmd_topology(args, session, url, out):
+    targets = select_targets(args.host)
+
+    def fetch(host, eid):
+        return build_topology(fetch_listing(session, url, eid, "containers"))
+
+    topology = {}
+    errors = []
+    for host, _, networks, error in fan_out(fetch, targets):
+        if error:
+            errors.append((host, error))
+        else:
+            topology[host] = networks
+    overlaps = find_overlaps(topology)
+
+    if args.graph:
+        print(render_dot(topology, overlaps) if args.graph == "dot" else render_mermaid(topology, overlaps))
+        for host, error in errors:
+            print(f"Warning: {host}: {error}", file=sys.stderr)
+    elif out.table:
+        print_topology(topology, errors, overlaps)
+    else:
+        emit_topology(topology, errors, overlaps, out)
+
+
 def main():
     parser = argparse.ArgumentParser(prog="portainer-networks", description="Manage Docker networks")
-    parser.add_argument("action", choices=["list", "inspect", "create", "remove"])
+    parser.add_argument("action", choices=["list", "inspect", "create", "remove", "topology"])
     parser.add_argument("name", nargs="?", help="Network name (required for inspect/create/remove)")
-    parser.add_argument("--host", default="all", choices=["all", "docker01", "docker02", "soho-nas"])
+    parser.add_argument("--host", default="all", choices=host_choices(), metavar="HOST")
     parser.add_argument("--driver", default="bridge", help="Network driver (default: bridge)")
     parser.add_argument("--subnet", help="Subnet CIDR (e.g. 172.20.0.0/16)")
     parser.add_argument("--gateway", help="Gateway IP (e.g. 172.20.0.1)")
+    parser.add_argument("--graph", choices=GRAPH_FORMATS, help="topology: print a Graphviz or Mermaid graph instead")
+    add_common_args(parser)
     args = parser.parse_args()
+    apply_common_args(args)
 
     url, session = get_session()
+    import requests
 
-    handlers = {"list": cmd_list, "inspect": cmd_inspect, "create": cmd_create, "remove": cmd_remove}
+    handlers = {
+        "list": cmd_list,
+        "inspect": cmd_inspect,
+        "create": cmd_create,
+        "remove": cmd_remove,
+        "topology": cmd_topology,
+    }
 
     try:
-        handlers[args.action](args, session, url)
+        with Output(args.format) as out:
+            handlers[args.action](args, session, url, out)
     except requests.RequestException as e:
         print(f"Connection error: {e}", file=sys.stderr)
         sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
+    run_skill(main)
@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 """Show port allocations across Portainer-managed Docker hosts.
 
-Requires: requests
+Answers from the port index (see portainer_common.ports): one container
+listing per host, fetched concurrently and cached, after which each port is
+a single lookup. --check reports where a compose file's published ports are
+already taken; --find-free picks unused ports in a range.
+
+Requires: requests (and PyYAML for --check)
 Environment: PORTAINER_TOKEN is required. PORTAINER_URL defaults to http://192.168.10.12:9000.
 """
 
@@ -9,69 +14,191 @@ import argparse
 import sys
 from pathlib import Path
 
-import requests
-
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from portainer_common import ENDPOINTS, get_session
+from portainer_common import (
+    add_common_args,
+    apply_common_args,
+    get_session,
+    host_choices,
+    ports,
+    positive_int,
+    select_targets,
+)
+from portainer_common.agentd import run_skill
+from portainer_common.output import Output
+
+
+def port_range(text):
+    first, sep, last = text.partition("-")
+    try:
+        start, end = int(first), int(last if sep else first)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a port range like 8000-9000, got {text!r}") from None
+    if not 1 <= start <= end <= 65535:
+        raise argparse.ArgumentTypeError(f"invalid port range {text!r}")
+    return start, end
+
+
+def describe_owner(binding):
+    owner = f"{binding['container']} ({binding['state']}"
+    if binding["project"]:
+        owner += f", stack {binding['project']}"
+    return owner + ")"
+
+
+def print_warnings(index, errors, host_network="their ports cannot be checked"):
+    for host, error in errors:
+        print(f"Warning: {host}: {error}")
+    for host, data in index.hosts.items():
+        if data["host_network"]:
+            names = ", ".join(o["container"] for o in data["host_network"])
+            print(f"Warning: {host}: {names} use the host network; {host_network}")
+
+
+def cmd_list(index, errors, targets, out):
+    failed = dict(errors)
+    for host in targets:
+        if host in failed:
+            if out.table:
+                print(f"=== {host} === (error: {failed[host]})")
+            out.emit({"host": host, "error": failed[host]})
+            continue
+
+        port_rows = [(pub, b["private"], proto, b["container"], b["state"]) for pub, proto, b in index.rows(host)]
+        port_rows += [(None, None, "host", o["container"], o["state"]) for o in index.hosts[host]["host_network"]]
+
+        if not out.table:
+            for pub, priv, ptype, name, state in port_rows:
+                out.emit({"host": host, "public": pub, "private": priv, "type": ptype, "container": name, "state": state})
+            continue
+
+        print(f"=== {host} ===")
+        if not port_rows:
+            print("  (no published ports)")
+        else:
+            max_name = max(len(r[3]) for r in port_rows)
+            for pub, priv, ptype, name, state in port_rows:
+                if pub is None:
+                    print(f"  {'host':<7}  {'—':>5}  {'—':<4}  {name:<{max_name}}  {state}")
+                else:
+                    print(f"  {pub:<7}  {priv:>5}  {ptype:<4}  {name:<{max_name}}  {state}")
+        print()
+
+
+def cmd_check(args, index, errors, out):
+    """Report every published port of the compose file that is already taken. Returns the conflict count."""
+    path = Path(args.check)
+    try:
+        published = ports.compose_ports(path.read_text())
+    except OSError as e:
+        print(f"Error: Cannot read {path}: {e.strerror}", file=sys.stderr)
+        sys.exit(1)
+    except ImportError:
+        print("Error: --check needs PyYAML (pip install pyyaml).", file=sys.stderr)
+        sys.exit(1)
+    except ValueError as e:
+        print(f"Error: {path}: {e}", file=sys.stderr)
+        sys.exit(1)
+    # The stack's own containers hold its ports until it is redeployed.
+    stack = args.stack_name or path.stem
+
+    conflicts = 0
+    for host in index.hosts:
+        results = []
+        for i, p in enumerate(published):
+            clashes = [describe_owner(b) for b in index.lookup(host, p["port"], p["protocol"], p["ip"]) if b["project"] != stack]
+            clashes += [
+                f"{q['service']} in this file"
+                for q in published[:i]
+                if (q["port"], q["protocol"]) == (p["port"], p["protocol"]) and ports.overlaps(q["ip"], p["ip"])
+            ]
+            conflicts += bool(clashes)
+            results.append((p, clashes))
+            out.emit({"host": host, **p, "conflicts": clashes})
+        if not out.table:
+            continue
+        print(f"=== {host} ===")
+        if not results:
+            print("  (the file publishes no ports)")
+        rows = []
+        for p, clashes in results:
+            bind = f"{p['ip']}:{p['port']}/{p['protocol']}" if p["ip"] else f"{p['port']}/{p['protocol']}"
+            rows.append((bind, p["service"], "conflict: " + "; ".join(clashes) if clashes else "free"))
+        if rows:
+            widths = [max(len(row[i]) for row in rows) for i in range(2)]
+            for bind, service, verdict in rows:
+                print(f"  {bind:<{widths[0]}}  {service:<{widths[1]}}  {verdict}")
+        print()
+
+    for host, error in errors:
+        out.emit({"host": host, "error": error})
+    if out.table:
+        print_warnings(index, errors)
+        print(f"Summary: {conflicts} conflict(s) in {len(published)} published port(s) across {len(index.hosts)} host(s)")
+    return conflicts
+
+
+def cmd_find_free(args, index, errors, out):
+    """Print free ports; returns how many were found."""
+    start, end = args.range
+    hosts = list(index.hosts)
+    free = index.find_free(hosts, start, end, args.protocol, args.count)
+    where = hosts[0] if len(hosts) == 1 else f"all of {', '.join(hosts)}"
+    # Docker reports no ports for these, so any "free" port may be one they listen on.
+    host_network = sorted(f"{o['container']}@{host}" for host in hosts for o in index.hosts[host]["host_network"])
+    for port in free:
+        record = {"hosts": hosts, "port": port, "protocol": args.protocol}
+        if host_network:
+            record["unchecked_host_network"] = host_network
+        out.emit(record)
+    for host, error in errors:
+        out.emit({"host": host, "error": error})
+    if out.table:
+        if free:
+            print(f"Free {args.protocol} port(s) on {where} in {start}-{end}: {', '.join(map(str, free))}")
+        else:
+            print(f"No free {args.protocol} port on {where} in {start}-{end}")
+        print_warnings(index, errors, "a port listed as free may still be in use by them")
+    return len(free)
 
 
 def main():
     parser = argparse.ArgumentParser(prog="portainer-ports", description="Show port allocations per Docker host")
-    parser.add_argument("host", nargs="?", default="all", choices=["all", "docker01", "docker02", "soho-nas"])
+    parser.add_argument("host", nargs="?", default="all", choices=host_choices(), metavar="HOST")
+    parser.add_argument("--host", dest="host_option", choices=host_choices(), metavar="HOST", help=argparse.SUPPRESS)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--check", metavar="COMPOSE_FILE", help="Report published ports of a compose file that are already taken")
+    mode.add_argument("--find-free", action="store_true", help="Print the first free port(s) in --range")
+    parser.add_argument("--stack-name", help="--check: stack whose own containers are not conflicts (default: file name)")
+    parser.add_argument("--range", type=port_range, default=(8000, 9000), help="--find-free: ports to search (default: 8000-9000)")
+    parser.add_argument("--count", type=positive_int, default=1, help="--find-free: how many ports to find (default: 1)")
+    parser.add_argument("--protocol", choices=["tcp", "udp"], default="tcp", help="--find-free: protocol (default: tcp)")
+    add_common_args(parser)
     args = parser.parse_args()
+    apply_common_args(args)
 
     url, session = get_session()
+    import requests
 
-    if args.host == "all":
-        targets = ENDPOINTS
-    else:
-        targets = {args.host: ENDPOINTS[args.host]}
+    targets = select_targets(args.host_option or args.host)
 
     try:
-        for host, eid in targets.items():
-            resp = session.get(f"{url}/api/endpoints/{eid}/docker/containers/json?all=1")
-            if resp.status_code != 200:
-                print(f"=== {host} === (error: HTTP {resp.status_code})")
-                continue
-
-            containers = resp.json()
-            print(f"=== {host} ===")
-
-            port_rows = []
-            seen = set()
-            for c in containers:
-                name = c["Names"][0].lstrip("/")
-                state = c["State"]
-                net_mode = c.get("HostConfig", {}).get("NetworkMode", "")
-                for p in c.get("Ports", []):
-                    pub = p.get("PublicPort")
-                    priv = p.get("PrivatePort")
-                    ptype = p.get("Type", "tcp")
-                    key = (pub, priv, ptype, name)
-                    if pub and key not in seen:
-                        seen.add(key)
-                        port_rows.append((pub, priv, ptype, name, state))
-                if net_mode == "host":
-                    key = (None, None, "host", name)
-                    if key not in seen:
-                        seen.add(key)
-                        port_rows.append((None, None, "host", name, state))
-
-            if not port_rows:
-                print("  (no published ports)")
+        index, errors = ports.load(session, url, targets)
+        with Output(args.format) as out:
+            failed = False
+            if args.check:
+                failed = cmd_check(args, index, errors, out) > 0
+            elif args.find_free:
+                failed = cmd_find_free(args, index, errors, out) == 0
             else:
-                port_rows.sort(key=lambda r: (r[0] or 99999,))
-                max_name = max(len(r[3]) for r in port_rows)
-                for pub, priv, ptype, name, state in port_rows:
-                    if pub is None:
-                        print(f"  {'host':<7}  {'—':>5}  {'—':<4}  {name:<{max_name}}  {state}")
-                    else:
-                        print(f"  {pub:<7}  {priv:>5}  {ptype:<4}  {name:<{max_name}}  {state}")
-            print()
+                cmd_list(index, errors, targets, out)
     except requests.RequestException as e:
         print(f"Connection error: {e}", file=sys.stderr)
         sys.exit(1)
+    # Non-zero on a conflict or no free port, so scripts can gate a deploy on it.
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
+    run_skill(main)
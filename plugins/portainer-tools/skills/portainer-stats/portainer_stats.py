@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""Show the busiest containers by CPU, memory, network or block IO.
+
+Samples ``/containers/{id}/stats`` for every running container on the chosen
+hosts, at most PORTAINER_CONCURRENCY (default 8) at a time, and prints the
+top N. With --stream the top N, but never more than PORTAINER_CONCURRENCY,
+keep one stats connection each and the table is redrawn as samples arrive.
+
+Requires: requests
+Environment: PORTAINER_TOKEN is required. PORTAINER_URL defaults to http://192.168.10.12:9000.
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from portainer_common import (
+    add_common_args,
+    apply_common_args,
+    concurrency,
+    describe_error,
+    fan_out,
+    fetch_listing,
+    get_json,
+    get_session,
+    host_choices,
+    host_timeout,
+    non_negative_int,
+    select_targets,
+)
+from portainer_common.agentd import run_skill
+from portainer_common.output import Output, format_bytes
+
+# Sort keys, each computed from a sample record.
+METRICS = {
+    "cpu": lambda r: r["cpu_percent"],
+    "mem": lambda r: r["mem_percent"],
+    "net": lambda r: r["net_rx"] + r["net_tx"],
+    "io": lambda r: r["block_read"] + r["block_write"],
+}
+METRIC_LABELS = {"cpu": "CPU", "mem": "memory", "net": "network IO", "io": "block IO"}
+
+
+def parse_stats(stats, previous=None):
+    """Reduce one Docker stats object to a flat sample record.
+
+    CPU% is the container's share of host CPU time since the previous
+    reading, scaled by the number of CPUs as ``docker stats`` does. Docker
+    includes that reading as ``precpu_stats``; ``previous`` (the last
+    ``cpu_stats`` seen on a stream) is used when it is empty. Memory
+    excludes the reclaimable page cache. Network and block IO are totals.
+    """
+    cpu = stats.get("cpu_stats") or {}
+    pre = stats.get("precpu_stats") or {}
+    if not pre.get("system_cpu_usage") and previous:
+        pre = previous
+    cpu_delta = cpu.get("cpu_usage", {}).get("total_usage", 0) - pre.get("cpu_usage", {}).get("total_usage", 0)
+    system_delta = cpu.get("system_cpu_usage", 0) - pre.get("system_cpu_usage", 0)
+    cpus = cpu.get("online_cpus") or len(cpu.get("cpu_usage", {}).get("percpu_usage") or ()) or 1
+    cpu_percent = cpu_delta / system_delta * cpus * 100 if system_delta > 0 and cpu_delta > 0 else 0.0
+
+    mem = stats.get("memory_stats") or {}
+    details = mem.get("stats") or {}
+    # cgroup v2 reports inactive_file, v1 total_inactive_file; older daemons only cache.
+    cached = details.get("inactive_file", details.get("total_inactive_file", details.get("cache", 0)))
+    mem_usage = max(mem.get("usage", 0) - cached, 0)
+    mem_limit = mem.get("limit", 0)
+
+    networks = (stats.get("networks") or {}).values()
+    blkio = (stats.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []
+    return {
+        "cpu_percent": round(cpu_percent, 2),
+        "mem_usage": mem_usage,
+        "mem_limit": mem_limit,
+        "mem_percent": round(mem_usage / mem_limit * 100, 2) if mem_limit else 0.0,
+        "net_rx": sum(n.get("rx_bytes", 0) for n in networks),
+        "net_tx": sum(n.get("tx_bytes", 0) for n in networks),
+        "block_read": sum(e.get("value", 0) for e in blkio if e.get("op", "").lower() == "read"),
+        "block_write": sum(e.get("value", 0) for e in blkio if e.get("op", "").lower() == "write"),
+    }
+
+
+def running_containers(session, url, targets):
+    """Return ({(host, name): (eid, cid)} for running containers, [(host, error)])."""
+
+    def fetch(host, eid):
+        return fetch_listing(session, url, eid, "containers")
+
+    running = {}
+    errors = []
+    for host, eid, containers, error in fan_out(fetch, targets):
+        if error:
+            errors.append((host, error))
+            continue
+        for c in sorted(containers, key=lambda x: x["Names"][0]):
+            if c["State"] == "running":
+                running[(host, c["Names"][0].lstrip("/"))] = (eid, c["Id"])
+    return running, errors
+
+
+def sample_once(session, url, containers):
+    """One stats reading per container, at most concurrency() requests at a time.
+
+    Returns ({(host, name): record}, [((host, name), error)]).
+    """
+
+    def fetch(key, target):
+        eid, cid = target
+        return parse_stats(get_json(session, url, f"/api/endpoints/{eid}/docker/containers/{cid}/stats?stream=false"))
+
+    samples = {}
+    errors = []
+    # Docker holds each one-shot request about a second to measure the CPU delta.
+    for key, _, record, error in fan_out(fetch, containers):
+        if error:
+            errors.append((key, error))
+        else:
+            samples[key] = record
+    return samples, errors
+
+
+def top(samples, metric, count):
+    ranked = sorted(samples.items(), key=lambda item: (-METRICS[metric](item[1]), item[0]))
+    return ranked[:count] if count else ranked
+
+
+def print_table(ranked):
+    if not ranked:
+        print("  (no running containers)")
+        return
+    rows = []
+    for (host, name), r in ranked:
+        mem = f"{format_bytes(r['mem_usage'])} / {format_bytes(r['mem_limit'])}"
+        net = f"{format_bytes(r['net_rx'])} / {format_bytes(r['net_tx'])}"
+        block = f"{format_bytes(r['block_read'])} / {format_bytes(r['block_write'])}"
+        rows.append((host, name, f"{r['cpu_percent']:.2f}%", mem, f"{r['mem_percent']:.2f}%", net, block))
+    headers = ("HOST", "CONTAINER", "CPU %", "MEM USAGE / LIMIT", "MEM %", "NET I/O", "BLOCK I/O")
+    widths = [max(len(h), *(len(row[i]) for row in rows)) for i, h in enumerate(headers)]
+    for row in (headers, *rows):
+        print("  ".join(f"{cell:<{w}}" for cell, w in zip(row, widths)).rstrip())
+
+
+def emit_records(out, ranked, **extra):
+    for (host, name), r in ranked:
+        out.emit({"host": host, "container": name, **r, **extra})
+
+
+class StatsStream:
+    """Follow ``stats?stream=true`` for a fixed set of containers.
+
+    Each container holds one connection for the life of the stream, on a
+    session whose pool is sized to match so connections are never discarded.
+    The newest sample per container is kept in ``samples``.
+    """
+
+    def __init__(self, session, url, containers):
+        from portainer_common import transport
+
+        self.url = url
+        self.containers = containers
+        self.samples = {}
+        self.errors = {}
+        self._stop = threading.Event()
+        self._responses = []
+        self._session = transport.new_session(session.headers["X-API-Key"], pool_maxsize=max(len(containers), 1))
+
+    def start(self):
+        for key in self.containers:
+            threading.Thread(target=self._follow, args=(key,), name=f"stats-{key[1]}", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for resp in list(self._responses):
+            resp.close()
+        self._session.close()
+
+    def _follow(self, key):
+        eid, cid = self.containers[key]
+        previous = None
+        try:
+            resp = self._session.get(
+                f"{self.url}/api/endpoints/{eid}/docker/containers/{cid}/stats",
+                params={"stream": "true"},
+                stream=True,
+                timeout=(host_timeout(), None),
+            )
+            self._responses.append(resp)
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if self._stop.is_set():
+                    break
+                if line:
+                    stats = json.loads(line)
+                    self.samples[key] = parse_stats(stats, previous)
+                    previous = stats.get("cpu_stats")
+            if not self._stop.is_set():
+                self.errors[key] = "stream ended"
+        except Exception as e:
+            if not self._stop.is_set():
+                self.errors[key] = describe_error(e)
+
+
+def stream(args, session, url, containers, out):
+    """Keep the busiest containers' stats connections open and redraw until interrupted."""
+    # Rank every container once, then follow only the top N, capped at
+    # PORTAINER_CONCURRENCY, so a large fleet never holds a connection per container.
+    samples, _ = sample_once(session, url, containers)
+    chosen = [key for key, _ in top(samples, args.sort, min(args.top or len(samples), concurrency()))]
+    watcher = StatsStream(session, url, {key: containers[key] for key in chosen}).start()
+    watcher.samples.update((key, samples[key]) for key in chosen)
+    clear = out.table and sys.stdout.isatty()
+    try:
+        while True:
+            ranked = top(dict(watcher.samples), args.sort, args.top)
+            if not out.table:
+                emit_records(out, ranked, time=time.time())
+            else:
+                if clear:
+                    print("\033[H\033[J", end="")
+                print(f"=== Top {len(ranked)} by {METRIC_LABELS[args.sort]} — {time.strftime('%H:%M:%S')} ===")
+                print_table(ranked)
+                for (host, name), error in sorted(watcher.errors.items()):
+                    print(f"Warning: {name} on {host}: {error}")
+                print(flush=True)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="portainer-stats", description="Show the busiest containers across Docker hosts")
+    parser.add_argument("host", nargs="?", default="all", choices=host_choices(), metavar="HOST")
+    parser.add_argument("--sort", choices=list(METRICS), default="cpu", help="Metric to rank by (default: cpu)")
+    parser.add_argument(
+        "--top", type=non_negative_int, default=10, metavar="N", help="Show the N busiest containers, 0 for all (default: 10)"
+    )
+    parser.add_argument(
+        "--stream", action="store_true", help="Keep sampling the top N (at most PORTAINER_CONCURRENCY) and redraw until interrupted"
+    )
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between redraws with --stream (default: 2)")
+    add_common_args(parser)
+    args = parser.parse_args()
+    apply_common_args(args)
+    if args.stream and args.format == "json":
+        parser.error("--stream prints continuously; use --format table or ndjson")
+
+    url, session = get_session()
+    import requests
+
+    targets = select_targets(args.host)
+
+    try:
+        containers, host_errors = running_containers(session, url, targets)
+        with Output(args.format) as out:
+            for host, error in host_errors:
+                out.emit({"host": host, "error": error})
+            if args.stream:
+                stream(args, session, url, containers, out)
+                return
+
+            start = time.monotonic()
+            samples, errors = sample_once(session, url, containers)
+            elapsed = time.monotonic() - start
+            ranked = top(samples, args.sort, args.top)
+            if not out.table:
+                emit_records(out, ranked)
+                for (host, name), error in errors:
+                    out.emit({"host": host, "container": name, "error": error})
+                return
+
+            print_table(ranked)
+            print()
+            for host, error in host_errors:
+                print(f"Warning: {host}: {error}")
+            for (host, name), error in errors:
+                print(f"Warning: {name} on {host}: {error}")
+            workers = min(concurrency(), len(containers)) or 1
+            print(
+                f"Summary: sampled {len(samples)}/{len(containers)} running container(s) "
+                f"in {elapsed:.1f}s ({workers} at a time), showing top {len(ranked)} by {METRIC_LABELS[args.sort]}"
+            )
+    except requests.RequestException as e:
+        print(f"Connection error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_skill(main)
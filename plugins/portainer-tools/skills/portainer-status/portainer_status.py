@@ -6,11 +6,25 @@ Environment: PORTAINER_TOKEN is required. PORTAINER_URL defaults to http://192.1
 """
 
 import argparse
+import queue
 import sys
+import time
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from portainer_common import ENDPOINTS, get_session
+from portainer_common import (
+    add_common_args,
+    apply_common_args,
+    events,
+    fan_out,
+    fetch_listing,
+    get_session,
+    host_choices,
+    host_timeout,
+    select_targets,
+)
+from portainer_common.agentd import run_skill
+from portainer_common.output import Output
 
 
 def format_ports(ports):
@@ -35,65 +49,152 @@ def format_ports(ports):
     return ", ".join(unique) if unique else "—"
 
 
+def port_records(ports):
+    """Published ports as sorted, de-duplicated dicts for JSON output."""
+    keys = {(p["PublicPort"], p.get("PrivatePort"), p.get("Type", "tcp")) for p in ports if p.get("PublicPort")}
+    return [{"public": pub, "private": priv, "type": ptype} for pub, priv, ptype in sorted(keys)]
+
+
+def describe_change(change):
+    """One line for a watch event: "docker01  grafana  running → exited (exit 137)"."""
+    host = change["host"]
+    if "error" in change:
+        return f"{host}  event stream lost: {change['error']} (reconnecting)"
+    if change.get("connected"):
+        return f"{host}  event stream reconnected"
+    if change["action"] in events.STRUCTURAL_ACTIONS:
+        return f"{host}  {change['name'] or change['id'][:12]}  {change['action']}"
+    line = f"{host}  {change['name']}  "
+    if change["state"] != change["previous_state"]:
+        line += f"{change['previous_state']} → {change['state']}"
+        if change["action"] == "die":
+            line += f" (exit {change['exit_code']})"
+    elif change["action"].startswith("health_status"):
+        line += f"health: {change['health']}"
+    else:
+        line += change["action"]
+    if change["action"] in ("start", "restart") and change["restarts"]:
+        line += f", restarts: {change['restarts']}"
+    return line
+
+
+def watch(watcher, changes, out):
+    """Print container changes as they arrive until interrupted."""
+    lost = set()
+    try:
+        while True:
+            change = changes.get()
+            if change.get("connected") and change["host"] not in lost:
+                continue
+            if "error" in change:
+                if change["host"] in lost:
+                    continue
+                lost.add(change["host"])
+            elif change.get("connected"):
+                lost.discard(change["host"])
+            if not out.table:
+                out.emit(change)
+                continue
+            stamp = time.strftime("%H:%M:%S", time.localtime(change.get("time") or time.time()))
+            print(f"{stamp}  {describe_change(change)}", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+
+
 def main():
     parser = argparse.ArgumentParser(prog="portainer-status", description="Show container status across Docker hosts")
-    parser.add_argument("host", nargs="?", default="all", choices=["all", "docker01", "docker02", "soho-nas"])
+    parser.add_argument("host", nargs="?", default="all", choices=host_choices(), metavar="HOST")
     parser.add_argument("--ports", action="store_true", help="Include port mappings in output")
+    parser.add_argument("--watch", action="store_true", help="Keep running and report state changes from Docker events")
+    add_common_args(parser)
     args = parser.parse_args()
+    apply_common_args(args)
+    if args.watch and args.format == "json":
+        parser.error("--watch streams changes; use --format table or ndjson")
+    if args.watch and (args.snapshot or args.snapshot_age is not None):
+        parser.error("--watch reads live state and cannot render from a snapshot")
 
     url, session = get_session()
+    import requests
 
-    if args.host == "all":
-        targets = ENDPOINTS
-    else:
-        targets = {args.host: ENDPOINTS[args.host]}
+    targets = select_targets(args.host)
+
+    if args.watch:
+        # The first report renders from the watcher's own listings, so the
+        # changes printed after it follow on from exactly that state.
+        changes = queue.Queue()
+        watcher = events.Watcher(url, session.headers["X-API-Key"], targets, on_change=changes.put).start()
+        events.activate(watcher)
+        watcher.wait_synced(host_timeout())
+
+    def fetch(host, eid):
+        return fetch_listing(session, url, eid, "containers")
 
     total_running = 0
     total_stopped = 0
     total_other = 0
 
     try:
-        for host, eid in targets.items():
-            resp = session.get(f"{url}/api/endpoints/{eid}/docker/containers/json?all=1")
-            if resp.status_code != 200:
-                print(f"=== {host} === (error: HTTP {resp.status_code})")
-                continue
-
-            containers = resp.json()
-            print(f"=== {host} ===")
-            if not containers:
-                print("  (no containers)")
-            else:
-                rows = []
-                for c in sorted(containers, key=lambda x: x["Names"][0]):
-                    name = c["Names"][0].lstrip("/")
-                    state = c["State"]
-                    status = c["Status"]
-                    port_str = format_ports(c.get("Ports", []))
-                    rows.append((name, state, status, port_str))
-                    if state == "running":
+        with Output(args.format) as out:
+            for host, _, containers, error in fan_out(fetch, targets, ordered=not out.streaming):
+                if error:
+                    if out.table:
+                        print(f"=== {host} === (error: {error})")
+                    out.emit({"host": host, "error": error})
+                    continue
+
+                for c in containers:
+                    if c["State"] == "running":
                         total_running += 1
-                    elif state in ("exited", "created"):
+                    elif c["State"] in ("exited", "created"):
                         total_stopped += 1
                     else:
                         total_other += 1
-
-                max_name = max(len(r[0]) for r in rows)
-                max_state = max(len(r[1]) for r in rows)
-                if args.ports:
-                    max_status = max(len(r[2]) for r in rows)
-                    for name, state, status, port_str in rows:
-                        print(f"  {name:<{max_name}}  {state:<{max_state}}  {status:<{max_status}}  {port_str}")
+                if not out.table:
+                    for c in sorted(containers, key=lambda x: x["Names"][0]):
+                        out.emit({
+                            "host": host,
+                            "name": c["Names"][0].lstrip("/"),
+                            "id": c["Id"],
+                            "state": c["State"],
+                            "status": c["Status"],
+                            "ports": port_records(c.get("Ports", [])),
+                        })
+                    continue
+
+                print(f"=== {host} ===")
+                if not containers:
+                    print("  (no containers)")
                 else:
-                    for name, state, status, _ in rows:
-                        print(f"  {name:<{max_name}}  {state:<{max_state}}  {status}")
-            print()
+                    rows = []
+                    for c in sorted(containers, key=lambda x: x["Names"][0]):
+                        name = c["Names"][0].lstrip("/")
+                        rows.append((name, c["State"], c["Status"], format_ports(c.get("Ports", []))))
+
+                    max_name = max(len(r[0]) for r in rows)
+                    max_state = max(len(r[1]) for r in rows)
+                    if args.ports:
+                        max_status = max(len(r[2]) for r in rows)
+                        for name, state, status, port_str in rows:
+                            print(f"  {name:<{max_name}}  {state:<{max_state}}  {status:<{max_status}}  {port_str}")
+                    else:
+                        for name, state, status, _ in rows:
+                            print(f"  {name:<{max_name}}  {state:<{max_state}}  {status}")
+                print()
 
-        print(f"Summary: {total_running} running, {total_stopped} stopped, {total_other} other")
+            if out.table:
+                print(f"Summary: {total_running} running, {total_stopped} stopped, {total_other} other")
     except requests.RequestException as e:
         print(f"Connection error: {e}", file=sys.stderr)
         sys.exit(1)
 
+    if args.watch:
+        if out.table:
+            print("\nWatching for changes (Ctrl-C to stop)...", flush=True)
+        watch(watcher, changes, out)
+
 
 if __name__ == "__main__":
-    main()
+    run_skill(main)
@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 """Manage Docker volumes across Portainer-managed hosts.
 
+``usage`` reports disk usage from Docker's ``/system/df``: one request per
+host, made concurrently, however many volumes, images or cache entries
+there are.
+
 Requires: requests
 Environment: PORTAINER_TOKEN is required. PORTAINER_URL defaults to http://192.168.10.12:9000.
 """
@@ -9,52 +13,158 @@ import argparse
 import sys
 from pathlib import Path
 
-import requests
-
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from portainer_common import ENDPOINTS, get_session
+from portainer_common import (
+    add_common_args,
+    apply_common_args,
+    cache,
+    endpoints,
+    fan_out,
+    fetch_listing,
+    find_by_name,
+    get_json,
+    get_session,
+    host_choices,
+    non_negative_int,
+    select_targets,
+)
+from portainer_common.agentd import run_skill
+from portainer_common.output import Output, format_bytes
+
+# /system/df sections each usage report needs; containers are fetched to name the users of each volume.
+DF_TYPES = {"volumes": ("volume", "container"), "images": ("image",), "build-cache": ("build-cache",)}
+USAGE_LABELS = {"volumes": "volumes", "images": "images", "build-cache": "build cache entries"}
+RECLAIMABLE_LABELS = {"volumes": "orphaned", "images": "unused", "build-cache": "reclaimable"}
+# (item column, per-host count column) in the usage tables.
+USAGE_HEADERS = {"volumes": ("VOLUME", "VOLUMES"), "images": ("IMAGE", "IMAGES"), "build-cache": ("ENTRY", "ENTRIES")}
+
+
+def disk_usage(session, url, eid, kind):
+    """One ``/system/df`` call, limited to the sections ``kind`` needs.
+
+    Daemons older than API 1.42 ignore ``type`` and return every section.
+    """
+    params = [("type", t) for t in DF_TYPES[kind]]
+    return get_json(session, url, f"/api/endpoints/{eid}/docker/system/df", params=params)
+
+
+def volume_usage(df):
+    """Volume records from a df payload, with the containers that mount each one.
+
+    Size is None when the driver does not report it. A volume is orphaned
+    when no container, running or not, references it.
+    """
+    users = {}
+    for c in df.get("Containers") or []:
+        for mount in c.get("Mounts") or []:
+            if mount.get("Type") == "volume" and mount.get("Name"):
+                users.setdefault(mount["Name"], []).append(c["Names"][0].lstrip("/"))
+    for v in df.get("Volumes") or []:
+        data = v.get("UsageData") or {}
+        size = data.get("Size", -1)
+        containers = sorted(users.get(v["Name"], []))
+        refs = data.get("RefCount", -1)
+        refs = refs if refs >= 0 else len(containers)
+        yield {
+            "name": v["Name"],
+            "size": size if size >= 0 else None,
+            "ref_count": refs,
+            "containers": containers,
+            "reclaimable": refs == 0,
+        }
+
+
+def image_usage(df):
+    """Image records; an image no container uses is reclaimable, less the layers it shares."""
+    for img in df.get("Images") or []:
+        tags = [t for t in img.get("RepoTags") or () if t != "<none>:<none>"]
+        containers = img.get("Containers", -1)
+        yield {
+            "name": tags[0] if tags else f"<none>@{img['Id'].split(':')[-1][:12]}",
+            "size": img.get("Size", 0),
+            "shared_size": max(img.get("SharedSize", 0), 0),
+            "containers": containers if containers >= 0 else None,
+            "reclaimable": containers == 0,
+        }
+
+
+def build_cache_usage(df):
+    for entry in df.get("BuildCache") or []:
+        yield {
+            "name": entry.get("Description") or entry["ID"][:12],
+            "type": entry.get("Type", ""),
+            "size": entry.get("Size", 0),
+            "last_used": entry.get("LastUsedAt"),
+            "in_use": bool(entry.get("InUse")),
+            "shared": bool(entry.get("Shared")),
+            "reclaimable": not entry.get("InUse") and not entry.get("Shared"),
+        }
+
+
+USAGE_RECORDS = {"volumes": volume_usage, "images": image_usage, "build-cache": build_cache_usage}
+
+
+def reclaimable_size(record):
+    if not record["reclaimable"]:
+        return 0
+    return (record["size"] or 0) - record.get("shared_size", 0)
+
+
+def usage_detail(kind, record):
+    """The last table column: who uses the item, or that nothing does."""
+    if kind == "volumes":
+        return ", ".join(record["containers"]) or "(orphaned)"
+    if kind == "images":
+        if record["containers"] is None:
+            return "—"
+        return f"{record['containers']} container(s)" if record["containers"] else "(unused)"
+    if record["in_use"]:
+        return "in use"
+    return "shared" if record["shared"] else "(reclaimable)"
+
+
+def print_rows(headers, rows):
+    widths = [max(len(h), *(len(row[i]) for row in rows)) for i, h in enumerate(headers)]
+    for row in (headers, *rows):
+        print("  ".join(f"{cell:<{w}}" for cell, w in zip(row, widths)).rstrip())
 
 
 def find_volume(session, url, name, endpoint_ids):
-    matches = []
-    host_by_id = {v: k for k, v in ENDPOINTS.items()}
-    for eid in endpoint_ids:
-        resp = session.get(f"{url}/api/endpoints/{eid}/docker/volumes")
-        if resp.status_code != 200:
-            continue
-        for v in resp.json().get("Volumes", []) or []:
-            vname = v["Name"]
-            if name == vname or name in vname:
-                matches.append((eid, vname, host_by_id.get(eid, f"endpoint-{eid}")))
-    return matches
+    host_by_id = {v: k for k, v in endpoints().items()}
+    targets = {host_by_id.get(eid, f"endpoint-{eid}"): eid for eid in endpoint_ids}
+    return [(eid, vname, host) for host, eid, vname, _ in find_by_name(session, url, "volumes", name, targets)]
 
 
-def cmd_list(args, session, url):
-    if args.host == "all":
-        targets = ENDPOINTS
-    else:
-        targets = {args.host: ENDPOINTS[args.host]}
+def cmd_list(args, session, url, out):
+    targets = select_targets(args.host)
+
+    def fetch(host, eid):
+        return fetch_listing(session, url, eid, "volumes")
 
     total = 0
-    for host, eid in targets.items():
-        resp = session.get(f"{url}/api/endpoints/{eid}/docker/volumes")
-        if resp.status_code != 200:
-            print(f"=== {host} === (error: HTTP {resp.status_code})")
+    for host, _, body, error in fan_out(fetch, targets, ordered=not out.streaming):
+        if error:
+            if out.table:
+                print(f"=== {host} === (error: {error})")
+            out.emit({"host": host, "error": error})
+            continue
+
+        volumes = body.get("Volumes", []) or []
+        rows = []
+        for v in sorted(volumes, key=lambda x: x["Name"]):
+            name = v["Name"]
+            driver = v.get("Driver", "—")
+            mountpoint = v.get("Mountpoint", "—")
+            rows.append((name, driver, mountpoint))
+            out.emit({"host": host, "name": name, "driver": driver, "mountpoint": mountpoint})
+            total += 1
+        if not out.table:
             continue
 
-        volumes = resp.json().get("Volumes", []) or []
         print(f"=== {host} ===")
-        if not volumes:
+        if not rows:
             print("  (no volumes)")
         else:
-            rows = []
-            for v in sorted(volumes, key=lambda x: x["Name"]):
-                name = v["Name"]
-                driver = v.get("Driver", "—")
-                mountpoint = v.get("Mountpoint", "—")
-                rows.append((name, driver, mountpoint))
-                total += 1
-
             max_name = max(len(r[0]) for r in rows)
             max_driver = max(len(r[1]) for r in rows)
             print(f"  {'NAME':<{max_name}}  {'DRIVER':<{max_driver}}  MOUNTPOINT")
@@ -62,18 +172,16 @@ def cmd_list(args, session, url):
                 print(f"  {name:<{max_name}}  {driver:<{max_driver}}  {mountpoint}")
         print()
 
-    print(f"Summary: {total} volumes across {len(targets)} host(s)")
+    if out.table:
+        print(f"Summary: {total} volumes across {len(targets)} host(s)")
 
 
-def cmd_inspect(args, session, url):
+def cmd_inspect(args, session, url, out):
     if not args.name:
         print("Error: Volume name is required for inspect.", file=sys.stderr)
         sys.exit(1)
 
-    if args.host and args.host != "all":
-        endpoint_ids = [ENDPOINTS[args.host]]
-    else:
-        endpoint_ids = list(ENDPOINTS.values())
+    endpoint_ids = list(select_targets(args.host).values())
 
     matches = find_volume(session, url, args.name, endpoint_ids)
 
@@ -98,6 +206,27 @@ def cmd_inspect(args, session, url):
         sys.exit(1)
 
     vol = resp.json()
+    usage = vol.get("UsageData")
+    if not usage:
+        # Docker only computes sizes for /system/df; the volume is in it if it still exists.
+        df = disk_usage(session, url, eid, "volumes")
+        usage = next((v.get("UsageData") for v in df.get("Volumes") or [] if v["Name"] == vname), None)
+    if not out.table:
+        sized = usage and usage.get("Size", -1) >= 0
+        out.emit({
+            "host": host,
+            "name": vol["Name"],
+            "driver": vol.get("Driver"),
+            "mountpoint": vol.get("Mountpoint"),
+            "scope": vol.get("Scope"),
+            "created": vol.get("CreatedAt"),
+            "labels": vol.get("Labels") or {},
+            "options": vol.get("Options") or {},
+            "size": usage["Size"] if sized else None,
+            "ref_count": usage.get("RefCount", 0) if sized else None,
+        })
+        return
+
     print(f"=== Volume: {vol['Name']} ({host}) ===")
     print(f"Driver:     {vol.get('Driver', '—')}")
     print(f"Mountpoint: {vol.get('Mountpoint', '—')}")
@@ -116,7 +245,6 @@ def cmd_inspect(args, session, url):
         for k, v in sorted(options.items()):
             print(f"  {k}={v}")
 
-    usage = vol.get("UsageData")
     if usage and usage.get("Size", -1) >= 0:
         size_mb = usage["Size"] / (1024 * 1024)
         ref_count = usage.get("RefCount", 0)
@@ -124,7 +252,74 @@ def cmd_inspect(args, session, url):
         print(f"Ref count:  {ref_count}")
 
 
-def cmd_create(args, session, url):
+def cmd_usage(args, session, url, out):
+    targets = select_targets(args.host)
+    kind = args.type
+
+    def fetch(host, eid):
+        return list(USAGE_RECORDS[kind](disk_usage(session, url, eid, kind)))
+
+    records = []
+    totals = []
+    errors = []
+    for host, _, items, error in fan_out(fetch, targets):
+        if error:
+            errors.append((host, error))
+            out.emit({"host": host, "error": error})
+            continue
+        records.extend({"host": host, **r} for r in items)
+        reclaimable = [r for r in items if r["reclaimable"]]
+        totals.append({
+            "host": host,
+            "count": len(items),
+            "size": sum(r["size"] or 0 for r in items),
+            "reclaimable_count": len(reclaimable),
+            "reclaimable_size": sum(reclaimable_size(r) for r in reclaimable),
+        })
+
+    shown = [r for r in records if r["reclaimable"]] if args.reclaimable else records
+    ranked = sorted(shown, key=lambda r: (-(r["size"] or 0), r["host"], r["name"]))
+    if args.top:
+        ranked = ranked[: args.top]
+    if not out.table:
+        for r in ranked:
+            out.emit({"kind": kind, **r})
+        for t in totals:
+            out.emit({"kind": kind, "total": True, **t})
+        return
+
+    label = USAGE_LABELS[kind]
+    flag = RECLAIMABLE_LABELS[kind]
+    print(f"=== Top {len(ranked)} {flag + ' ' if args.reclaimable else ''}{label} by size ===")
+    if not ranked:
+        print(f"  (no {label})")
+    else:
+        headers = ("HOST", USAGE_HEADERS[kind][0], "SIZE", "USED BY")
+        rows = [
+            (r["host"], r["name"], format_bytes(r["size"]) if r["size"] is not None else "—", usage_detail(kind, r))
+            for r in ranked
+        ]
+        print_rows(headers, rows)
+    print()
+    print("=== Per host ===")
+    if totals:
+        headers = ("HOST", USAGE_HEADERS[kind][1], "SIZE", flag.upper(), "RECLAIMABLE")
+        rows = [
+            (t["host"], str(t["count"]), format_bytes(t["size"]), str(t["reclaimable_count"]), format_bytes(t["reclaimable_size"]))
+            for t in totals
+        ]
+        print_rows(headers, rows)
+    print()
+    for host, error in errors:
+        print(f"Warning: {host}: {error}")
+    print(
+        f"Summary: {sum(t['count'] for t in totals)} {label}, {format_bytes(sum(t['size'] for t in totals))} "
+        f"across {len(totals)} host(s); {sum(t['reclaimable_count'] for t in totals)} {flag}, "
+        f"{format_bytes(sum(t['reclaimable_size'] for t in totals))} reclaimable"
+    )
+
+
+def cmd_create(args, session, url, out):
     if not args.name:
         print("Error: Volume name is required for create.", file=sys.stderr)
         sys.exit(1)
@@ -132,7 +327,7 @@ def cmd_create(args, session, url):
         print("Error: --host is required for create.", file=sys.stderr)
         sys.exit(1)
 
-    eid = ENDPOINTS[args.host]
+    eid = endpoints()[args.host]
     body = {"Name": args.name, "Driver": args.driver or "local"}
     if args.opt:
         driver_opts = {}
@@ -145,8 +340,11 @@ def cmd_create(args, session, url):
         body["DriverOpts"] = driver_opts
 
     resp = session.post(f"{url}/api/endpoints/{eid}/docker/volumes/create", json=body)
+    cache.invalidate(url, eid, ["volumes"])
     if resp.status_code == 201 or (resp.status_code == 200 and resp.json().get("Name")):
-        print(f"Volume '{args.name}' created on {args.host}.")
+        out.emit({"host": args.host, "name": args.name, "result": "created"})
+        if out.table:
+            print(f"Volume '{args.name}' created on {args.host}.")
     else:
         print(f"Error: HTTP {resp.status_code}", file=sys.stderr)
         if resp.text:
@@ -154,7 +352,7 @@ def cmd_create(args, session, url):
         sys.exit(1)
 
 
-def cmd_remove(args, session, url):
+def cmd_remove(args, session, url, out):
     if not args.name:
         print("Error: Volume name is required for remove.", file=sys.stderr)
         sys.exit(1)
@@ -162,7 +360,7 @@ def cmd_remove(args, session, url):
         print("Error: --host is required for remove (safety: no cross-host matching for destructive ops).", file=sys.stderr)
         sys.exit(1)
 
-    eid = ENDPOINTS[args.host]
+    eid = endpoints()[args.host]
     matches = find_volume(session, url, args.name, [eid])
 
     if not matches:
@@ -180,8 +378,11 @@ def cmd_remove(args, session, url):
 
     _, vname, host = matches[0]
     resp = session.delete(f"{url}/api/endpoints/{eid}/docker/volumes/{vname}")
+    cache.invalidate(url, eid, ["volumes"])
     if resp.status_code == 204:
-        print(f"Volume '{vname}' removed from {host}.")
+        out.emit({"host": host, "name": vname, "result": "removed"})
+        if out.table:
+            print(f"Volume '{vname}' removed from {host}.")
     else:
         print(f"Error: HTTP {resp.status_code}", file=sys.stderr)
         if resp.text:
@@ -191,23 +392,38 @@ def cmd_remove(args, session, url):
 
 def main():
     parser = argparse.ArgumentParser(prog="portainer-volumes", description="Manage Docker volumes")
-    parser.add_argument("action", choices=["list", "inspect", "create", "remove"])
+    parser.add_argument("action", choices=["list", "inspect", "create", "remove", "usage"])
     parser.add_argument("name", nargs="?", help="Volume name (required for inspect/create/remove)")
-    parser.add_argument("--host", default="all", choices=["all", "docker01", "docker02", "soho-nas"])
+    parser.add_argument("--host", default="all", choices=host_choices(), metavar="HOST")
     parser.add_argument("--driver", default="local", help="Volume driver (default: local)")
     parser.add_argument("--opt", action="append", help="Driver options as key=value (repeatable)")
+    parser.add_argument(
+        "--type", choices=list(DF_TYPES), default="volumes", help="usage: what to report on (default: volumes)"
+    )
+    parser.add_argument(
+        "--top", type=non_negative_int, default=10, metavar="N", help="usage: show the N largest, 0 for all (default: 10)"
+    )
+    parser.add_argument(
+        "--reclaimable", action="store_true", help="usage: only orphaned volumes, unused images or reclaimable cache"
+    )
+    add_common_args(parser)
     args = parser.parse_args()
+    apply_common_args(args)
+    if args.action == "usage" and args.name:
+        parser.error("usage takes no volume name; use --host to pick hosts")
 
     url, session = get_session()
+    import requests
 
-    handlers = {"list": cmd_list, "inspect": cmd_inspect, "create": cmd_create, "remove": cmd_remove}
+    handlers = {"list": cmd_list, "inspect": cmd_inspect, "create": cmd_create, "remove": cmd_remove, "usage": cmd_usage}
 
     try:
-        handlers[args.action](args, session, url)
+        with Output(args.format) as out:
+            handlers[args.action](args, session, url, out)
     except requests.RequestException as e:
         print(f"Connection error: {e}", file=sys.stderr)
         sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
+    run_skill(main)
@@ -1,26 +1,43 @@
-"""Shared configuration and helpers for all Portainer skills."""
+"""Shared configuration and helpers for all Portainer skills.
 
-import os
-import sys
-from pathlib import Path
+``requests`` and ``concurrent.futures`` are imported on first use, so paths
+that exit early (``--help``, a missing token) or that are forwarded to
+portainer-agentd stay cheap to start. See config.py for where settings come from.
+"""
 
-import requests
-from dotenv import load_dotenv
+import json
+import math
+import re
+import sys
+import time
+from collections import namedtuple
 
-# Load config: skill-local .env first, then user-level ~/.config/portainer/.env.
-# Already-set env vars (from ~/.profile or system) take highest priority since
-# load_dotenv does not overwrite existing values.
-load_dotenv(Path(__file__).resolve().parent / ".env")
-load_dotenv(Path.home() / ".config" / "portainer" / ".env")
+from . import cache, config, events, index, output, registry, snapshot
 
 DEFAULT_URL = "http://192.168.10.12:9000"
-ENDPOINTS = {"docker01": 7, "docker02": 8, "soho-nas": 9}
+
+# Fan-out tuning: how many hosts are queried at once, and how long a single
+# host may take before it is reported as an error row.
+DEFAULT_CONCURRENCY = 8
+DEFAULT_HOST_TIMEOUT = 15.0
+
+# Listing payloads served through the on-disk cache, by resource kind.
+LISTING_PATHS = {
+    "containers": "/containers/json?all=1",
+    "networks": "/networks",
+    "volumes": "/volumes",
+}
+
+HostResult = namedtuple("HostResult", ["host", "eid", "value", "error"])
+
+# Sessions are reused for the life of the process, which matters in the daemon.
+_sessions = {}
 
 
 def get_session():
     """Return (url, authenticated_session). Exits on missing token."""
-    url = os.environ.get("PORTAINER_URL", DEFAULT_URL)
-    token = os.environ.get("PORTAINER_TOKEN")
+    url = config.env("PORTAINER_URL", DEFAULT_URL)
+    token = config.env("PORTAINER_TOKEN")
     if not token:
         print("Error: PORTAINER_TOKEN not set.", file=sys.stderr)
         print("Configure it in one of these locations:", file=sys.stderr)
@@ -28,6 +45,306 @@ def get_session():
         print("  2. skills/portainer_common/.env  (project-level)", file=sys.stderr)
         print("  3. export PORTAINER_TOKEN=ptr_...  (in ~/.profile)", file=sys.stderr)
         sys.exit(1)
-    session = requests.Session()
-    session.headers["X-API-Key"] = token
-    return url, session
+    key = (url, token)
+    if key not in _sessions:
+        with config.timed("requests"):
+            from . import transport
+        _sessions[key] = transport.new_session(token)
+    return url, _sessions[key]
+
+
+def host_timeout():
+    """Per-host timeout in seconds (PORTAINER_HOST_TIMEOUT)."""
+    return float(config.env("PORTAINER_HOST_TIMEOUT", DEFAULT_HOST_TIMEOUT))
+
+
+def concurrency():
+    """Maximum number of hosts queried at once (PORTAINER_CONCURRENCY)."""
+    return max(1, int(config.env("PORTAINER_CONCURRENCY", DEFAULT_CONCURRENCY)))
+
+
+def endpoints():
+    """{host: endpoint_id} for every Docker endpoint in Portainer (see registry.py)."""
+    return registry.endpoints()
+
+
+def host_choices(include_all=True):
+    """argparse ``choices`` for a host argument; pass with ``metavar="HOST"``."""
+    return registry.HostChoices(include_all)
+
+
+def select_targets(host):
+    """Map a ``host`` argument (a host name or "all"/None) to {host: endpoint_id}.
+
+    "all" means every endpoint matching --tag/--group, minus those Portainer
+    reports as down. When rendering from a snapshot, its endpoints are used.
+    """
+    snap = snapshot.active()
+    if snap is not None:
+        known = {e["host"]: int(eid) for eid, e in snap["endpoints"].items()}
+        if host and host != "all" and host in known:
+            return {host: known[host]}
+        if not host or host == "all":
+            return known
+    if host and host != "all":
+        return {host: endpoints()[host]}
+    targets, down = registry.select_all()
+    if down:
+        print(f"(skipping {len(down)} endpoint(s) Portainer reports as down: {', '.join(down)})", file=sys.stderr)
+    elif not targets and registry.filtering():
+        print("(no endpoints match --tag/--group)", file=sys.stderr)
+    return targets
+
+
+def describe_error(exc):
+    """Short, single-line description of a per-host failure."""
+    from concurrent.futures import TimeoutError as FutureTimeout
+
+    import requests
+
+    from .transport import CircuitOpenError
+
+    if isinstance(exc, CircuitOpenError):
+        return f"host unreachable ({exc})"
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return f"HTTP {exc.response.status_code}"
+    if isinstance(exc, (requests.Timeout, FutureTimeout)):
+        return "timed out"
+    if isinstance(exc, requests.ConnectionError):
+        return "connection failed"
+    return str(exc) or type(exc).__name__
+
+
+def fan_out(func, targets, timeout=None, max_workers=None, ordered=True):
+    """Run ``func(host, eid)`` for every target concurrently.
+
+    Yields a HostResult per target in the order of ``targets``, as soon as
+    that host (and every host before it) has finished, so output stays in a
+    stable host order while wall time tracks the slowest host rather than
+    the sum. With ``ordered=False`` results are yielded as each host
+    finishes instead. Exceptions raised by ``func`` and hosts that exceed
+    ``timeout`` are reported in ``error`` instead of propagating.
+    """
+    items = list(targets.items())
+    if not items:
+        return
+    timeout = host_timeout() if timeout is None else timeout
+    workers = min(max_workers or concurrency(), len(items))
+    # Hosts beyond the pool size start in later waves; give each wave its own budget.
+    deadline = time.monotonic() + timeout * math.ceil(len(items) / workers)
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [pool.submit(func, host, eid) for host, eid in items]
+        done = zip(items, futures) if ordered else _as_completed(items, futures, deadline)
+        for (host, eid), future in done:
+            try:
+                value = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except Exception as e:
+                future.cancel()
+                yield HostResult(host, eid, None, describe_error(e))
+            else:
+                yield HostResult(host, eid, value, None)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _as_completed(items, futures, deadline):
+    """Yield (item, future) pairs as futures finish; stragglers come last, unfinished."""
+    from concurrent.futures import FIRST_COMPLETED, wait
+
+    pending = dict(zip(futures, items))
+    while pending:
+        finished, _ = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not finished:
+            break
+        for future in finished:
+            yield pending.pop(future), future
+    for future, item in pending.items():
+        yield item, future
+
+
+def get_json(session, url, path, **kwargs):
+    """GET ``url + path`` and return the decoded JSON body.
+
+    Raises requests.HTTPError on a non-200 response so fan_out() can turn it
+    into an error row. The session supplies timeouts and retries (see
+    transport.py) unless the caller passes its own.
+    """
+    import requests
+
+    resp = session.get(f"{url}{path}", **kwargs)
+    if resp.status_code != 200:
+        raise requests.HTTPError(f"HTTP {resp.status_code}", response=resp)
+    return resp.json()
+
+
+def fetch_listing(session, url, eid, kind):
+    """Return the listing of ``kind`` on endpoint ``eid``.
+
+    Served, in order of preference, from an active snapshot, a live event
+    watcher in this process, or the listing cache when fresh.
+    """
+    data = _stored_listing(url, eid, kind)
+    if data is None:
+        data = get_json(session, url, f"/api/endpoints/{eid}/docker{LISTING_PATHS[kind]}")
+        cache.store(url, eid, kind, data)
+    return data
+
+
+def _stored_listing(url, eid, kind):
+    data = snapshot.listing(eid, kind)
+    if data is None:
+        data = events.listing(url, eid, kind)
+    if data is None:
+        data = cache.load(url, eid, kind)
+    return data
+
+
+def listing_items(kind, data):
+    """Unwrap a listing payload into its list of objects."""
+    if kind == "volumes":
+        return (data or {}).get("Volumes") or []
+    return data or []
+
+
+def object_name(kind, obj):
+    if kind == "containers":
+        return obj["Names"][0].lstrip("/")
+    return obj["Name"]
+
+
+def _name_matches(kind, data, name, fold=False):
+    key = str.casefold if fold else str
+    needle = key(name)
+    for obj in listing_items(kind, data):
+        oname = object_name(kind, obj)
+        if needle in key(oname):
+            yield oname, obj
+
+
+def find_by_name(session, url, kind, name, targets):
+    """Resolve ``name`` to (host, eid, name, obj) matches across ``targets``.
+
+    A snapshot or fresh cached listing answers without any request. Otherwise the name is
+    pushed to Docker as a ``filters`` query, so only matching objects cross the
+    wire; the container filter is a regex, hence the escaping. Only when no
+    host has a match does it fall back to full listings with a
+    case-insensitive match.
+    """
+    # Docker's name filter is a substring match for networks and volumes.
+    pattern = re.escape(name) if kind == "containers" else name
+    params = {"filters": json.dumps({"name": [pattern]})}
+
+    def filtered(host, eid):
+        data = _stored_listing(url, eid, kind)
+        if data is None:
+            data = get_json(session, url, f"/api/endpoints/{eid}/docker{LISTING_PATHS[kind]}", params=params)
+        return list(_name_matches(kind, data, name))
+
+    def fuzzy(host, eid):
+        return list(_name_matches(kind, fetch_listing(session, url, eid, kind), name, fold=True))
+
+    for lookup in (filtered, fuzzy):
+        matches = []
+        for host, eid, found, error in fan_out(lookup, targets):
+            if not error:
+                matches.extend((host, eid, oname, obj) for oname, obj in found)
+        if matches:
+            break
+    return matches
+
+
+def resolve_container(session, url, name, targets):
+    """Resolve ``name`` to [(host, eid, container_id, container_name)].
+
+    Served from the persistent container index (see portainer_common.index),
+    so the common case costs no request at all. On a miss the index is
+    brought up to date from Docker events before giving up. ``name`` may
+    also be a short ID, a compose service, or "project/service".
+    """
+    host_by_eid = {eid: host for host, eid in targets.items()}
+    idx = index.ContainerIndex(url)
+    index.sync(idx, session, url, targets, force=not cache.reading())
+    found = idx.lookup(name, targets.values())
+    if not found and cache.reading():
+        index.sync(idx, session, url, targets, force=True)
+        found = idx.lookup(name, targets.values())
+    return [(host_by_eid[eid], eid, e["id"], e["name"]) for eid, e in found]
+
+
+def select_containers(session, url, targets, predicate):
+    """Return [(host, eid, container_id, container_name)] for every indexed
+    container on ``targets`` whose index entry satisfies ``predicate``.
+
+    Entries are dicts with "id", "name", "project" and "service" keys.
+    """
+    idx = index.ContainerIndex(url)
+    index.sync(idx, session, url, targets, force=not cache.reading())
+    selected = []
+    for host, eid in targets.items():
+        ep = idx.endpoints.get(str(eid)) or {"containers": []}
+        for e in sorted(ep["containers"], key=lambda e: e["name"]):
+            if predicate(e):
+                selected.append((host, eid, e["id"], e["name"]))
+    return selected
+
+
+def forget_endpoint(url, eid):
+    """Drop an endpoint's index entries after a lookup turned out to be stale."""
+    index.forget(url, eid)
+
+
+def positive_int(text):
+    """argparse type for counts that must be at least 1."""
+    return _int_at_least(text, 1)
+
+
+def non_negative_int(text):
+    """argparse type for counts where 0 has a meaning of its own, such as "all"."""
+    return _int_at_least(text, 0)
+
+
+def _int_at_least(text, minimum):
+    import argparse
+
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {text!r}") from None
+    if value < minimum:
+        raise argparse.ArgumentTypeError(f"must be at least {minimum}, got {value}")
+    return value
+
+
+def add_common_args(parser):
+    """Register flags shared by every skill."""
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the local listing cache")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached listings and re-fetch them")
+    parser.add_argument("--format", choices=output.FORMATS, default="table", help="Output format (default: table)")
+    parser.add_argument("--snapshot", metavar="PATH", help="Render from this inventory snapshot file")
+    parser.add_argument(
+        "--snapshot-age", type=float, metavar="SECONDS", help="Render from the newest snapshot this recent, if any"
+    )
+    parser.add_argument("--tag", action="append", help="With all hosts, only endpoints with this Portainer tag (repeatable)")
+    parser.add_argument("--group", action="append", help="With all hosts, only endpoints in this Portainer group (repeatable)")
+
+
+def apply_common_args(args):
+    cache.configure(no_cache=args.no_cache, refresh=args.refresh)
+    registry.configure(tags=args.tag, groups=args.group, refresh=not cache.reading())
+    snap = None
+    if args.snapshot:
+        try:
+            snap = snapshot.load(args.snapshot)
+        except ValueError as e:
+            print(f"Error: Cannot use snapshot: {e}", file=sys.stderr)
+            sys.exit(1)
+    elif args.snapshot_age is not None and cache.reading():
+        snap = snapshot.latest(config.env("PORTAINER_URL", DEFAULT_URL), args.snapshot_age)
+    # Always (re)set it: the daemon runs many commands in one process.
+    snapshot.activate(snap)
+    if snap is not None:
+        print(f"(using inventory snapshot from {time.time() - snap['taken_at']:.0f}s ago)", file=sys.stderr)
@@ -0,0 +1,142 @@
+"""Optional local daemon that runs skill commands in a warm process.
+
+Every skill invocation is otherwise a fresh interpreter: imports, .env
+parsing and a new TCP (and TLS) connection to Portainer each time. The daemon
+(``portainer-agentd``) listens on a Unix socket, keeps one pooled session per
+(URL, token) and an in-memory listing cache, and runs the skill's ``main()``
+in-process, streaming its stdout/stderr back to the client.
+
+This module is the client side. Skills call :func:`run_skill`, which
+forwards to the daemon when its socket answers and otherwise runs the command
+directly. Set PORTAINER_AGENTD=0 to never forward. Commands are served one at
+a time, so long-running streams (``--follow``, ``--watch``) always run
+directly. The server lives in skills/portainer-agentd/.
+
+The client runs before anything else, so it reads its settings from the
+environment only, never from the .env files.
+"""
+
+import atexit
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+
+from . import config, trace
+
+DEFAULT_IDLE_TIMEOUT = 1800.0
+
+# Flags that keep a command running indefinitely; those never go through the daemon.
+STREAMING_FLAGS = ("--follow", "-f", "--watch", "--stream")
+
+# Environment forwarded from the client and applied for the duration of a command.
+FORWARDED_ENV_PREFIXES = ("PORTAINER_",)
+FORWARDED_ENV = ("COMPOSE_ROOT",)
+
+
+def socket_path():
+    if "PORTAINER_AGENTD_SOCKET" in os.environ:
+        return Path(os.environ["PORTAINER_AGENTD_SOCKET"])
+    cache_dir = os.environ.get("PORTAINER_CACHE_DIR", Path.home() / ".cache" / "portainer")
+    return Path(cache_dir) / "agentd.sock"
+
+
+def pid_path():
+    return socket_path().with_suffix(".pid")
+
+
+def forwarded(name):
+    """True if environment variable ``name`` is taken from the client rather than the daemon."""
+    return name.startswith(FORWARDED_ENV_PREFIXES) or name in FORWARDED_ENV
+
+
+def _forwarded_env():
+    return {k: v for k, v in os.environ.items() if forwarded(k)}
+
+
+def forward(skill, argv):
+    """Run ``skill`` with ``argv`` in the daemon, relaying its output.
+
+    Returns the command's exit code, or None if no daemon is reachable (the
+    caller should then run the command itself).
+    """
+    path = socket_path()
+    if not path.exists():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(path))
+        request = {"skill": skill, "argv": argv, "cwd": os.getcwd(), "env": _forwarded_env()}
+        sock.sendall(json.dumps(request).encode() + b"\n")
+    except OSError:
+        sock.close()
+        return None
+    streams = {1: sys.stdout, 2: sys.stderr}
+    started = False
+    with sock, sock.makefile("r", encoding="utf-8") as replies:
+        try:
+            for line in replies:
+                msg = json.loads(line)
+                if "exit" in msg:
+                    return msg["exit"]
+                started = True
+                streams[msg["fd"]].write(msg["data"])
+                streams[msg["fd"]].flush()
+        except (ConnectionError, ValueError):
+            pass
+    # The daemon rejected the request (run directly) or went away mid-command.
+    return 1 if started else None
+
+
+def ping():
+    """True if a daemon is listening on the socket."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(socket_path()))
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def run_skill(main):
+    """Entry point for skill scripts: forward to the daemon, or run ``main()``."""
+    config.mark("imports")
+    if "--profile-startup" in sys.argv:
+        sys.argv.remove("--profile-startup")
+        os.environ["PORTAINER_PROFILE_STARTUP"] = "1"
+    if config.profiling():
+        atexit.register(config.report)
+    _trace_args()
+    argv = sys.argv[1:]
+    if os.environ.get("PORTAINER_AGENTD", "1") != "0" and not any(a in STREAMING_FLAGS for a in argv):
+        with config.timed("agentd"):
+            code = forward(Path(sys.argv[0]).stem, argv)
+        if code is not None:
+            sys.exit(code)
+    if trace.enabled():
+        trace.start()
+        atexit.register(trace.report)
+    main()
+
+
+def _trace_args():
+    """Turn --trace and --trace-file PATH into PORTAINER_TRACE* variables, which the daemon also sees."""
+    argv = sys.argv
+    if "--trace" in argv:
+        argv.remove("--trace")
+        os.environ["PORTAINER_TRACE"] = "1"
+    for i, arg in enumerate(argv):
+        if arg == "--trace-file" and i + 1 < len(argv):
+            path = argv[i + 1]
+            del argv[i : i + 2]
+        elif arg.startswith("--trace-file="):
+            path = arg.partition("=")[2]
+            del argv[i]
+        else:
+            continue
+        os.environ["PORTAINER_TRACE"] = "1"
+        os.environ["PORTAINER_TRACE_FILE"] = str(Path(path).resolve())
+        break
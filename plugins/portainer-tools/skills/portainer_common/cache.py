@@ -0,0 +1,116 @@
+"""On-disk TTL cache for Portainer listing payloads.
+
+Entries live under ~/.cache/portainer/ (override with PORTAINER_CACHE_DIR) and
+are keyed by (Portainer URL, endpoint id, resource kind). PORTAINER_CACHE_TTL
+sets the freshness window in seconds; 0 disables the cache.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from . import config
+
+DEFAULT_TTL = 30.0
+
+# Entries built from a listing, dropped along with it (see ports.py).
+DERIVED = {"containers": ("ports",)}
+
+_mode = {"read": True, "write": True}
+
+# In-process layer in front of the files, enabled by long-lived processes (the daemon).
+_memory = None
+
+
+def cache_dir():
+    return Path(config.env("PORTAINER_CACHE_DIR", Path.home() / ".cache" / "portainer"))
+
+
+def ttl():
+    return float(config.env("PORTAINER_CACHE_TTL", DEFAULT_TTL))
+
+
+def configure(no_cache=False, refresh=False):
+    """Set the cache mode for this process.
+
+    ``no_cache`` bypasses the cache entirely; ``refresh`` skips reads but still
+    stores the fresh payload for the next command.
+    """
+    _mode["read"] = not (no_cache or refresh)
+    _mode["write"] = not no_cache
+
+
+def enable_memory():
+    """Keep fresh entries in memory as well as on disk."""
+    global _memory
+    _memory = {}
+
+
+def reading():
+    """False when --refresh or --no-cache asked for live data."""
+    return _mode["read"]
+
+
+def writing():
+    """False when --no-cache asked not to store anything."""
+    return _mode["write"]
+
+
+def _path(url, eid, kind):
+    digest = hashlib.sha1(url.rstrip("/").encode()).hexdigest()[:12]
+    return cache_dir() / "listings" / digest / f"{eid}-{kind}.json"
+
+
+def load(url, eid, kind):
+    """Return the cached payload, or None on a miss or stale entry."""
+    entry = load_entry(url, eid, kind)
+    return entry[0] if entry is not None else None
+
+
+def load_entry(url, eid, kind):
+    """Return (payload, fetched_at) for a fresh entry, or None on a miss or stale entry."""
+    if not reading() or ttl() <= 0:
+        return None
+    path = _path(url, eid, kind)
+    entry = _memory.get(path) if _memory is not None else None
+    if entry is None:
+        try:
+            entry = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+    fetched_at = entry.get("fetched_at", 0)
+    if time.time() - fetched_at > ttl():
+        return None
+    return entry.get("data"), fetched_at
+
+
+def store(url, eid, kind, data, fetched_at=None):
+    """Cache ``data``; ``fetched_at`` dates an entry derived from an older payload (default: now)."""
+    if not _mode["write"] or ttl() <= 0:
+        return
+    path = _path(url, eid, kind)
+    entry = {"fetched_at": time.time() if fetched_at is None else fetched_at, "data": data}
+    if _memory is not None:
+        _memory[path] = entry
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(json.dumps(entry))
+        os.replace(tmp, path)
+    except OSError:
+        # The cache is an optimisation; never fail a command over it.
+        tmp.unlink(missing_ok=True)
+
+
+def invalidate(url, eid, kinds=("containers", "networks", "volumes")):
+    """Drop cached listings for an endpoint after a mutating call."""
+    for kind in [*kinds, *(d for k in kinds for d in DERIVED.get(k, ()))]:
+        path = _path(url, eid, kind)
+        if _memory is not None:
+            _memory.pop(path, None)
+        try:
+            path.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,76 @@
+"""Configuration loading and start-up timing.
+
+Settings come from the environment, topped up from two .env files: the
+skill-local ``portainer_common/.env`` first, then ``~/.config/portainer/.env``.
+Already-set variables (from ~/.profile or system) take priority since
+load_dotenv does not overwrite existing values. The files are read once, on
+the first setting lookup, so paths that never need one (``--help``, argument
+errors) do not import python-dotenv at all.
+
+Set PORTAINER_PROFILE_STARTUP=1, or pass ``--profile-startup`` to any skill,
+to print where start-up time went to stderr on exit. Times are measured from
+the first import of portainer_common; interpreter start-up comes before that.
+"""
+
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+STARTED = time.perf_counter()
+
+_loaded = False
+_timings = {}
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block to ``phase`` in the start-up report."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _timings[phase] = _timings.get(phase, 0.0) + time.perf_counter() - start
+
+
+def mark(phase):
+    """Record the time from start-up to now as ``phase``, once."""
+    _timings.setdefault(phase, time.perf_counter() - STARTED)
+
+
+def load():
+    """Load the .env files into os.environ, once per process."""
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    with timed("config"):
+        from dotenv import load_dotenv
+
+        load_dotenv(Path(__file__).resolve().parent / ".env")
+        load_dotenv(Path.home() / ".config" / "portainer" / ".env")
+
+
+def reload():
+    """Load the .env files again, filling in only variables that are now unset."""
+    global _loaded
+    _loaded = False
+    load()
+
+
+def env(name, default=None):
+    """Return setting ``name`` from the environment or the .env files."""
+    load()
+    return os.environ.get(name, default)
+
+
+def profiling():
+    return os.environ.get("PORTAINER_PROFILE_STARTUP", "0") not in ("", "0")
+
+
+def report():
+    """Print the start-up report to stderr."""
+    parts = [f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in _timings.items()]
+    parts.append(f"total {(time.perf_counter() - STARTED) * 1000:.1f} ms")
+    print("Startup: " + ", ".join(parts), file=sys.stderr)
@@ -0,0 +1,278 @@
+"""Live container state from Docker's event stream.
+
+A :class:`Watcher` keeps one long-lived ``/docker/events`` request open per
+endpoint and applies container events (start, die, health changes, restarts,
+renames, ...) to an in-memory :class:`ContainerModel`. Reports can then read
+container state from memory instead of re-listing every host.
+
+Each connection starts with a full container listing and then follows
+events from the moment of that listing, so nothing in between is lost. When
+a stream drops, the watcher reconnects with exponential backoff
+(PORTAINER_EVENTS_BACKOFF_MAX, default 30s) and resyncs from a fresh listing,
+since Docker only replays a limited window of past events.
+
+portainer-agentd runs a watcher for every endpoint while it is up; its
+listings then answer ``fetch_listing(..., "containers")`` directly.
+``portainer-status --watch`` runs one in the foreground.
+"""
+
+import copy
+import json
+import threading
+import time
+
+from . import config
+
+DEFAULT_BACKOFF_MAX = 30.0
+EVENT_FILTERS = json.dumps({"type": ["container"]})
+
+# Actions that add, remove or rename containers; the model then reloads the listing.
+STRUCTURAL_ACTIONS = {"create", "destroy", "rename"}
+
+_STATES = {"start": "running", "unpause": "running", "pause": "paused", "die": "exited", "oom": "exited"}
+
+# The watcher whose model answers listing lookups in this process, if any.
+_active = None
+
+
+def backoff_max():
+    return float(config.env("PORTAINER_EVENTS_BACKOFF_MAX", DEFAULT_BACKOFF_MAX))
+
+
+def _ago(seconds):
+    """Docker-style rough duration: "5 seconds", "About a minute", "3 hours"."""
+    seconds = int(max(seconds, 0))
+    if seconds < 1:
+        return "Less than a second"
+    if seconds < 60:
+        return f"{seconds} seconds"
+    if seconds < 120:
+        return "About a minute"
+    if seconds < 3600:
+        return f"{seconds // 60} minutes"
+    if seconds < 7200:
+        return "About an hour"
+    if seconds < 172800:
+        return f"{seconds // 3600} hours"
+    return f"{seconds // 86400} days"
+
+
+class ContainerModel:
+    """Thread-safe per-endpoint container state, shaped like Docker's listing.
+
+    Entries are the listing dicts themselves, with "State" kept current from
+    events. Each entry also carries "Health", "Restarts" and, once an event
+    has touched it, a "Since" timestamp from which "Status" is re-derived.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self.synced_at = {}
+
+    def load(self, eid, containers, synced_at):
+        """Replace an endpoint's state with a fresh listing."""
+        with self._lock:
+            previous = self._endpoints.get(eid, {})
+            entries = {}
+            for c in containers:
+                entry = dict(c)
+                entry["Restarts"] = previous.get(c["Id"], {}).get("Restarts", 0)
+                entry.setdefault("Health", listing_health(c.get("Status", "")))
+                entries[c["Id"]] = entry
+            self._endpoints[eid] = entries
+            self.synced_at[eid] = synced_at
+
+    def apply(self, eid, event):
+        """Apply one container event. Returns a change dict, or None if nothing visible changed.
+
+        Structural events (create, destroy, rename) return {"resync": True} so
+        the caller can reload the listing, which carries ports and labels.
+        """
+        action = event.get("Action") or event.get("status") or ""
+        actor = event.get("Actor") or {}
+        cid = actor.get("ID") or event.get("id")
+        attrs = actor.get("Attributes") or {}
+        when = event.get("timeNano", 0) / 1e9 or event.get("time") or time.time()
+        if action in STRUCTURAL_ACTIONS:
+            return {"resync": True, "action": action, "id": cid, "name": attrs.get("name", "")}
+        with self._lock:
+            entry = self._endpoints.get(eid, {}).get(cid)
+            if entry is None:
+                return None
+            self.synced_at[eid] = when
+            before = (entry["State"], entry["Health"], entry["Restarts"])
+            if action.startswith("health_status"):
+                entry["Health"] = action.partition(":")[2].strip()
+            elif action in _STATES:
+                if action == "start" and entry.get("LastAction") == "die":
+                    # die followed directly by start is the restart policy at work.
+                    entry["Restarts"] += 1
+                entry["State"] = _STATES[action]
+                entry["Since"] = when
+                if action == "die":
+                    entry["ExitCode"] = int(attrs.get("exitCode", 0))
+                    entry["Health"] = ""
+            elif action == "restart":
+                entry["Restarts"] += 1
+            entry["LastAction"] = action
+            after = (entry["State"], entry["Health"], entry["Restarts"])
+            if after == before:
+                return None
+            return {
+                "name": entry["Names"][0].lstrip("/"),
+                "id": cid,
+                "action": action,
+                "state": entry["State"],
+                "previous_state": before[0],
+                "health": entry["Health"],
+                "restarts": entry["Restarts"],
+                "exit_code": entry.get("ExitCode"),
+                "time": when,
+            }
+
+    def listing(self, eid, now=None):
+        """Return a listing-shaped copy of an endpoint's containers, or None if never loaded."""
+        now = time.time() if now is None else now
+        with self._lock:
+            entries = self._endpoints.get(eid)
+            if entries is None:
+                return None
+            result = copy.deepcopy(list(entries.values()))
+        for c in result:
+            since = c.pop("Since", None)
+            if since is None:
+                continue
+            if c["State"] == "running":
+                c["Status"] = f"Up {_ago(now - since)}"
+                if c["Health"]:
+                    c["Status"] += f" ({c['Health']})"
+            elif c["State"] == "paused":
+                c["Status"] = f"Up {_ago(now - since)} (Paused)"
+            else:
+                c["Status"] = f"Exited ({c.get('ExitCode', 0)}) {_ago(now - since)} ago"
+        return result
+
+
+def listing_health(status):
+    """Health from a listing's Status text: "healthy", "unhealthy", "starting" or ""."""
+    for health in ("healthy", "unhealthy", "health: starting"):
+        if f"({health})" in status:
+            return health.replace("health: ", "")
+    return ""
+
+
+class Watcher:
+    """Follow container events on several endpoints in background threads."""
+
+    def __init__(self, url, token, targets, on_change=None):
+        self.url = url
+        self.token = token
+        self.targets = dict(targets)
+        self.on_change = on_change
+        self.model = ContainerModel()
+        self.connected = {}
+        self._stop = threading.Event()
+        self._synced = {eid: threading.Event() for eid in self.targets.values()}
+        self._responses = {}
+        self._threads = []
+
+    def start(self):
+        for host, eid in self.targets.items():
+            thread = threading.Thread(target=self._run, args=(host, eid), name=f"events-{host}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for resp in list(self._responses.values()):
+            resp.close()
+
+    def wait_synced(self, timeout):
+        """Wait until every endpoint has loaded (or failed) its first listing."""
+        deadline = time.monotonic() + timeout
+        for synced in self._synced.values():
+            synced.wait(max(0.0, deadline - time.monotonic()))
+
+    def listing(self, eid):
+        """Current listing for an endpoint, or None unless its stream is connected."""
+        if not self.connected.get(eid):
+            return None
+        return self.model.listing(eid)
+
+    def _run(self, host, eid):
+        from . import describe_error, transport
+
+        session = transport.new_session(self.token, pool_maxsize=1)
+        delay = 1.0
+        while not self._stop.is_set():
+            try:
+                self._follow(session, host, eid)
+            except Exception as e:
+                self._notify({"host": host, "error": describe_error(e)})
+            finally:
+                # A stream always ends in an error; back off from scratch if this one got connected.
+                if self.connected.get(eid):
+                    delay = 1.0
+                self.connected[eid] = False
+                self._synced[eid].set()
+            if self._stop.wait(delay):
+                break
+            delay = min(delay * 2, backoff_max())
+        session.close()
+
+    def _resync(self, session, eid):
+        from . import get_json
+
+        now = time.time()
+        self.model.load(eid, get_json(session, self.url, f"/api/endpoints/{eid}/docker/containers/json?all=1"), now)
+        return now
+
+    def _follow(self, session, host, eid):
+        from . import host_timeout
+
+        since = self._resync(session, eid)
+        resp = session.get(
+            f"{self.url}/api/endpoints/{eid}/docker/events",
+            params={"since": f"{since:.9f}", "filters": EVENT_FILTERS},
+            stream=True,
+            timeout=(host_timeout(), None),
+        )
+        self._responses[eid] = resp
+        try:
+            resp.raise_for_status()
+            self.connected[eid] = True
+            self._synced[eid].set()
+            self._notify({"host": host, "connected": True})
+            for line in resp.iter_lines():
+                if self._stop.is_set():
+                    return
+                if not line:
+                    continue
+                change = self.model.apply(eid, json.loads(line))
+                if change and change.pop("resync", False):
+                    self._resync(session, eid)
+                if change:
+                    self._notify({"host": host, **change})
+        finally:
+            self._responses.pop(eid, None)
+            resp.close()
+        raise ConnectionError("event stream closed")
+
+    def _notify(self, change):
+        if self.on_change is not None:
+            self.on_change(change)
+
+
+def activate(watcher):
+    """Answer container listings from ``watcher`` in this process (None to stop)."""
+    global _active
+    _active = watcher
+
+
+def listing(url, eid, kind):
+    """The active watcher's listing for ``eid``, or None."""
+    if _active is None or kind != "containers" or _active.url.rstrip("/") != url.rstrip("/"):
+        return None
+    return _active.listing(eid)
@@ -0,0 +1,194 @@
+"""Persistent container name -> (endpoint, full ID) index.
+
+The index lets control and log commands address a container by ID without
+listing every host first. It lives next to the listing cache
+(~/.cache/portainer/index/) and maps container name, ID, and compose project
+and service labels to the endpoint that runs the container.
+
+An endpoint's entries are trusted for PORTAINER_INDEX_TTL seconds (default
+300). After that they are brought up to date from Docker's /events endpoint
+(create, destroy and rename events since the last sync), which is one small
+request instead of a full listing. Endpoints never seen before, or not synced
+for PORTAINER_INDEX_RESYNC seconds (default one hour), are rebuilt from a
+full container listing, as is an endpoint after a deploy, which may recreate
+its containers under new IDs.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from . import cache, config
+
+DEFAULT_TTL = 300.0
+# Docker only buffers the most recent events, so long gaps are rebuilt from a listing.
+DEFAULT_RESYNC = 3600.0
+
+PROJECT_LABEL = "com.docker.compose.project"
+SERVICE_LABEL = "com.docker.compose.service"
+
+EVENT_FILTERS = json.dumps({"type": ["container"], "event": ["create", "destroy", "rename"]})
+
+_HEX = re.compile(r"^[0-9a-f]{4,64}$")
+
+# Load, drop and save as one step, so concurrent forgets (e.g. a deploy's hosts) do not undo each other.
+_forget_lock = threading.Lock()
+
+
+def index_ttl():
+    return float(config.env("PORTAINER_INDEX_TTL", DEFAULT_TTL))
+
+
+def resync_interval():
+    return float(config.env("PORTAINER_INDEX_RESYNC", DEFAULT_RESYNC))
+
+
+def entry_from_container(c):
+    labels = c.get("Labels") or {}
+    return {
+        "id": c["Id"],
+        "name": c["Names"][0].lstrip("/"),
+        "project": labels.get(PROJECT_LABEL, ""),
+        "service": labels.get(SERVICE_LABEL, ""),
+    }
+
+
+class ContainerIndex:
+    """On-disk index of containers per endpoint for one Portainer URL."""
+
+    def __init__(self, url):
+        digest = hashlib.sha1(url.rstrip("/").encode()).hexdigest()[:12]
+        self.path = cache.cache_dir() / "index" / f"{digest}.json"
+        self.endpoints = {}
+        self.dirty = False
+        try:
+            data = json.loads(self.path.read_text())
+            if data.get("version") == 1:
+                self.endpoints = data.get("endpoints", {})
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps({"version": 1, "endpoints": self.endpoints}, separators=(",", ":")))
+            os.replace(tmp, self.path)
+            self.dirty = False
+        except OSError:
+            tmp.unlink(missing_ok=True)
+
+    def is_fresh(self, eid):
+        ep = self.endpoints.get(str(eid))
+        return ep is not None and time.time() - ep["synced_at"] <= index_ttl()
+
+    def replace(self, eid, containers, synced_at):
+        """Rebuild an endpoint's entries from a full container listing."""
+        self.endpoints[str(eid)] = {
+            "synced_at": synced_at,
+            "full_sync_at": synced_at,
+            "containers": [entry_from_container(c) for c in containers],
+        }
+        self.dirty = True
+
+    def drop(self, eid):
+        """Forget an endpoint so the next lookup rebuilds it."""
+        if self.endpoints.pop(str(eid), None) is not None:
+            self.dirty = True
+
+    def apply_events(self, eid, events, synced_at):
+        """Apply container create/destroy/rename events to an endpoint."""
+        ep = self.endpoints[str(eid)]
+        by_id = {e["id"]: e for e in ep["containers"]}
+        for ev in events:
+            actor = ev.get("Actor") or {}
+            cid = actor.get("ID") or ev.get("id")
+            attrs = actor.get("Attributes") or {}
+            action = ev.get("Action") or ev.get("status", "")
+            if not cid:
+                continue
+            if action == "destroy":
+                by_id.pop(cid, None)
+            elif action in ("create", "rename"):
+                entry = by_id.setdefault(cid, {"id": cid, "name": "", "project": "", "service": ""})
+                entry["name"] = attrs.get("name", entry["name"]).lstrip("/")
+                entry["project"] = attrs.get(PROJECT_LABEL, entry["project"])
+                entry["service"] = attrs.get(SERVICE_LABEL, entry["service"])
+        ep["containers"] = list(by_id.values())
+        ep["synced_at"] = synced_at
+        self.dirty = True
+
+    def lookup(self, name, endpoint_ids):
+        """Return [(eid, entry)] for ``name`` on ``endpoint_ids``.
+
+        Tiers, first non-empty wins: exact name; full or short ID;
+        "project/service" or compose service label; substring of the name;
+        case-insensitive substring.
+        """
+        candidates = []
+        for eid in endpoint_ids:
+            ep = self.endpoints.get(str(eid))
+            if ep:
+                candidates.extend((eid, e) for e in ep["containers"])
+        project, _, service = name.partition("/")
+        tiers = (
+            lambda e: e["name"] == name,
+            lambda e: bool(_HEX.match(name)) and e["id"].startswith(name),
+            lambda e: (e["project"] == project and e["service"] == service) if service else e["service"] == name,
+            lambda e: name in e["name"],
+            lambda e: name.casefold() in e["name"].casefold(),
+        )
+        for match in tiers:
+            found = [(eid, e) for eid, e in candidates if match(e)]
+            if found:
+                return found
+        return []
+
+
+def forget(url, eid):
+    """Drop an endpoint's saved entries so the next lookup rebuilds them."""
+    with _forget_lock:
+        index = ContainerIndex(url)
+        index.drop(eid)
+        index.save()
+
+
+def sync(index, session, url, targets, force=False):
+    """Bring the entries for ``targets`` up to date and save the index.
+
+    Endpoints within PORTAINER_INDEX_TTL are left alone unless ``force``.
+    """
+    from . import fan_out, fetch_listing, host_timeout
+
+    def update(host, eid):
+        now = time.time()
+        ep = index.endpoints.get(str(eid))
+        if ep is None or now - ep.get("full_sync_at", 0) > resync_interval():
+            return "full", fetch_listing(session, url, eid, "containers"), now
+        if not force and index.is_fresh(eid):
+            return "fresh", None, now
+        resp = session.get(
+            f"{url}/api/endpoints/{eid}/docker/events",
+            params={"since": int(ep["synced_at"]), "until": int(now), "filters": EVENT_FILTERS},
+            timeout=host_timeout(),
+        )
+        if resp.status_code != 200:
+            return "full", fetch_listing(session, url, eid, "containers"), now
+        events = [json.loads(line) for line in resp.text.splitlines() if line.strip()]
+        return "events", events, now
+
+    for _, eid, result, error in fan_out(update, targets):
+        if error:
+            continue
+        kind, payload, now = result
+        if kind == "full":
+            # The listing may come from the listing cache; replay events from its oldest possible age.
+            index.replace(eid, payload, now - cache.ttl())
+        elif kind == "events":
+            index.apply_events(eid, payload, now)
+    index.save()
@@ -0,0 +1,279 @@
+"""Incremental on-disk archive of container logs (opt-in, see --archive).
+
+Each container is archived in its own directory under the cache directory
+(~/.cache/portainer/logs/<url digest>/<endpoint id>-<container id>/) as
+numbered gzip segments plus ``index.json``. The index records the
+container's name and host, a cursor (the Docker timestamp of the newest
+archived line, and how many archived lines carry exactly that timestamp),
+and the first and last timestamp and size of every segment.
+
+A sync asks Docker only for lines since the cursor. ``since`` is inclusive,
+so lines at the cursor itself come back again and are skipped by count.
+New lines are appended to the newest segment as one more gzip member; once
+a segment passes PORTAINER_LOG_SEGMENT_BYTES (default 4 MiB compressed) a
+new one is started. Queries pick segments by their time range and never
+touch Portainer, and lines stay archived after Docker rotates its own log
+files.
+
+Archived lines are stored as "<timestamp> <stream> <message>", the stream
+being 1 (stdout) or 2 (stderr). Docker timestamps have a fixed-width
+fraction, so they are compared as strings. gzip is imported on first use,
+so --help and commands that do not archive stay cheap to start.
+"""
+
+import hashlib
+import io
+import json
+import os
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from . import cache, config
+from .logstream import ALL_STREAMS, FrameDecoder, LineSplitter, split_timestamp
+
+DEFAULT_SEGMENT_BYTES = 4 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+def segment_bytes():
+    return int(config.env("PORTAINER_LOG_SEGMENT_BYTES", DEFAULT_SEGMENT_BYTES))
+
+
+def enabled():
+    """True if PORTAINER_LOG_ARCHIVE turns archiving on for every logs command."""
+    return config.env("PORTAINER_LOG_ARCHIVE", "0").lower() in ("1", "true", "yes")
+
+
+def _root(url):
+    digest = hashlib.sha1(url.rstrip("/").encode()).hexdigest()[:12]
+    return cache.cache_dir() / "logs" / digest
+
+
+def format_stamp(ts):
+    """A UNIX timestamp as a Docker log timestamp, comparable with archived ones."""
+    seconds = int(ts // 1)
+    nanos = round((ts - seconds) * 1e9)
+    if nanos >= 10**9:
+        seconds, nanos = seconds + 1, 0
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S") + f".{nanos:09d}Z"
+
+
+def since_param(stamp):
+    """A Docker log timestamp as a ``since`` value, to the nanosecond."""
+    text = stamp.rstrip("Z")
+    whole, _, fraction = text.partition(".")
+    seconds = int(datetime.strptime(whole, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc).timestamp())
+    return f"{seconds}.{fraction[:9]:0<9}"
+
+
+class LogArchive:
+    """The archived logs of one container on one endpoint."""
+
+    def __init__(self, url, eid, cid, directory=None):
+        self.dir = directory or _root(url) / f"{eid}-{cid}"
+        self.path = self.dir / "index.json"
+        self.meta = {"version": 1, "cursor": None, "cursor_lines": 0, "segments": []}
+        self.added = 0
+        self._load()
+
+    def _load(self):
+        try:
+            data = json.loads(self.path.read_text())
+            if data.get("version") == 1:
+                self.meta = data
+        except (OSError, ValueError):
+            pass
+
+    def _save(self):
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            tmp.write_text(json.dumps(self.meta, separators=(",", ":")))
+            os.replace(tmp, self.path)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            raise
+
+    @property
+    def name(self):
+        return self.meta.get("name", "")
+
+    @property
+    def host(self):
+        return self.meta.get("host", "")
+
+    def request_params(self):
+        """Logs query parameters fetching everything after the cursor, both streams."""
+        params = {"stdout": 1, "stderr": 1, "timestamps": 1}
+        if self.meta["cursor"]:
+            params["since"] = since_param(self.meta["cursor"])
+        return params
+
+    @contextmanager
+    def _locked(self):
+        # Two commands syncing the same container would archive its new lines twice.
+        import fcntl
+
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with open(self.dir / "lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._load()
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def sync(self, resp, name, host):
+        """Append the lines of a ``request_params()`` logs response; returns how many were new.
+
+        The response is decoded and compressed chunk by chunk, so memory does
+        not depend on how much the container logged since the last sync.
+        """
+        with self._locked():
+            self.meta.update(name=name, host=host)
+            self.added = 0
+            decoder = FrameDecoder(ALL_STREAMS)
+            lines = LineSplitter()
+            with _Appender(self) as appender:
+                for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                    if chunk:
+                        appender.write(lines.feed(decoder.feed(chunk)))
+                appender.write(lines.feed(decoder.flush()) + lines.flush())
+            self._save()
+        return self.added
+
+    def _segments(self, since, until):
+        return [
+            s for s in self.meta["segments"]
+            if (since is None or s["last"] >= since) and (until is None or s["first"] < until)
+        ]
+
+    def _read_segment(self, segment, since, until, streams):
+        import gzip
+
+        # Read only the recorded size: a sync running concurrently may be appending a member.
+        with open(self.dir / segment["file"], "rb") as f:
+            data = f.read(segment["size"])
+        wanted = {str(s).encode() for s in streams}
+        with gzip.GzipFile(fileobj=io.BytesIO(data)) as gz:
+            for raw in gz:
+                stamp, _, rest = raw.rstrip(b"\n").partition(b" ")
+                stream, _, message = rest.partition(b" ")
+                text = stamp.decode("ascii")
+                if stream not in wanted or (since and text < since) or (until and text >= until):
+                    continue
+                yield stamp, int(stream), message
+
+    def read(self, since=None, until=None, streams=ALL_STREAMS, tail=None):
+        """Yield (stamp, stream, message) archived from ``since`` to before ``until``, oldest first.
+
+        ``since``/``until`` are UNIX timestamps; with ``tail`` only the last
+        that many lines are returned, reading segments from the newest back.
+        """
+        since = format_stamp(since) if since is not None else None
+        until = format_stamp(until) if until is not None else None
+        segments = self._segments(since, until)
+        if tail is None:
+            for segment in segments:
+                yield from self._read_segment(segment, since, until, streams)
+            return
+        picked = deque()
+        for segment in reversed(segments):
+            if len(picked) >= tail:
+                break
+            found = deque(self._read_segment(segment, since, until, streams), maxlen=tail - len(picked))
+            picked.extendleft(reversed(found))
+        yield from picked
+
+
+class _Appender:
+    """Writes new lines to an archive's segments, one gzip member per segment per sync."""
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.meta = archive.meta
+        self.limit = segment_bytes()
+        self._file = None
+        self._gz = None
+        self._segment = None
+        # Lines at the cursor's timestamp that Docker sends again (``since`` is inclusive).
+        self._repeats = self.meta["cursor_lines"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._close()
+
+    def _open(self):
+        import gzip
+
+        segments = self.meta["segments"]
+        if not segments or segments[-1]["size"] >= self.limit:
+            segments.append({"file": f"{len(segments) + 1:06d}.log.gz", "first": None, "last": None, "size": 0, "lines": 0})
+        self._segment = segments[-1]
+        path = self.archive.dir / self._segment["file"]
+        self._file = open(path, "ab")
+        if self._file.seek(0, os.SEEK_END) > self._segment["size"]:
+            # Drop a member left half-written by an interrupted sync.
+            self._file.truncate(self._segment["size"])
+            self._file.seek(0, os.SEEK_END)
+        self._gz = gzip.GzipFile(fileobj=self._file, mode="ab")
+
+    def _close(self):
+        if self._gz is None:
+            return
+        self._gz.close()
+        self._file.flush()
+        self._segment["size"] = self._file.tell()
+        self._file.close()
+        self._gz = self._file = None
+
+    def write(self, stream_lines):
+        meta = self.meta
+        for stream, line in stream_lines:
+            stamp, message = split_timestamp(line)
+            text = stamp.decode("ascii", "replace")
+            cursor = meta["cursor"]
+            if cursor is not None:
+                if text < cursor:
+                    continue
+                if text == cursor and self._repeats:
+                    self._repeats -= 1
+                    continue
+            if self._gz is None:
+                self._open()
+            self._gz.write(b"%s %d %s\n" % (stamp, stream, message))
+            segment = self._segment
+            segment["first"] = segment["first"] or text
+            segment["last"] = text
+            segment["lines"] += 1
+            if text == cursor:
+                meta["cursor_lines"] += 1
+            else:
+                meta["cursor"], meta["cursor_lines"] = text, 1
+            self.archive.added += 1
+        if self._file is not None and self._file.tell() >= self.limit:
+            self._close()
+
+
+def archived(url):
+    """Every archived container of ``url`` as a LogArchive, whatever its endpoint."""
+    root = _root(url)
+    try:
+        dirs = sorted(p for p in root.iterdir() if (p / "index.json").exists())
+    except OSError:
+        return []
+    return [LogArchive(url, None, None, directory=d) for d in dirs]
+
+
+def find(url, name, hosts=None):
+    """Archives of containers named ``name`` (or whose ID starts with it), optionally on ``hosts`` only."""
+    found = []
+    for archive in archived(url):
+        cid = archive.dir.name.partition("-")[2]
+        if hosts is not None and archive.host not in hosts:
+            continue
+        if archive.name == name or (len(name) >= 4 and cid.startswith(name)):
+            found.append(archive)
+    return found
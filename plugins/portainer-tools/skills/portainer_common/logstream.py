@@ -0,0 +1,217 @@
+"""Decoding of Docker log streams, whole or incremental.
+
+Docker multiplexes stdout and stderr of non-TTY containers into frames with an
+8-byte header: one stream byte (1 = stdout, 2 = stderr), three zero bytes and
+a big-endian uint32 payload length. Frames arrive split across arbitrary HTTP
+chunk boundaries, so the decoder keeps only the unfinished tail of the stream
+between calls.
+"""
+
+import re
+import struct
+import time
+from datetime import datetime, timezone
+
+HEADER_SIZE = 8
+STDOUT = 1
+STDERR = 2
+ALL_STREAMS = (STDOUT, STDERR)
+
+_HEADER = struct.Struct(">BxxxL")
+
+_DURATION = re.compile(r"^(\d+(?:\.\d+)?)([smhd])$")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def is_multiplexed(head):
+    """True if ``head`` starts with a multiplex frame header.
+
+    Containers started with a TTY stream raw bytes with no headers at all;
+    their first byte is ordinary text, never 0-2 followed by three zeros.
+    """
+    return len(head) >= HEADER_SIZE and head[0] <= STDERR and head[1:4] == b"\0\0\0"
+
+
+def _split(raw, sinks):
+    """Append each frame payload in ``raw`` to ``sinks[stream]``.
+
+    Payloads are copied straight from a memoryview into the bytearray sinks,
+    so no intermediate bytes object is created per frame. Streams without a
+    sink are skipped; a truncated trailing frame contributes what it has.
+    """
+    unpack = _HEADER.unpack_from
+    pos = 0
+    end = len(raw)
+    with memoryview(raw) as view:
+        while pos + HEADER_SIZE <= end:
+            stream, size = unpack(raw, pos)
+            start = pos + HEADER_SIZE
+            pos = start + size
+            sink = sinks.get(stream)
+            if sink is not None:
+                sink += view[start:pos]
+
+
+def _sinks(streams, out=None):
+    """Map stream ids (0 counts as stdout) to output bytearrays.
+
+    With ``out`` every selected stream shares that buffer, preserving the
+    original interleaving; otherwise each stream gets its own.
+    """
+    sinks = {stream: out if out is not None else bytearray() for stream in streams}
+    if STDOUT in sinks:
+        sinks[0] = sinks[STDOUT]
+    return sinks
+
+
+def demux(raw):
+    """Split a complete logs body into {stream: bytearray}.
+
+    A TTY body is returned entirely as stdout.
+    """
+    if not is_multiplexed(raw[:HEADER_SIZE]):
+        return {STDOUT: bytearray(raw), STDERR: bytearray()}
+    sinks = _sinks(ALL_STREAMS)
+    _split(raw, sinks)
+    return {STDOUT: sinks[STDOUT], STDERR: sinks[STDERR]}
+
+
+def demux_docker_logs(raw):
+    """Return (stdout_text, stderr_text) for a complete logs body."""
+    channels = demux(raw)
+    return (
+        channels[STDOUT].decode("utf-8", errors="replace"),
+        channels[STDERR].decode("utf-8", errors="replace"),
+    )
+
+
+def strip_docker_headers(raw, streams=ALL_STREAMS):
+    """Return the text of ``streams`` in a logs body, in original order.
+
+    Payloads are gathered into one buffer and decoded in a single pass. TTY
+    bodies carry no headers and are returned unchanged (they only have
+    stdout, so asking for stderr alone yields an empty string).
+    """
+    if not is_multiplexed(raw[:HEADER_SIZE]):
+        return raw.decode("utf-8", errors="replace") if STDOUT in streams else ""
+    out = bytearray()
+    _split(raw, _sinks(streams, out))
+    return out.decode("utf-8", errors="replace")
+
+
+class FrameDecoder:
+    """Turn arbitrarily chunked log bytes into (stream, payload) runs.
+
+    The first 8 bytes decide whether the stream is multiplexed; a TTY stream
+    is passed through as stdout. Frames of streams not listed in ``streams``
+    are dropped, and consecutive frames of the same stream are coalesced.
+    """
+
+    def __init__(self, streams=ALL_STREAMS):
+        self._buf = bytearray()
+        self._streams = streams
+        self.tty = None
+
+    def feed(self, chunk):
+        """Add ``chunk`` and return the (stream, bytes) runs it completed."""
+        self._buf += chunk
+        if self.tty is None:
+            if len(self._buf) < HEADER_SIZE:
+                return []
+            self.tty = not is_multiplexed(self._buf[:HEADER_SIZE])
+        if self.tty:
+            return self._take_raw()
+        return self._take_frames(complete_only=True)
+
+    def flush(self):
+        """Return runs for whatever is left: a short TTY stream or a truncated frame."""
+        if self.tty or (self.tty is None and self._buf):
+            self.tty = True
+            return self._take_raw()
+        runs = self._take_frames(complete_only=False)
+        self._buf.clear()
+        return runs
+
+    def _take_frames(self, complete_only):
+        runs = []
+        unpack = _HEADER.unpack_from
+        buf = self._buf
+        pos = 0
+        end = len(buf)
+        with memoryview(buf) as view:
+            while pos + HEADER_SIZE <= end:
+                stream, size = unpack(buf, pos)
+                start = pos + HEADER_SIZE
+                if complete_only and start + size > end:
+                    break
+                pos = start + size
+                stream = stream or STDOUT
+                if stream not in self._streams:
+                    continue
+                if runs and runs[-1][0] == stream:
+                    runs[-1][1].extend(view[start:pos])
+                else:
+                    runs.append((stream, bytearray(view[start:pos])))
+        del buf[: min(pos, end)]
+        return [(stream, bytes(data)) for stream, data in runs]
+
+    def _take_raw(self):
+        data = bytes(self._buf)
+        self._buf.clear()
+        return [(STDOUT, data)] if data and STDOUT in self._streams else []
+
+
+class LineSplitter:
+    """Regroup (stream, bytes) runs into complete (stream, line) pairs.
+
+    Each stream keeps its own unfinished last line until a later run ends
+    it or :meth:`flush` is called. Lines are returned without the newline.
+    """
+
+    def __init__(self):
+        self._partial = {}
+
+    def feed(self, runs):
+        lines = []
+        for stream, data in runs:
+            *complete, rest = (self._partial.pop(stream, b"") + data).split(b"\n")
+            if rest:
+                self._partial[stream] = rest
+            lines.extend((stream, line) for line in complete)
+        return lines
+
+    def flush(self):
+        lines = list(self._partial.items())
+        self._partial.clear()
+        return lines
+
+
+def split_timestamp(line):
+    """Split a line of a ``timestamps=1`` logs response into (stamp, message).
+
+    Docker writes RFC 3339 timestamps in UTC with a fixed nine-digit
+    fraction, so stamps compare chronologically as plain strings.
+    """
+    stamp, _, message = line.partition(b" ")
+    return stamp, message
+
+
+def parse_log_time(value):
+    """Convert a --since/--until value to a UNIX timestamp.
+
+    Accepts a UNIX timestamp ("1717000000"), a relative duration back from now
+    ("90s", "10m", "2h", "1d") or an ISO 8601 date/time (UTC if no offset).
+    Raises ValueError for anything else.
+    """
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    m = _DURATION.match(value)
+    if m:
+        return time.time() - float(m.group(1)) * _UNITS[m.group(2)]
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
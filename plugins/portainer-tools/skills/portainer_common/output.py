@@ -0,0 +1,59 @@
+"""Output formats shared by every skill: table, json and ndjson.
+
+In ``table`` mode skills print their usual padded text. Otherwise they hand
+each result to an :class:`Output` as a plain dict ("record"): ``json``
+collects every record and prints them as one array when the command
+finishes; ``ndjson`` prints each record on its own line as soon as it is
+emitted, so a consumer such as ``jq`` sees a host's rows when that host
+answers rather than when the slowest one does.
+
+A host that fails becomes a ``{"host": ..., "error": ...}`` record. Fatal
+errors still go to stderr with a non-zero exit status.
+"""
+
+import json
+
+FORMATS = ("table", "json", "ndjson")
+
+
+def format_bytes(n):
+    """A byte count in binary units, e.g. "1.5MiB", for table output."""
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(n) < 1024:
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}TiB"
+
+
+class Output:
+    def __init__(self, fmt="table"):
+        self.format = fmt
+        self._records = []
+
+    @property
+    def table(self):
+        return self.format == "table"
+
+    @property
+    def streaming(self):
+        """True if records are printed as they arrive, so host order does not matter."""
+        return self.format == "ndjson"
+
+    def emit(self, record):
+        if self.format == "ndjson":
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+        elif self.format == "json":
+            self._records.append(record)
+
+    def close(self):
+        if self.format == "json":
+            print(json.dumps(self._records, indent=2, ensure_ascii=False), flush=True)
+            self._records = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # A command that fails before producing anything prints only its error.
+        if exc_type is None or self._records:
+            self.close()
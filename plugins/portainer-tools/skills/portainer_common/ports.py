@@ -0,0 +1,203 @@
+"""Index of published host ports, and published ports in compose files.
+
+For every endpoint the index maps "port/protocol" (e.g. "8080/tcp") to the
+containers publishing it, so asking whether a port is taken is one dict
+lookup rather than a scan of every container's Ports. An endpoint's index
+is built from one container listing and kept in the listing cache as its
+own "ports" entry, dated like that listing, so later commands reuse it
+without touching the listing until the listing itself would be stale;
+dropping an endpoint's cached containers (after a start, stop or deploy)
+drops it too. While a snapshot or the daemon's event watcher is active it
+is rebuilt from their listing.
+
+Docker only reports ports for running containers, and containers on the
+host network publish none; those are kept separately, as they can hold any
+port, so a port found free may still be taken by one of them.
+"""
+
+import os
+import re
+
+from . import cache, events, snapshot
+
+PROJECT_LABEL = "com.docker.compose.project"
+WILDCARD_IPS = {"", "0.0.0.0", "::"}
+
+# [host_ip:][published:]target[/protocol], where ports may be ranges and an IPv6 host_ip is bracketed.
+_SHORT_SYNTAX = re.compile(
+    r"^(?:(?P<ip>\[[^\]]*\]|[^:\[\]]*):)??(?:(?P<published>[\d-]*):)?(?P<target>\d+(?:-\d+)?)(?:/(?P<proto>\w+))?$"
+)
+_VARIABLE = re.compile(r"\$(?:\$|\{(?P<braced>[^}]*)\}|(?P<plain>[A-Za-z_][A-Za-z0-9_]*))")
+
+
+def key(port, proto="tcp"):
+    return f"{port}/{proto}"
+
+
+def build(containers):
+    """{"ports": {"port/proto": [binding]}, "host_network": [container]} from a container listing."""
+    ports = {}
+    host_network = []
+    seen = set()
+    for c in containers:
+        owner = {
+            "container": c["Names"][0].lstrip("/"),
+            "state": c.get("State", ""),
+            "project": (c.get("Labels") or {}).get(PROJECT_LABEL, ""),
+        }
+        for p in c.get("Ports") or []:
+            pub = p.get("PublicPort")
+            proto = p.get("Type", "tcp")
+            # Docker lists the IPv4 and IPv6 binding of one port separately.
+            if not pub or (pub, p.get("PrivatePort"), proto, owner["container"]) in seen:
+                continue
+            seen.add((pub, p.get("PrivatePort"), proto, owner["container"]))
+            ports.setdefault(key(pub, proto), []).append({"ip": p.get("IP", ""), "private": p.get("PrivatePort"), **owner})
+        if (c.get("HostConfig") or {}).get("NetworkMode") == "host":
+            host_network.append(owner)
+    return {"ports": ports, "host_network": host_network}
+
+
+def endpoint_index(session, url, eid):
+    """The port index of one endpoint, from the cache when fresh."""
+    from . import fetch_listing
+
+    if snapshot.listing(eid, "containers") is not None or events.listing(url, eid, "containers") is not None:
+        return build(fetch_listing(session, url, eid, "containers"))
+    data = cache.load(url, eid, "ports")
+    if data is not None:
+        return data
+    # Dated by its listing, so the index goes stale with it rather than up to a TTL later.
+    entry = cache.load_entry(url, eid, "containers") or (fetch_listing(session, url, eid, "containers"), None)
+    data = build(entry[0])
+    cache.store(url, eid, "ports", data, fetched_at=entry[1])
+    return data
+
+
+def overlaps(ip, other):
+    return ip in WILDCARD_IPS or other in WILDCARD_IPS or ip == other
+
+
+class PortIndex:
+    """Port indexes of several endpoints, by host."""
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+
+    def lookup(self, host, port, proto="tcp", ip=""):
+        """Bindings on ``host`` that would clash with publishing ``port`` on ``ip``."""
+        bindings = self.hosts[host]["ports"].get(key(port, proto), ())
+        return [b for b in bindings if overlaps(ip, b["ip"])]
+
+    def rows(self, host):
+        """Every binding on ``host`` as (port, proto, binding), by port."""
+        found = []
+        for port_key, bindings in self.hosts[host]["ports"].items():
+            port, _, proto = port_key.partition("/")
+            found.extend((int(port), proto, b) for b in bindings)
+        return sorted(found, key=lambda row: (row[0], row[1], row[2]["container"]))
+
+    def find_free(self, hosts, start, end, proto="tcp", count=1):
+        """The first ``count`` ports in [start, end] that no container publishes on any of ``hosts``."""
+        free = []
+        for port in range(start, end + 1):
+            if not any(key(port, proto) in self.hosts[host]["ports"] for host in hosts):
+                free.append(port)
+                if len(free) == count:
+                    break
+        return free
+
+
+def load(session, url, targets):
+    """Return (PortIndex, [(host, error)]) for ``targets``, one listing per stale endpoint, concurrently."""
+    from . import fan_out
+
+    hosts = {}
+    errors = []
+    for host, eid, data, error in fan_out(lambda host, eid: endpoint_index(session, url, eid), targets):
+        if error:
+            errors.append((host, error))
+        else:
+            hosts[host] = data
+    return PortIndex(hosts), errors
+
+
+def interpolate(value, environ=None):
+    """Expand compose-style ``$VAR``, ``${VAR}``, ``${VAR:-default}`` and ``${VAR-default}``.
+
+    Raises ValueError for ``${VAR:?message}`` when VAR is unset or empty.
+    """
+    environ = os.environ if environ is None else environ
+
+    def expand(match):
+        if match.group(0) == "$$":
+            return "$"
+        expr = match.group("braced") if match.group("braced") is not None else match.group("plain")
+        name, sep, default = re.match(r"([A-Za-z_][A-Za-z0-9_]*)(:?[-?]|)(.*)", expr).groups()
+        current = environ.get(name)
+        if sep in (":-", ":?") and not current:
+            current = None
+        if current is not None:
+            return current
+        if sep.endswith("?"):
+            raise ValueError(default or f"{name} is not set")
+        return default
+
+    return _VARIABLE.sub(expand, value)
+
+
+def _port_range(text):
+    first, _, last = text.partition("-")
+    return list(range(int(first), int(last or first) + 1))
+
+
+def parse_port(spec):
+    """Published (host_ip, port, target, proto) tuples for one compose ``ports`` entry.
+
+    Entries that publish nothing (only a container port) or a random host
+    port yield nothing. Raises ValueError for entries that cannot be read.
+    """
+    if isinstance(spec, dict):
+        published = spec.get("published")
+        if published in (None, ""):
+            return []
+        ip = str(spec.get("host_ip") or "")
+        proto = spec.get("protocol") or "tcp"
+        ports = _port_range(interpolate(str(published)))
+        target = int(spec.get("target", 0))
+        return [(ip, port, target, proto) for port in ports]
+    match = _SHORT_SYNTAX.match(interpolate(str(spec)).strip())
+    if not match:
+        raise ValueError(f"cannot read port {spec!r}")
+    if not match.group("published"):
+        return []
+    ip = (match.group("ip") or "").strip("[]")
+    published = _port_range(match.group("published"))
+    targets = _port_range(match.group("target"))
+    if len(targets) > 1 and len(targets) != len(published):
+        raise ValueError(f"port ranges of different lengths in {spec!r}")
+    proto = match.group("proto") or "tcp"
+    return [(ip, port, targets[i] if len(targets) > 1 else targets[0], proto) for i, port in enumerate(published)]
+
+
+def compose_ports(text):
+    """[{"service", "ip", "port", "target", "protocol"}] published by a compose file.
+
+    Needs PyYAML. Raises ValueError if the file or one of its ports cannot be read.
+    """
+    import yaml
+
+    try:
+        doc = yaml.safe_load(text) or {}
+    except yaml.YAMLError as e:
+        raise ValueError(f"invalid YAML: {e}") from e
+    published = []
+    for service, spec in (doc.get("services") or {}).items():
+        for entry in (spec or {}).get("ports") or []:
+            try:
+                found = parse_port(entry)
+            except ValueError as e:
+                raise ValueError(f"service {service}: {e}") from e
+            published.extend({"service": service, "ip": ip, "port": port, "target": target, "protocol": proto}
+                             for ip, port, target, proto in found)
+    return published
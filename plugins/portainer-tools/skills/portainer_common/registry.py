@@ -0,0 +1,214 @@
+"""Docker endpoints discovered from Portainer.
+
+The endpoint list comes from ``/api/endpoints`` (without the per-endpoint
+snapshots, which can be large), with tag and group names resolved through
+``/api/tags`` and ``/api/endpoint_groups``. Only Docker environments are
+kept; Kubernetes and ACI environments have no Docker API to proxy.
+
+The list is cached under the cache directory for PORTAINER_ENDPOINTS_TTL
+seconds (default 300), so most commands make no request for it at all;
+--refresh and --no-cache re-fetch it. If Portainer cannot be reached, a
+stale list is used with a warning.
+
+PORTAINER_ENDPOINTS, a JSON object mapping host names to endpoint ids,
+replaces discovery entirely.
+
+Selecting "all" hosts can be narrowed with --tag/--group (or the
+PORTAINER_ENDPOINT_TAGS/PORTAINER_ENDPOINT_GROUPS comma-separated lists),
+and skips endpoints Portainer reports as down (Status 2) rather than
+waiting for them to time out. A host named explicitly is always used.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+from . import cache, config
+
+DEFAULT_TTL = 300.0
+STATUS_UP, STATUS_DOWN = 1, 2
+# Docker, Docker agent and Docker edge agent environments.
+DOCKER_TYPES = {1, 2, 4}
+
+_lock = threading.Lock()
+# In-process copy of each URL's list, kept for the TTL (long-lived in the daemon).
+_memory = {}
+_filters = {"tags": (), "groups": ()}
+
+
+def ttl():
+    return float(config.env("PORTAINER_ENDPOINTS_TTL", DEFAULT_TTL))
+
+
+def _split(value):
+    return tuple(part.strip() for part in (value or "").split(",") if part.strip())
+
+
+def configure(tags=None, groups=None, refresh=False):
+    """Set this command's --tag/--group filters; ``refresh`` drops the in-process list."""
+    _filters["tags"] = tuple(tags or ()) or _split(config.env("PORTAINER_ENDPOINT_TAGS"))
+    _filters["groups"] = tuple(groups or ()) or _split(config.env("PORTAINER_ENDPOINT_GROUPS"))
+    if refresh:
+        with _lock:
+            _memory.clear()
+
+
+def _path(url):
+    digest = hashlib.sha1(url.rstrip("/").encode()).hexdigest()[:12]
+    return cache.cache_dir() / "endpoints" / f"{digest}.json"
+
+
+def _static():
+    """Entries from PORTAINER_ENDPOINTS, or None when it is not set."""
+    raw = config.env("PORTAINER_ENDPOINTS")
+    if not raw:
+        return None
+    try:
+        mapping = {str(host): int(eid) for host, eid in json.loads(raw).items()}
+    except (ValueError, TypeError, AttributeError) as e:
+        print(f"Error: Invalid PORTAINER_ENDPOINTS ({e}); expected a JSON object like {{\"host\": 1}}", file=sys.stderr)
+        sys.exit(1)
+    return [{"name": host, "id": eid, "status": STATUS_UP, "tags": [], "group": ""} for host, eid in mapping.items()]
+
+
+def _fetch(url):
+    """Fetch the Docker endpoints from Portainer as registry entries."""
+    from . import get_json, get_session
+
+    _, session = get_session()
+    endpoints = get_json(session, url, "/api/endpoints", params={"excludeSnapshots": "true"})
+    names = {}
+    # Tag and group names are only needed for filtering; a token that may not read them still discovers.
+    for path, kind, key in (("/api/tags", "tags", "ID"), ("/api/endpoint_groups", "groups", "Id")):
+        try:
+            names[kind] = {item[key]: item["Name"] for item in get_json(session, url, path)}
+        except Exception:
+            names[kind] = {}
+    entries = []
+    for ep in endpoints:
+        if ep.get("Type", 1) not in DOCKER_TYPES:
+            continue
+        entries.append({
+            "name": ep["Name"],
+            "id": ep["Id"],
+            "status": ep.get("Status", STATUS_UP),
+            "tags": [names["tags"].get(tid, str(tid)) for tid in ep.get("TagIds") or ()],
+            "group": names["groups"].get(ep.get("GroupId"), ""),
+        })
+    return entries
+
+
+def _read(url):
+    try:
+        return json.loads(_path(url).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _write(url, entry):
+    path = _path(url)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(json.dumps(entry))
+        os.replace(tmp, path)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+
+
+def entries():
+    """Every Docker endpoint as {"name", "id", "status", "tags", "group"}, in Portainer's order."""
+    from . import DEFAULT_URL, describe_error
+
+    static = _static()
+    if static is not None:
+        return static
+    url = config.env("PORTAINER_URL", DEFAULT_URL)
+    now = time.time()
+    with _lock:
+        entry = _memory.get(url)
+        if entry is None and cache.reading():
+            entry = _read(url)
+        if entry is not None and now - entry["fetched_at"] <= ttl():
+            _memory[url] = entry
+            return entry["endpoints"]
+        try:
+            fresh = {"fetched_at": now, "endpoints": _fetch(url)}
+        except Exception as e:
+            stale = entry or _read(url)
+            if stale is None:
+                print(f"Error: Cannot discover endpoints from {url}: {describe_error(e)}", file=sys.stderr)
+                sys.exit(1)
+            print(
+                f"Warning: Cannot refresh endpoints ({describe_error(e)}); "
+                f"using the list from {now - stale['fetched_at']:.0f}s ago",
+                file=sys.stderr,
+            )
+            return stale["endpoints"]
+        _memory[url] = fresh
+        if cache.writing():
+            _write(url, fresh)
+        return fresh["endpoints"]
+
+
+def endpoints():
+    """{host: endpoint_id} for every Docker endpoint."""
+    return {e["name"]: e["id"] for e in entries()}
+
+
+def known():
+    """{host: endpoint_id} from lists already loaded in this process; never fetches."""
+    static = _static()
+    if static is not None:
+        return {e["name"]: e["id"] for e in static}
+    with _lock:
+        return {e["name"]: e["id"] for entry in _memory.values() for e in entry["endpoints"]}
+
+
+def filtering():
+    return bool(_filters["tags"] or _filters["groups"])
+
+
+def matches_filters(entry):
+    tags, groups = _filters["tags"], _filters["groups"]
+    if tags and not set(tags) & set(entry["tags"]):
+        return False
+    return not groups or entry["group"] in groups
+
+
+def select_all():
+    """({host: eid} for every endpoint matching the filters and not down, [down hosts skipped])."""
+    selected, down = {}, []
+    for e in entries():
+        if not matches_filters(e):
+            continue
+        if e["status"] == STATUS_DOWN:
+            down.append(e["name"])
+        else:
+            selected[e["name"]] = e["id"]
+    return selected, down
+
+
+class HostChoices:
+    """argparse ``choices`` for a host argument, discovered on first use.
+
+    Checking a value other than "all" loads the registry, so a host added in
+    Portainer is accepted without code changes. Listing the choices (argparse
+    does so for an invalid value, and for --help when the argument has
+    ``help=``) loads it too; give host arguments a metavar and no help text
+    so --help stays offline.
+    """
+
+    def __init__(self, include_all=True):
+        self.include_all = include_all
+
+    def __contains__(self, host):
+        return (self.include_all and host == "all") or host in endpoints()
+
+    def __iter__(self):
+        if self.include_all:
+            yield "all"
+        yield from endpoints()
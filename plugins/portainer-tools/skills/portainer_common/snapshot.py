@@ -0,0 +1,137 @@
+"""One-pass inventory snapshots shared by every listing skill.
+
+A snapshot holds the container, network and volume listings of every
+endpoint plus Portainer's stack list, all fetched in a single concurrent
+pass. It is written as one versioned JSON file under
+~/.cache/portainer/snapshots/ (the newest few per Portainer URL are kept).
+
+Skills render from a snapshot instead of querying Portainer when given
+``--snapshot PATH``, or ``--snapshot-age SECONDS`` to use the newest snapshot
+taken within that window. Listings a snapshot lacks (an endpoint that was
+not included or that failed) are still fetched live.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from . import cache
+
+VERSION = 1
+KINDS = ("containers", "networks", "volumes")
+KEEP = 5
+
+# The snapshot the current command renders from, if any.
+_active = None
+
+
+def _dir(url):
+    digest = hashlib.sha1(url.rstrip("/").encode()).hexdigest()[:12]
+    return cache.cache_dir() / "snapshots" / digest
+
+
+def take(session, url, targets):
+    """Fetch every listing for ``targets`` ({host: eid}) and the stack list in one pass.
+
+    Each (endpoint, kind) pair is its own request, run at most
+    PORTAINER_CONCURRENCY at a time like every other fan-out. Per-listing
+    failures are recorded under the endpoint's "errors" rather than raised.
+    Fetched listings also refresh the listing cache.
+    """
+    from . import LISTING_PATHS, fan_out, get_json
+
+    jobs = {("", "stacks"): 0}
+    jobs.update(((host, kind), eid) for host, eid in targets.items() for kind in KINDS)
+
+    def fetch(key, eid):
+        host, kind = key
+        if kind == "stacks":
+            return get_json(session, url, "/api/stacks")
+        data = get_json(session, url, f"/api/endpoints/{eid}/docker{LISTING_PATHS[kind]}")
+        cache.store(url, eid, kind, data)
+        return data
+
+    snap = {"version": VERSION, "url": url, "taken_at": time.time(), "stacks": None, "stacks_error": None}
+    snap["endpoints"] = {str(eid): {"host": host, "errors": {}} for host, eid in targets.items()}
+    for (host, kind), eid, data, error in fan_out(fetch, jobs):
+        if kind == "stacks":
+            snap["stacks"], snap["stacks_error"] = data, error
+        elif error:
+            snap["endpoints"][str(eid)]["errors"][kind] = error
+        else:
+            snap["endpoints"][str(eid)][kind] = data
+    return snap
+
+
+def save(snap, path=None):
+    """Write ``snap`` atomically and return its path.
+
+    Without ``path`` it goes to the snapshot directory for its URL, and all
+    but the newest KEEP snapshots there are removed.
+    """
+    auto = path is None
+    if auto:
+        path = _dir(snap["url"]) / f"{snap['taken_at']:.3f}.json"
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        tmp.write_text(json.dumps(snap, separators=(",", ":")))
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    if auto:
+        for old in sorted(path.parent.glob("*.json"), key=_taken_at)[:-KEEP]:
+            old.unlink(missing_ok=True)
+    return path
+
+
+def _taken_at(path):
+    try:
+        return float(path.stem)
+    except ValueError:
+        return 0.0
+
+
+def load(path):
+    """Read a snapshot file. Raises ValueError if it is unreadable or of another version."""
+    try:
+        snap = json.loads(Path(path).read_text())
+    except OSError as e:
+        raise ValueError(f"cannot read {path}: {e.strerror}") from None
+    except ValueError:
+        raise ValueError(f"{path} is not a snapshot file") from None
+    if not isinstance(snap, dict) or snap.get("version") != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} snapshot")
+    return snap
+
+
+def latest(url, max_age):
+    """Return the newest snapshot for ``url`` taken within ``max_age`` seconds, or None."""
+    paths = sorted(_dir(url).glob("*.json"), key=_taken_at)
+    if not paths or time.time() - _taken_at(paths[-1]) > max_age:
+        return None
+    try:
+        return load(paths[-1])
+    except ValueError:
+        return None
+
+
+def activate(snap):
+    """Serve listings from ``snap`` (or stop, with None) for the rest of the process."""
+    global _active
+    _active = snap
+
+
+def listing(eid, kind):
+    """Return the active snapshot's listing, or None if it has none for this request."""
+    if _active is None:
+        return None
+    return (_active["endpoints"].get(str(eid)) or {}).get(kind)
+
+
+def active():
+    """The snapshot this command renders from, or None."""
+    return _active
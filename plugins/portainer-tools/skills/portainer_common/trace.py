@@ -0,0 +1,162 @@
+"""Per-request tracing of Portainer calls.
+
+Pass ``--trace`` to any skill (or set PORTAINER_TRACE=1) to record every
+request made through a portainer_common session. For each one the trace
+keeps the method, a path template (ids replaced by ``{id}``), the endpoint,
+the status, the body size, and where the time went:
+
+- connect: DNS, TCP and TLS setup for a new pooled connection (0 when a
+  kept-alive connection was reused)
+- ttfb: from sending the request to receiving the response headers,
+  which is mostly Portainer and Docker proxy latency (and any retries)
+- download: reading the body
+- parse: decoding the JSON body
+
+On exit a summary grouped by request and host is printed to stderr. With
+``--trace-file PATH`` (or PORTAINER_TRACE_FILE) every request is also
+written as a Chrome trace (open it in chrome://tracing or Perfetto).
+
+Through portainer-agentd the trace covers the command as the daemon ran
+it, warm connections included. Like the daemon settings, PORTAINER_TRACE
+and PORTAINER_TRACE_FILE are read from the environment only, so checking
+them costs nothing on paths that never load the .env files.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from .output import format_bytes
+
+_ID_SEGMENT = re.compile(r"/(endpoints|stacks|containers|networks|volumes|images)/(?!json\b|create\b|prune\b)[^/?]+")
+
+_lock = threading.Lock()
+_local = threading.local()
+_records = None
+_started = 0.0
+
+
+def enabled():
+    return os.environ.get("PORTAINER_TRACE", "0") not in ("", "0")
+
+
+def start():
+    """Begin collecting requests for this command."""
+    global _records, _started
+    with _lock:
+        _records = []
+        _started = time.perf_counter()
+
+
+def active():
+    return _records is not None
+
+
+def template(path):
+    """``/api/endpoints/7/docker/containers/ab12/logs?tail=5`` → ``/api/endpoints/{id}/docker/containers/{id}/logs``."""
+    return _ID_SEGMENT.sub(r"/\1/{id}", path.split("?", 1)[0])
+
+
+def begin():
+    """Reset this thread's connect time before a request is sent."""
+    _local.connect = 0.0
+
+
+def note_connect(seconds):
+    """Called by the transport when a request had to open a connection."""
+    _local.connect = getattr(_local, "connect", 0.0) + seconds
+
+
+def connect_time():
+    return getattr(_local, "connect", 0.0)
+
+
+def add(record):
+    """Store a finished request. ``record["start"]`` is a perf_counter() value."""
+    record["thread"] = threading.get_ident()
+    with _lock:
+        if _records is not None:
+            _records.append(record)
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:.0f}ms"
+
+
+def summary(records):
+    """Rows of (method, path, host, count, errors, bytes, connect, ttfb, download, parse, slowest)."""
+    from . import registry
+
+    hosts = {str(eid): host for host, eid in registry.known().items()}
+    groups = {}
+    for r in records:
+        host = hosts.get(r["endpoint"], r["endpoint"] or "—")
+        groups.setdefault((r["method"], r["path"], host), []).append(r)
+    rows = []
+    for (method, path, host), rs in groups.items():
+        total = {k: sum(r[k] for r in rs) for k in ("bytes", "connect", "ttfb", "download", "parse")}
+        errors = sum(1 for r in rs if not isinstance(r["status"], int) or r["status"] >= 400)
+        slowest = max(r["connect"] + r["ttfb"] + r["download"] + r["parse"] for r in rs)
+        rows.append((method, path, host, len(rs), errors, *total.values(), slowest))
+    rows.sort(key=lambda row: -(row[6] + row[7] + row[8] + row[9]))
+    return rows
+
+
+def report():
+    """Print the summary to stderr and write the trace file, then stop tracing."""
+    global _records
+    with _lock:
+        records, _records = _records, None
+    if records is None:
+        return
+    wall = time.perf_counter() - _started
+    rows = summary(records)
+    total_bytes = sum(r["bytes"] for r in records)
+    print(f"Trace: {len(records)} request(s), {format_bytes(total_bytes)} received, {wall:.2f}s wall", file=sys.stderr)
+    if rows:
+        headers = ("METHOD", "PATH", "HOST", "N", "ERR", "BYTES", "CONNECT", "TTFB", "DOWNLOAD", "PARSE", "SLOWEST")
+        cells = [
+            (method, path, host, str(n), str(err), format_bytes(size), _ms(conn), _ms(ttfb), _ms(down), _ms(parse), _ms(slow))
+            for method, path, host, n, err, size, conn, ttfb, down, parse, slow in rows
+        ]
+        widths = [max(len(h), *(len(c[i]) for c in cells)) for i, h in enumerate(headers)]
+        for row in (headers, *cells):
+            print("  ".join(f"{c:<{w}}" for c, w in zip(row, widths)).rstrip(), file=sys.stderr)
+    path = os.environ.get("PORTAINER_TRACE_FILE")
+    if path:
+        try:
+            with open(path, "w") as f:
+                json.dump(chrome_trace(records), f)
+            print(f"Trace written to {path}", file=sys.stderr)
+        except OSError as e:
+            print(f"Warning: Cannot write trace file: {e}", file=sys.stderr)
+
+
+def chrome_trace(records):
+    """Records as Chrome trace events: one span per request with its phases
+    nested inside, followed by a span for parsing the body, if it was parsed."""
+    pid = os.getpid()
+    events = []
+
+    def span(name, start, duration, tid, args=None):
+        event = {"name": name, "cat": "portainer", "ph": "X", "pid": pid, "tid": tid}
+        event.update(ts=round((start - _started) * 1e6), dur=max(round(duration * 1e6), 1))
+        if args:
+            event["args"] = args
+        events.append(event)
+
+    for r in records:
+        args = {k: r[k] for k in ("endpoint", "status", "bytes", "retries")}
+        end = r["connect"] + r["ttfb"] + r["download"]
+        span(f"{r['method']} {r['path']}", r["start"], end, r["thread"], args)
+        at = r["start"]
+        for phase in ("connect", "ttfb", "download"):
+            if r[phase]:
+                span(phase, at, r[phase], r["thread"])
+            at += r[phase]
+        if r["parse"]:
+            span("parse", r["parse_start"], r["parse"], r["thread"])
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
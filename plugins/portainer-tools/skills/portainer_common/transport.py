@@ -0,0 +1,255 @@
+"""HTTP sessions with timeouts, retries and a per-endpoint circuit breaker.
+
+Every session from :func:`new_session` gets:
+
+- default connect/read timeouts (PORTAINER_CONNECT_TIMEOUT, default 5s;
+  PORTAINER_READ_TIMEOUT, default PORTAINER_HOST_TIMEOUT), so no request can
+  hang a skill; calls that pass their own ``timeout`` (streams) keep it.
+- retries with jittered exponential backoff (PORTAINER_RETRIES, default 2;
+  PORTAINER_RETRY_BACKOFF, default 0.5s) for failed connections and for 502,
+  503 and 504 answers from Portainer's Docker proxy. Only GET, HEAD and
+  OPTIONS are retried after reaching Portainer: a stack PUT or a container
+  restart is never sent twice. Read timeouts are not retried either, as a
+  request that hung once would most likely hang again.
+- a connection pool sized for the fan-out (PORTAINER_POOL_SIZE, default
+  twice PORTAINER_CONCURRENCY, leaving room for nested fan-outs).
+- request tracing (see trace.py) when --trace is given.
+- a circuit breaker per Docker endpoint. After PORTAINER_BREAKER_THRESHOLD
+  (default 2) consecutive failures, requests to that endpoint fail at once
+  with :class:`CircuitOpenError` for PORTAINER_BREAKER_COOLDOWN seconds
+  (default 30); after that requests go through again, and the first
+  success closes the breaker. Breaker state is shared with later commands
+  through ``breaker.json`` in the cache directory, so a dead host costs one
+  timeout rather than one per command. A threshold of 0 disables it.
+
+This module imports requests, so it is only loaded once a session is needed.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from . import cache, config, trace
+
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_BACKOFF = 0.5
+DEFAULT_BREAKER_THRESHOLD = 2
+DEFAULT_BREAKER_COOLDOWN = 30.0
+
+RETRY_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+RETRY_STATUSES = (502, 503, 504)
+
+_ENDPOINT_PATH = re.compile(r"/api/endpoints/(\d+)/")
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """An endpoint's breaker is open; the request was not sent."""
+
+
+def _setting(name, default):
+    return float(config.env(name, default))
+
+
+def timeouts():
+    """Default (connect, read) timeout in seconds."""
+    from . import host_timeout
+
+    read = config.env("PORTAINER_READ_TIMEOUT")
+    return _setting("PORTAINER_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT), float(read) if read else host_timeout()
+
+
+def pool_size():
+    from . import concurrency
+
+    return max(1, int(config.env("PORTAINER_POOL_SIZE", 2 * concurrency())))
+
+
+def retry_policy():
+    retries = int(_setting("PORTAINER_RETRIES", DEFAULT_RETRIES))
+    return Retry(
+        total=retries,
+        connect=retries,
+        read=False,
+        status=retries,
+        other=0,
+        allowed_methods=RETRY_METHODS,
+        status_forcelist=RETRY_STATUSES,
+        backoff_factor=_setting("PORTAINER_RETRY_BACKOFF", DEFAULT_RETRY_BACKOFF),
+        backoff_jitter=_setting("PORTAINER_RETRY_BACKOFF", DEFAULT_RETRY_BACKOFF),
+        raise_on_status=False,
+    )
+
+
+class Breaker:
+    """Consecutive-failure circuit breaker keyed by (Portainer URL, endpoint id)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _path(self):
+        return cache.cache_dir() / "breaker.json"
+
+    def _load(self):
+        if self._state is None:
+            try:
+                self._state = json.loads(self._path().read_text())
+            except (OSError, ValueError):
+                self._state = {}
+        return self._state
+
+    def _save(self):
+        path = self._path()
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps(self._state))
+            os.replace(tmp, path)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+
+    def check(self, key):
+        """Raise CircuitOpenError if ``key`` is open; otherwise let the request through."""
+        with self._lock:
+            entry = self._load().get(key)
+            if not entry or entry["open_until"] <= time.time():
+                return
+            wait = entry["open_until"] - time.time()
+        raise CircuitOpenError(f"skipped after {entry['failures']} failed requests; retrying in {wait:.0f}s")
+
+    def record(self, key, ok):
+        threshold = int(_setting("PORTAINER_BREAKER_THRESHOLD", DEFAULT_BREAKER_THRESHOLD))
+        with self._lock:
+            state = self._load()
+            entry = state.get(key)
+            if ok:
+                if entry:
+                    del state[key]
+                    self._save()
+                return
+            entry = entry or {"failures": 0, "open_until": 0.0}
+            entry["failures"] += 1
+            if entry["failures"] >= threshold:
+                # Also re-opens after a failed probe, since failures stay above the threshold.
+                entry["open_until"] = time.time() + _setting("PORTAINER_BREAKER_COOLDOWN", DEFAULT_BREAKER_COOLDOWN)
+            state[key] = entry
+            self._save()
+
+
+_breaker = Breaker()
+
+
+class _TimedConnectMixin:
+    """Report the time spent opening each connection to the trace."""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            trace.note_connect(time.perf_counter() - start)
+
+
+class _TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _Adapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPPool, "https": _TimedHTTPSPool}
+
+
+class PortainerSession(requests.Session):
+    """A requests.Session that applies default timeouts and the circuit breaker."""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", timeouts())
+        match = _ENDPOINT_PATH.search(url)
+        key = None
+        if match and int(_setting("PORTAINER_BREAKER_THRESHOLD", DEFAULT_BREAKER_THRESHOLD)) > 0:
+            key = f"{url[: match.start()]}|{match.group(1)}"
+            _breaker.check(key)
+        try:
+            if trace.active():
+                resp = self._traced(method, url, match.group(1) if match else None, **kwargs)
+            else:
+                resp = super().request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if key:
+                _breaker.record(key, ok=False)
+            raise
+        if key:
+            _breaker.record(key, ok=resp.status_code not in RETRY_STATUSES)
+        return resp
+
+    def _traced(self, method, url, endpoint, stream=False, **kwargs):
+        """Send the request in phases (headers, then body) and add it to the trace."""
+        record = {"method": method.upper(), "path": trace.template(url[url.find("/api/") :]), "endpoint": endpoint}
+        record.update(status=None, bytes=0, retries=0, connect=0.0, ttfb=0.0, download=0.0, parse=0.0)
+        trace.begin()
+        start = headers_at = done_at = time.perf_counter()
+        record["start"] = start
+        try:
+            resp = super().request(method, url, stream=True, **kwargs)
+            headers_at = time.perf_counter()
+            record["status"] = resp.status_code
+            retries = getattr(resp.raw, "retries", None)
+            record["retries"] = len(retries.history) if retries else 0
+            if not stream:
+                record["bytes"] = len(resp.content)
+            else:
+                record["bytes"] = int(resp.headers.get("Content-Length") or 0)
+            done_at = time.perf_counter()
+        except Exception as e:
+            record["status"] = type(e).__name__
+            headers_at = done_at = time.perf_counter()
+            raise
+        finally:
+            record["connect"] = min(trace.connect_time(), headers_at - start)
+            record["ttfb"] = headers_at - start - record["connect"]
+            record["download"] = done_at - headers_at
+            trace.add(record)
+
+        decode = resp.json
+
+        def timed_json(**kw):
+            record["parse_start"] = time.perf_counter()
+            try:
+                return decode(**kw)
+            finally:
+                record["parse"] += time.perf_counter() - record["parse_start"]
+
+        resp.json = timed_json
+        return resp
+
+
+def new_session(token, pool_maxsize=None):
+    """Return a PortainerSession authenticated with ``token``."""
+    session = PortainerSession()
+    session.headers["X-API-Key"] = token
+    adapter = _Adapter(pool_connections=1, pool_maxsize=pool_maxsize or pool_size(), max_retries=retry_policy())
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session